@@ -0,0 +1,119 @@
+"""
+Times the cold imports of the package on fresh interpreters (python -X importtime), and checks them against their
+budgets and the modules they must not load (e.g., plotly in the data core).
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --budget-scale 2 --output ./tmp/bench/import.json
+
+The exit status is 1 if an import is over its budget or loads a forbidden module.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, NamedTuple, Tuple
+
+
+class ImportBudget(NamedTuple):
+    module: str
+    # The median seconds allowed
+    budget: float
+    # The top-level packages the import must not load
+    forbidden: Tuple[str, ...]
+
+
+BUDGETS = (
+    ImportBudget('twfrpumper', 0.05, ('pandas', 'bs4', 'plotly', 'requests')),
+    ImportBudget('twfrpumper.reports.financial_reports.financial_report_agent', 0.35, ('pandas', 'bs4', 'plotly')),
+    ImportBudget('twfrpumper.reports.monthly_revenue.monthly_revenue_agent', 0.35, ('pandas', 'bs4', 'plotly')),
+    ImportBudget('twfrpumper.reports.financial_reports.fr_pool', 1.0, ('bs4', 'plotly')),
+    ImportBudget('twfrpumper.reports.monthly_revenue.mr_pool', 1.0, ('bs4', 'plotly')),
+    ImportBudget('twfrpumper.reports.three_investors.ti_pool', 1.0, ('bs4', 'plotly')),
+)
+PROJECT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _import_times(statement: str) -> Dict[str, Tuple[int, int]]:
+    # {module: (cumulative us, nesting level)} of the imports in the order python reported them
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [PROJECT_FOLDER, os.environ.get('PYTHONPATH')])))
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', statement], env=env,
+                               capture_output=True, text=True, check=True)
+    times = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        level = (len(name) - len(name.lstrip())) // 2
+        times[name.strip()] = (int(cumulative), level)
+    return times
+
+
+def measure(module: str, repeat: int, startup_modules: set) -> Tuple[List[float], Dict[str, Tuple[int, int]]]:
+    seconds = []
+    times = {}
+    for _ in range(repeat):
+        times = {name: value for name, value in _import_times(f'import {module}').items()
+                 if name not in startup_modules}
+        # The imports made by the statement itself, without the interpreter startup
+        seconds.append(sum(cumulative for cumulative, level in times.values() if level == 0) / 1e6)
+    return seconds, times
+
+
+def heaviest(times: Dict[str, Tuple[int, int]], count: int) -> List[Tuple[str, float]]:
+    # The top-level packages which cost the most
+    packages: Dict[str, int] = {}
+    for name, (cumulative, _) in times.items():
+        package = name.split('.')[0]
+        if name == package:
+            packages[package] = max(packages.get(package, 0), cumulative)
+    return [(package, cumulative / 1e6) for package, cumulative in
+            sorted(packages.items(), key=lambda item: -item[1])[:count]]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    arg_parser.add_argument('--budget-scale', type=float, default=1.0,
+                            help='multiplies every budget, for slower machines')
+    arg_parser.add_argument('--only', nargs='*', help='the modules to import, all of BUDGETS by default')
+    arg_parser.add_argument('--output', help='the json file of the results')
+    args = arg_parser.parse_args()
+
+    startup_modules = set(_import_times('pass'))
+    budgets = [budget for budget in BUDGETS if not args.only or budget.module in args.only]
+    results = []
+    failures = []
+    for budget in budgets:
+        seconds, times = measure(budget.module, args.repeat, startup_modules)
+        median = statistics.median(seconds)
+        loaded = sorted({name.split('.')[0] for name in times} & set(budget.forbidden))
+        limit = budget.budget * args.budget_scale
+        status = 'ok'
+        if median > limit:
+            status = 'over budget'
+        if loaded:
+            status = f'loads {", ".join(loaded)}'
+        if status != 'ok':
+            failures.append(budget.module)
+        top = heaviest(times, 3)
+        print(f'{budget.module:<64} {median * 1000:>8.1f}ms / {limit * 1000:>6.0f}ms  {status}')
+        print(f'{"":<64} ' + ', '.join(f'{package} {cost * 1000:.0f}ms' for package, cost in top))
+        results.append({'module': budget.module, 'median': median, 'min': min(seconds), 'budget': limit,
+                        'forbidden_loaded': loaded, 'heaviest': top})
+
+    if args.output:
+        folder = os.path.dirname(args.output)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'results': results}, f, indent=2)
+
+    if failures:
+        print(f'Failed: {", ".join(failures)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
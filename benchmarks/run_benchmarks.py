@@ -0,0 +1,437 @@
+"""
+Offline benchmarks of the parsing, organizing, metric and fetching stages on synthetic data, with a local stand-in
+for MOPS. Every benchmark reports its best time of --repeat runs and its peak traced memory (a separate run, since
+tracemalloc slows everything down). The results are saved as json, and a saved result can be compared with:
+
+    python benchmarks/run_benchmarks.py --companies 10 --seasons 4 --output ./tmp/bench/base.json
+    python benchmarks/run_benchmarks.py --companies 10 --seasons 4 --compare ./tmp/bench/base.json
+
+The parsing benchmarks can also run on the pages an agent cached: --pages ./tmp/. The benchmarks keep their own
+caches in temporary folders, nothing is written to the current directory.
+"""
+import argparse
+import gc
+import glob
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from io import StringIO
+from os import makedirs, path
+from typing import Callable, Dict, List, NamedTuple
+
+import pandas as pd
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+from benchmarks.synthetic import company_codes, ixbrl_report, monthly_revenue_csv
+from benchmarks.stand_in_server import StandInServer
+from twfrpumper.reports.financial_reports.balance_sheet import BalanceSheet
+from twfrpumper.reports.financial_reports.df_builder import LongFrameBuilder, PartitionedFrame, upsert_rows
+from twfrpumper.reports.financial_reports.comprehensive_income_sheet import ComprehensiveIncomeSheet
+from twfrpumper.reports.financial_reports.statements_of_cash_flows import StatementsOfCashFlows
+from twfrpumper.reports.financial_reports.financial_report_agent import FinancialReportAgent
+from twfrpumper.reports.financial_reports.fr_pool import FRPool
+from twfrpumper.reports.financial_reports.ixbrl_parser import parse_report, parse_sheets
+from twfrpumper.reports.financial_reports.metrics import REPORT_ITEMS, build_item_frame, cal_metrics, required_items
+from twfrpumper.reports.monthly_revenue.monthly_revenue_agent import MarketType, MonthlyRevenueAgent
+from twfrpumper.reports.monthly_revenue.monthly_revenue_agent import MonthlyRevenueReport
+from twfrpumper.reports.monthly_revenue.mr_pool import MRPool
+from twfrpumper.toolbox.cache_store import CacheStore, FileCacheStore, SQLiteCacheStore
+from twfrpumper.toolbox.date_tool import DateTool
+from twfrpumper.toolbox.http_transport import HttpTransport
+
+RESULT_VERSION = 1
+
+
+class Benchmark(NamedTuple):
+    name: str
+    # Builds the input, not measured
+    setup: Callable[[argparse.Namespace], object]
+    # Runs on the input and returns the number of items processed (reports, rows...)
+    run: Callable[[object], int]
+
+
+def _seasons(args) -> List[tuple]:
+    # The last args.seasons seasons up to 2022 Q4
+    seasons = list(DateTool.season_range(2000, 1, 2022, 4))
+    return seasons[-args.seasons:]
+
+
+def _months(args) -> List[tuple]:
+    months = list(DateTool.month_range(2000, 1, 2022, 12))
+    return months[-args.months:]
+
+
+def _report_contents(args) -> List[str]:
+    if args.pages:
+        # The pages an agent cached, instead of the synthetic ones
+        file_names = sorted(glob.glob(path.join(args.pages, '*.html')))[:args.parse_reports]
+        if not file_names:
+            raise SystemExit(f'No cached report in {args.pages}')
+        contents = []
+        for file_name in file_names:
+            with open(file_name, 'r', encoding='big5') as f:
+                contents.append(f.read())
+        return contents
+    units = [(code, year, season) for code in company_codes(args.companies) for year, season in _seasons(args)]
+    return [ixbrl_report(code, year, season) for code, year, season in units[:args.parse_reports]]
+
+
+def _parse_by_soup(contents: List[str]) -> int:
+    for content in contents:
+        soup = BeautifulSoup(content, 'html.parser')
+        balance_table = soup.find('table')
+        ci_table = balance_table.find_next_sibling('table')
+        BalanceSheet(balance_table).dict_format
+        ComprehensiveIncomeSheet(ci_table).dict_format
+        StatementsOfCashFlows(ci_table.find_next_sibling('table')).dict_format
+    return len(contents)
+
+
+def _parse_by_ixbrl(contents: List[str]) -> int:
+    for content in contents:
+        parse_sheets(content)
+    return len(contents)
+
+
+def _parse_items_by_ixbrl(contents: List[str]) -> int:
+    items = required_items(REPORT_ITEMS)
+    for content in contents:
+        parse_sheets(content, items)
+    return len(contents)
+
+
+def _parse_reports(contents: List[str]) -> int:
+    # The sheets with the company name and the units, what the agent does with a page
+    for content in contents:
+        parse_report(content)
+    return len(contents)
+
+
+def _setup_soups(args) -> List[BeautifulSoup]:
+    return [BeautifulSoup(content, 'html.parser') for content in _report_contents(args)]
+
+
+def _parse_sheet_units(soups: List[BeautifulSoup]) -> int:
+    for soup in soups:
+        for sheet in (BalanceSheet(None), ComprehensiveIncomeSheet(None), StatementsOfCashFlows(None)):
+            FinancialReportAgent.parse_sheet_unit(sheet, soup)
+    return len(soups)
+
+
+class _ReportsState(NamedTuple):
+    # The caches of the agent stay in the temporary folder while the benchmark holds the state.
+    folder: tempfile.TemporaryDirectory
+    agent: FinancialReportAgent
+    reports: list
+
+
+def _setup_reports(args) -> _ReportsState:
+    # The reports as the agent builds them from its cache, the raw pages only (no parsed cache).
+    folder = tempfile.TemporaryDirectory(prefix='twfr-bench-')
+    agent = FinancialReportAgent(file_folder=folder.name, parsed_cache=False, negative_cache=False)
+    reports = []
+    for code in company_codes(args.companies):
+        for year, season in _seasons(args):
+            agent.cache_store.put(agent.report_key(code, year, season, 'C'),
+                                  ixbrl_report(code, year, season).encode('big5'))
+            reports.append(agent.get_report(code, year, season, 'C'))
+    return _ReportsState(folder, agent, reports)
+
+
+def _organize_fr(state: _ReportsState) -> int:
+    pool = FRPool(agent=state.agent)
+    for report in state.reports:
+        pool.add_report(report)
+    pool.organize_reports()
+    return len(pool.report_df)
+
+
+def _setup_organized_report(args) -> dict:
+    state = _setup_reports(args)
+    pool = FRPool(agent=state.agent)
+    for report in state.reports:
+        pool.add_report(report)
+    pool.organize_reports()
+    state.folder.cleanup()
+    return pool.organized_report
+
+
+def _cal_metrics(organized_report: dict) -> int:
+    return len(cal_metrics(build_item_frame(organized_report)))
+
+
+class _MRReportsState(NamedTuple):
+    folder: tempfile.TemporaryDirectory
+    agent: MonthlyRevenueAgent
+    reports: List[MonthlyRevenueReport]
+
+
+def _setup_mr_reports(args) -> _MRReportsState:
+    folder = tempfile.TemporaryDirectory(prefix='twfr-bench-')
+    return _MRReportsState(folder, MonthlyRevenueAgent(file_folder=folder.name), [
+        MonthlyRevenueReport(year, month, pd.read_csv(StringIO(monthly_revenue_csv(
+            year, month, args.mr_companies, seed=market.value))), market)
+        for year, month in _months(args) for market in MarketType])
+
+
+def _organize_mr(state: _MRReportsState) -> int:
+    pool = MRPool(0, 0, agent=state.agent)
+    for report in state.reports:
+        pool.add_report(report)
+    pool.organize_reports()
+    return len(pool.report_df)
+
+
+class _UpsertState(NamedTuple):
+    report_df: pd.DataFrame
+    frames: PartitionedFrame
+    # The rows of a new season of every company, the units and the items they replace
+    new_df: pd.DataFrame
+    units: set
+    items: set
+
+
+def _long_frame(codes: List[str], seasons: List[str], items: List[str]) -> pd.DataFrame:
+    builder = LongFrameBuilder()
+    for code in codes:
+        for y_and_s in seasons:
+            for item in items:
+                builder.append(code, f'{code}-name', y_and_s, item, f'zh {item}', f'en {item}', 1.0)
+    return builder.to_frame()
+
+
+def _setup_upsert(args) -> _UpsertState:
+    # report_df of --upsert-companies companies over --upsert-seasons seasons, with the rows a report has
+    codes = company_codes(args.upsert_companies)
+    seasons = [f'{year}{season}' for year, season in DateTool.season_range(2000, 1, 2023, 1)][-args.upsert_seasons - 1:]
+    items = [f'{idx:04d}' for idx in range(300)]
+    report_df = _long_frame(codes, seasons[:-1], items)
+    frames = PartitionedFrame()
+    frames.replace(report_df)
+    # Split into the seasons here, not in the measured runs
+    frames.upsert(report_df.iloc[:0])
+    return _UpsertState(report_df, frames, _long_frame(codes, seasons[-1:], items),
+                        {(code, seasons[-1]) for code in codes}, set(items))
+
+
+def _upsert_whole_frame(state: _UpsertState) -> int:
+    return len(upsert_rows(state.report_df, state.new_df, state.units, state.items))
+
+
+def _upsert_partitioned(state: _UpsertState) -> int:
+    state.frames.upsert(state.new_df, state.units, state.items)
+    return len(state.new_df)
+
+
+def _upsert_partitioned_and_read(state: _UpsertState) -> int:
+    state.frames.upsert(state.new_df, state.units, state.items)
+    return len(state.frames.frame)
+
+
+class _StoreState(NamedTuple):
+    folder: tempfile.TemporaryDirectory
+    store: CacheStore
+    pages: Dict[str, bytes]
+
+
+def _setup_cache_store(store_type: str) -> Callable[[argparse.Namespace], _StoreState]:
+    # A store of the report pages, kept in a temporary folder while the benchmark holds the state
+    def setup(args) -> _StoreState:
+        folder = tempfile.TemporaryDirectory(prefix='twfr-bench-')
+        store = (FileCacheStore(path.join(folder.name, 'files')) if store_type == 'file'
+                 else SQLiteCacheStore(path.join(folder.name, 'cache.db')))
+        pages = {f'{idx}.html': content.encode('big5') for idx, content in enumerate(_report_contents(args))}
+        _put_pages(_StoreState(folder, store, pages))
+        return _StoreState(folder, store, pages)
+    return setup
+
+
+def _put_pages(state: _StoreState) -> int:
+    for key, page in state.pages.items():
+        state.store.put(key, page)
+    state.store.flush()
+    return len(state.pages)
+
+
+def _get_pages(state: _StoreState) -> int:
+    for key in state.pages:
+        state.store.get(key)
+    return len(state.pages)
+
+
+def _check_pages(state: _StoreState) -> int:
+    for key in state.pages:
+        state.store.exists(key)
+    return len(state.pages)
+
+
+def _fetch_fr(args) -> int:
+    # Cold caches, every report goes through the stand-in server.
+    with StandInServer(companies=args.companies, latency=args.latency) as server, \
+            tempfile.TemporaryDirectory(prefix='twfr-bench-') as folder:
+        agent = FinancialReportAgent(file_folder=folder, negative_cache=False,
+                                     base_url=server.url, max_workers=args.workers,
+                                     transport=HttpTransport(max_rps=0, pool_size=args.workers))
+        pool = FRPool(agent=agent)
+        (first_year, first_season), (last_year, last_season) = _seasons(args)[0], _seasons(args)[-1]
+        added = pool.add_reports(company_codes(args.companies), 'C', first_year, first_season, last_year, last_season)
+        pool.organize_reports()
+        return len(added)
+
+
+def _fetch_mr(args) -> int:
+    with StandInServer(companies=args.mr_companies, latency=args.latency) as server, \
+            tempfile.TemporaryDirectory(prefix='twfr-bench-') as folder:
+        agent = MonthlyRevenueAgent(file_folder=folder, base_url=server.url,
+                                    max_workers=args.workers, transport=HttpTransport(max_rps=0, pool_size=args.workers))
+        pool = MRPool(0, 0, agent=agent)
+        (first_year, first_month), (last_year, last_month) = _months(args)[0], _months(args)[-1]
+        added = pool.add_range_reports(first_year, first_month, last_year, last_month, list(MarketType))
+        pool.organize_reports()
+        return len(added)
+
+
+BENCHMARKS = [
+    Benchmark('fr_parse_soup_dict_format', _report_contents, _parse_by_soup),
+    Benchmark('fr_parse_ixbrl', _report_contents, _parse_by_ixbrl),
+    Benchmark('fr_parse_ixbrl_items', _report_contents, _parse_items_by_ixbrl),
+    Benchmark('fr_parse_report', _report_contents, _parse_reports),
+    Benchmark('fr_parse_sheet_unit', _setup_soups, _parse_sheet_units),
+    Benchmark('fr_organize_reports', _setup_reports, _organize_fr),
+    Benchmark('fr_metrics', _setup_organized_report, _cal_metrics),
+    Benchmark('mr_organize_reports', _setup_mr_reports, _organize_mr),
+    Benchmark('fr_upsert_whole_frame', _setup_upsert, _upsert_whole_frame),
+    Benchmark('fr_upsert_partitioned', _setup_upsert, _upsert_partitioned),
+    Benchmark('fr_upsert_partitioned_read', _setup_upsert, _upsert_partitioned_and_read),
+    Benchmark('cache_store_put_file', _setup_cache_store('file'), _put_pages),
+    Benchmark('cache_store_put_sqlite', _setup_cache_store('sqlite'), _put_pages),
+    Benchmark('cache_store_get_file', _setup_cache_store('file'), _get_pages),
+    Benchmark('cache_store_get_sqlite', _setup_cache_store('sqlite'), _get_pages),
+    Benchmark('cache_store_exists_file', _setup_cache_store('file'), _check_pages),
+    Benchmark('cache_store_exists_sqlite', _setup_cache_store('sqlite'), _check_pages),
+    # The fetches set up inside the run, the state is the arguments.
+    Benchmark('fr_fetch_end_to_end', lambda args: args, _fetch_fr),
+    Benchmark('mr_fetch_end_to_end', lambda args: args, _fetch_mr),
+]
+
+
+def measure(benchmark: Benchmark, args) -> dict:
+    state = benchmark.setup(args)
+    seconds = []
+    items = 0
+    for _ in range(args.repeat):
+        gc.collect()
+        start = time.perf_counter()
+        items = benchmark.run(state)
+        seconds.append(time.perf_counter() - start)
+
+    gc.collect()
+    tracemalloc.start()
+    benchmark.run(state)
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    best = min(seconds)
+    return {
+        'seconds': best,
+        'mean_seconds': sum(seconds) / len(seconds),
+        'items': items,
+        'ms_per_item': best / items * 1000 if items else None,
+        'peak_bytes': peak_bytes,
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=path.dirname(path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ''
+
+
+def compare(base: dict, new: dict, threshold: float) -> List[str]:
+    # Prints the ratios of the common benchmarks and returns the names slower (or bigger) than threshold.
+    regressions = []
+    if base.get('scale') != new.get('scale'):
+        print(f'Warning: different scales, {base.get("scale")} vs {new.get("scale")}')
+    print(f'{"benchmark":<28}{"base s":>10}{"new s":>10}{"time":>8}{"base MB":>10}{"new MB":>10}{"memory":>8}')
+    for name, new_result in new['results'].items():
+        base_result = base['results'].get(name)
+        if base_result is None:
+            continue
+        time_ratio = new_result['seconds'] / base_result['seconds'] if base_result['seconds'] else float('inf')
+        memory_ratio = (new_result['peak_bytes'] / base_result['peak_bytes']
+                        if base_result['peak_bytes'] else float('inf'))
+        flag = ' <-' if time_ratio > threshold or memory_ratio > threshold else ''
+        if flag:
+            regressions.append(name)
+        print(f'{name:<28}{base_result["seconds"]:>10.3f}{new_result["seconds"]:>10.3f}{time_ratio:>7.2f}x'
+              f'{base_result["peak_bytes"] / 2 ** 20:>10.1f}{new_result["peak_bytes"] / 2 ** 20:>10.1f}'
+              f'{memory_ratio:>7.2f}x{flag}')
+    return regressions
+
+
+def main():
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--companies', type=int, default=10, help='companies of the financial reports')
+    arg_parser.add_argument('--seasons', type=int, default=4)
+    arg_parser.add_argument('--parse-reports', type=int, default=50, help='reports for the parsing benchmarks')
+    arg_parser.add_argument('--pages', help='a folder of cached report pages (e.g., ./tmp/) to parse instead of the '
+                                            'synthetic ones')
+    arg_parser.add_argument('--mr-companies', type=int, default=900, help='companies of each monthly revenue csv')
+    arg_parser.add_argument('--months', type=int, default=24)
+    arg_parser.add_argument('--upsert-companies', type=int, default=200, help='companies of the upsert benchmarks')
+    arg_parser.add_argument('--upsert-seasons', type=int, default=20)
+    arg_parser.add_argument('--workers', type=int, default=4)
+    arg_parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every stand-in response')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    arg_parser.add_argument('--only', nargs='+', help='names of the benchmarks to run')
+    arg_parser.add_argument('--output', help='the json file to save the results to')
+    arg_parser.add_argument('--compare', help='a saved json file to compare the results with')
+    arg_parser.add_argument('--threshold', type=float, default=1.2, help='the ratio over which is a regression')
+    args = arg_parser.parse_args()
+
+    benchmarks = [benchmark for benchmark in BENCHMARKS if not args.only or benchmark.name in args.only]
+    results: Dict[str, dict] = {}
+    for benchmark in benchmarks:
+        results[benchmark.name] = measure(benchmark, args)
+        result = results[benchmark.name]
+        print(f'{benchmark.name:<28}{result["seconds"]:>9.3f}s  {result["items"]:>7} items  '
+              f'{result["peak_bytes"] / 2 ** 20:>8.1f} MB peak')
+
+    report = {
+        'version': RESULT_VERSION,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scale': {'companies': args.companies, 'seasons': args.seasons, 'parse_reports': args.parse_reports,
+                  'mr_companies': args.mr_companies, 'months': args.months, 'workers': args.workers,
+                  'upsert_companies': args.upsert_companies, 'upsert_seasons': args.upsert_seasons,
+                  'latency': args.latency, 'pages': args.pages},
+        'results': results,
+    }
+    if args.output:
+        if path.dirname(args.output):
+            makedirs(path.dirname(args.output), exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            base = json.load(f)
+        regressions = compare(base, report, args.threshold)
+        if regressions:
+            print(f'Regressions: {", ".join(regressions)}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
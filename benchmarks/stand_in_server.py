@@ -0,0 +1,140 @@
+"""
+A local HTTP server standing in for the MOPS endpoints the agents call, serving the synthetic data:
+
+    GET  /server-java/t164sb01?step=1&CO_ID=&SYEAR=&SSEASON=&REPORT_ID=    the iXBRL report page (big5)
+    POST /server-java/FileDownLoad  fileName=t21sc03_<tw year>_<month>.csv  the monthly revenue csv (utf-8)
+
+    with StandInServer(companies=50) as server:
+        agent = FinancialReportAgent(base_url=server.url, max_rps=0)
+
+The next responses of an endpoint can be made to fail, for the tests of the retries:
+
+    server.inject('t164sb01', '503', 'stall', 'truncate')
+"""
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Deque, Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+try:
+    from benchmarks.synthetic import ixbrl_report, monthly_revenue_csv
+except ImportError:
+    from synthetic import ixbrl_report, monthly_revenue_csv
+
+
+THROTTLE_PAGE = '<html><body>FOR SECURITY REASONS, THIS PAGE CAN NOT BE ACCESSED!</body></html>'
+NO_DATA_PAGE = '<html><body><h4>查無資料</h4></body></html>'
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: 'StandInServer'
+
+    def log_message(self, format, *args):
+        pass
+
+    def __send(self, status: int, body: bytes, content_type: str, endpoint: Optional[str] = None):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        fault = self.server.next_fault(endpoint) if endpoint else None
+        if fault == 'stall':
+            # Longer than the read timeout of the client, then the response as usual
+            time.sleep(self.server.stall)
+        elif fault == 'throttle':
+            body = THROTTLE_PAGE.encode('utf-8')
+        elif fault == 'no_data':
+            body = NO_DATA_PAGE.encode('big5')
+        elif fault and fault.isdigit():
+            status, body, content_type = int(fault), b'fault', 'text/plain'
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if fault == 'truncate':
+            # Half of the body, then the connection is closed
+            self.wfile.write(body[:len(body) // 2])
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != '/server-java/t164sb01':
+            return self.__send(404, b'not found', 'text/plain')
+        query = parse_qs(url.query)
+        self.server.hits['t164sb01'] += 1
+        body = ixbrl_report(query['CO_ID'][0], int(query['SYEAR'][0]), int(query['SSEASON'][0]),
+                            note_tables=self.server.note_tables)
+        self.__send(200, body.encode('big5'), 'text/html; charset=big5', 't164sb01')
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/server-java/FileDownLoad':
+            return self.__send(404, b'not found', 'text/plain')
+        form = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+        self.server.hits['t21sc03'] += 1
+        _, tw_year, month = form['fileName'][0][:-len('.csv')].split('_')
+        seed = 1 if 'otc' in form['filePath'][0] else 0
+        body = monthly_revenue_csv(int(tw_year) + 1911, int(month), self.server.companies, seed=seed)
+        self.__send(200, body.encode('utf-8'), 'text/csv; charset=utf-8', 't21sc03')
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, companies: int = 50, latency: float = 0.0, note_tables: int = 20, port: int = 0,
+                 stall: float = 1.0):
+        # latency: seconds added to every response, to look like the network. stall: seconds of a 'stall' fault
+        super().__init__(('127.0.0.1', port), _Handler)
+        self.companies = companies
+        self.latency = latency
+        self.note_tables = note_tables
+        self.stall = stall
+        self.hits = Counter()
+        self.__faults: Dict[str, Deque[str]] = defaultdict(deque)
+        self.__faults_lock = threading.Lock()
+        self.__thread: Optional[threading.Thread] = None
+
+    def inject(self, endpoint: str, *faults: str):
+        """
+        The faults of the next responses of the endpoint ('t164sb01' or 't21sc03'), one per response:
+        a status code (e.g., '503', '429'), 'stall', 'truncate' (half the body under the full Content-Length) or
+        'throttle' (the page MOPS returns when it's queried too often) or 'no_data' (the page of a missing report).
+        """
+        with self.__faults_lock:
+            self.__faults[endpoint].extend(faults)
+
+    def next_fault(self, endpoint: str) -> Optional[str]:
+        with self.__faults_lock:
+            faults = self.__faults[endpoint]
+            return faults.popleft() if faults else None
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def start(self) -> 'StandInServer':
+        self.__thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+if __name__ == '__main__':
+    with StandInServer() as stand_in_server:
+        print(f'Serving on {stand_in_server.url}, Ctrl+C to stop')
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
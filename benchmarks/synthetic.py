@@ -0,0 +1,126 @@
+"""
+Synthetic MOPS data for the benchmarks: iXBRL report pages (t164sb01) and monthly revenue csv files (t21sc03), with
+the structure the parsers read and sizes close to the real ones. The same arguments always give the same content.
+"""
+import random
+from typing import List, Tuple
+
+# (code, zh, en) of the items the metrics and the EPS read, the other rows are fillers.
+BALANCE_SHEET_ROWS = [
+    ('1100', '現金及約當現金', 'Total cash and cash equivalents'),
+    ('130X', '存貨', 'Total inventories'),
+    ('1XXX', '資產總額', 'Total assets'),
+    ('2XXX', '負債總額', 'Total liabilities'),
+    ('3100', '股本合計', 'Total capital stock'),
+    ('3110', '普通股股本', 'Ordinary share'),
+    ('3XXX', '權益總額', 'Total equity'),
+]
+CI_SHEET_ROWS = [
+    ('4000', '營業收入合計', 'Total operating revenue'),
+    ('5000', '營業成本合計', 'Total operating costs'),
+    ('5900', '營業毛利（毛損）', 'Gross profit (loss) from operations'),
+    ('6900', '營業利益（損失）', 'Net operating income (loss)'),
+    ('8200', '本期淨利（淨損）', 'Profit (loss)'),
+    ('9750', '基本每股盈餘合計', 'Total basic earnings per share'),
+    ('9850', '稀釋每股盈餘合計', 'Total diluted earnings per share'),
+]
+PER_SHARE_CODES = ('9750', '9850')
+CASH_FLOWS_ROWS = [
+    ('A00010', '繼續營業單位稅前淨利（淨損）', 'Profit (loss) from continuing operations before tax'),
+    ('AAAA', '營業活動之淨現金流入（流出）', 'Net cash flows from (used in) operating activities'),
+    ('B02700', '取得不動產、廠房及設備', 'Acquisition of property, plant and equipment'),
+]
+# The usual number of rows and value columns of each sheet, and the codes of the filler rows
+SHEET_LAYOUTS = (
+    ('BalanceSheet', BALANCE_SHEET_ROWS, 110, 3, '1{:03d}'),
+    ('StatementOfComprehensiveIncome', CI_SHEET_ROWS, 70, 4, '7{:03d}'),
+    ('StatementsOfCashFlows', CASH_FLOWS_ROWS, 120, 2, 'A{:03d}00'),
+)
+INDUSTRIES = ['水泥工業', '食品工業', '塑膠工業', '紡織纖維', '電機機械', '半導體業', '電子零組件業', '航運業']
+MONTHLY_REVENUE_HEADER = ('出表日期,資料年月,公司代號,公司名稱,產業別,營業收入-當月營收,營業收入-上月營收,營業收入-去年當月營收,'
+                          '營業收入-上月比較增減(%),營業收入-去年同月增減(%),累計營業收入-當月累計營收,累計營業收入-去年累計營收,'
+                          '累計營業收入-前期比較增減(%),備註')
+
+
+def company_codes(companies: int, first_code: int = 1101) -> List[str]:
+    return [str(code) for code in range(first_code, first_code + companies)]
+
+
+def _filler_rows(code_format: str, count: int) -> List[Tuple[str, str, str]]:
+    # Numbered from 200, away from the codes of the key rows
+    return [(code_format.format(idx + 200), f'項目{idx}', f'Item {idx}') for idx in range(count)]
+
+
+def _value_cell(value: int) -> str:
+    sign = ' sign="-"' if value < 0 else ''
+    return (f'<td style="text-align:right"><ix:nonFraction name="tifrs:Item" contextRef="c" unitRef="TWD" '
+            f'decimals="-3" scale="3" format="ixt:numdotdecimal"{sign}>{abs(value):,}</ix:nonFraction></td>')
+
+
+def _per_share_cell(value: int) -> str:
+    # The EPS rows are in NT$ per share, whatever the unit of the sheet
+    sign = ' sign="-"' if value < 0 else ''
+    return (f'<td style="text-align:right"><ix:nonFraction name="tifrs:Item" contextRef="c" unitRef="TWD_per_share" '
+            f'decimals="2" scale="0" format="ixt:numdotdecimal"{sign}>{abs(value) / 100:.2f}</ix:nonFraction></td>')
+
+
+def _sheet_table(rows, columns: int, rnd: random.Random) -> str:
+    lines = ['<table class="main_table hidden-sm hidden-xs reportTable">',
+             '<tr class="tblHead"><th>代號 Code</th><th>會計項目 Accounting Title</th>'
+             + ''.join(f'<th>Period {idx}</th>' for idx in range(columns)) + '</tr>']
+    for code, zh, en in rows:
+        if code in PER_SHARE_CODES:
+            values = ''.join(_per_share_cell(rnd.randint(-500, 3000)) for _ in range(columns))
+        else:
+            values = ''.join(_value_cell(rnd.randint(-10 ** 7, 10 ** 8)) for _ in range(columns))
+        lines.append(f'<tr><td style="text-align:center">  {code}</td><td style="text-align:left">'
+                     f'<span class="zh">　{zh}</span><span class="en">{en} </span></td>{values}</tr>')
+    # The section titles have no code
+    lines.append('<tr><td style="text-align:center">-</td><td><span class="zh">附註</span>'
+                 '<span class="en">Notes</span></td></tr>')
+    lines.append('</table>')
+    return '\n'.join(lines)
+
+
+def ixbrl_report(code: str, year: int, season: int, name: str = None, note_tables: int = 20) -> str:
+    """
+    A t164sb01 page: the company name in the second ix:nonNumeric, then the unit and the table of each sheet, then
+    note_tables tables of notes which the parsers skip.
+    """
+    rnd = random.Random(f'{code}-{year}-{season}')
+    name = name if name else f'公司{code}'
+    parts = ['<html><head><meta charset="big5"><title>t164sb01</title></head><body><div id=""></div>',
+             f'<div class="header"><ix:nonNumeric name="tifrs-bsci-ci:CompanyId">{code}</ix:nonNumeric>'
+             f'<ix:nonNumeric name="tifrs-bsci-ci:CompanyName">{name}</ix:nonNumeric></div>']
+    for sheet_id, key_rows, row_count, columns, code_format in SHEET_LAYOUTS:
+        rows = key_rows + _filler_rows(code_format, row_count - len(key_rows))
+        parts.append(f'<div class="content" id="{sheet_id}"><div class="rptidx"><span class="zh">單位：新台幣仟元</span>'
+                     f'<span class="en">Unit: NT$ thousands</span></div></div>')
+        parts.append(_sheet_table(rows, columns, rnd))
+    for idx in range(note_tables):
+        parts.append('<table class="note">' + ''.join(
+            f'<tr><td>附註 {idx}-{row}</td><td>{rnd.randint(0, 10 ** 6):,}</td></tr>' for row in range(15))
+            + '</table>')
+    parts.append('</body></html>')
+    return '\n'.join(parts)
+
+
+def monthly_revenue_csv(year: int, month: int, companies: int, seed: int = 0, report_day: int = 10) -> str:
+    """
+    A t21sc03 csv of a market, with the BOM and the quoted cells of the real files. The report date is on
+    report_day of the next month.
+    """
+    rnd = random.Random(f'{seed}-{year}-{month}')
+    tw_year = year - 1911
+    next_year, next_month = (year, month + 1) if month < 12 else (year + 1, 1)
+    lines = ['\ufeff' + MONTHLY_REVENUE_HEADER]
+    for idx, code in enumerate(company_codes(companies)):
+        revenue = rnd.randint(1000, 10 ** 7)
+        prev_month = rnd.randint(1000, 10 ** 7)
+        prev_year = rnd.randint(1000, 10 ** 7)
+        cells = [f'{next_year - 1911}/{next_month:02d}/{report_day:02d}', f'{tw_year}/{month}', code, f'公司{code}',
+                 INDUSTRIES[idx % len(INDUSTRIES)], revenue, prev_month, prev_year,
+                 f'{(revenue - prev_month) / prev_month * 100:.2f}', f'{(revenue - prev_year) / prev_year * 100:.2f}',
+                 revenue * month, prev_year * month, f'{(revenue - prev_year) / prev_year * 100:.2f}', '-']
+        lines.append(','.join(f'"{cell}"' for cell in cells))
+    return '\r\n'.join(lines) + '\r\n'
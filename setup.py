@@ -11,6 +11,7 @@ setup(
     ],
     extras_require={
         'jupyter': ['jupyter'],
+        'parquet': ['pyarrow'],
     },
     packages=find_packages(
         # All keyword arguments below are optional:
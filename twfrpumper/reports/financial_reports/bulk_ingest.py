@@ -0,0 +1,184 @@
+from dataclasses import dataclass, field
+from enum import Enum
+from os import makedirs, path
+from typing import Callable, Dict, List, Optional, Tuple
+import argparse
+import json
+import logging
+import threading
+import time
+
+from twfrpumper.reports.financial_reports.financial_report_agent import FinancialReportAgent
+from twfrpumper.reports.monthly_revenue.monthly_revenue_agent import MonthlyRevenueReport
+from twfrpumper.toolbox.date_tool import DateTool
+
+Unit = Tuple[str, int, int, str]
+
+
+class IngestStatus(Enum):
+    DONE = 'done'
+    # The report doesn't exist, e.g., the company wasn't listed yet.
+    MISSING = 'missing'
+    FAILED = 'failed'
+
+
+@dataclass
+class IngestJobSpec:
+    codes: List[str]
+    report_type: str
+    start_y: int
+    start_s: int
+    end_y: int
+    end_s: int
+
+    @classmethod
+    def from_monthly_revenue_report(cls, mr_report: MonthlyRevenueReport, report_type: str,
+                                    start_y: int, start_s: int, end_y: int, end_s: int):
+        # All the codes seen in a monthly revenue report, e.g., the whole listed market.
+        codes = sorted({str(code) for code in mr_report.report_df['code'].unique()})
+        return cls(codes, report_type, start_y, start_s, end_y, end_s)
+
+    def units(self) -> List[Unit]:
+        seasons = DateTool.season_range(self.start_y, self.start_s, self.end_y, self.end_s)
+        return [(code, year, season, self.report_type) for year, season in seasons for code in self.codes]
+
+
+class IngestJournal(object):
+    """
+    An append-only JSON lines file with the result of every unit. The last line of a unit wins, so a restarted job
+    knows exactly what is left.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.statuses: Dict[Unit, IngestStatus] = {}
+        self.__lock = threading.Lock()
+        folder = path.dirname(file_path)
+        if folder:
+            makedirs(folder, exist_ok=True)
+        self.__load()
+
+    def __load(self):
+        if not path.exists(self.file_path):
+            return
+        with open(self.file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line may be cut by a crash.
+                    continue
+                self.statuses[tuple(entry['unit'])] = IngestStatus(entry['status'])
+
+    def status(self, unit: Unit) -> Optional[IngestStatus]:
+        return self.statuses.get(unit)
+
+    def record(self, unit: Unit, status: IngestStatus, error: Optional[str] = None):
+        entry = {'unit': list(unit), 'status': status.value, 'at': time.time()}
+        if error:
+            entry['error'] = error
+        with self.__lock:
+            with open(self.file_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            self.statuses[unit] = status
+
+
+@dataclass
+class IngestProgress:
+    total: int
+    skipped: int = 0
+    done: int = 0
+    missing: int = 0
+    failed: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def finished(self) -> int:
+        return self.done + self.missing + self.failed
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def throughput(self) -> float:
+        # units per second of this run
+        return self.finished / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def eta(self) -> Optional[float]:
+        left = self.total - self.skipped - self.finished
+        return left / self.throughput if self.throughput else None
+
+    def __str__(self):
+        eta = f'{self.eta:.0f}s' if self.eta is not None else '-'
+        return (f'{self.skipped + self.finished}/{self.total} '
+                f'(done: {self.done}, missing: {self.missing}, failed: {self.failed}, skipped: {self.skipped}), '
+                f'{self.throughput:.2f} units/s, eta: {eta}')
+
+
+class BulkIngestJob(object):
+    def __init__(self, spec: IngestJobSpec, journal_path: str, agent: Optional[FinancialReportAgent] = None,
+                 retry_failed: bool = True, retry_missing: bool = True, progress_every: int = 50,
+                 progress_callback: Optional[Callable[[IngestProgress], None]] = None):
+        # retry_missing: the missing units are asked again on resume, the negative cache of the agent decides which
+        # ones go to MOPS (e.g., a report not published yet at the last run) and which are answered from the cache.
+        self.spec = spec
+        self.journal = IngestJournal(journal_path)
+        self.agent = agent if agent else FinancialReportAgent(lean=True)
+        self.retry_failed = retry_failed
+        self.retry_missing = retry_missing
+        self.progress_every = progress_every
+        self.progress_callback = progress_callback
+
+    def pending_units(self) -> List[Unit]:
+        skipped_statuses = {IngestStatus.DONE}
+        if not self.retry_missing:
+            skipped_statuses.add(IngestStatus.MISSING)
+        if not self.retry_failed:
+            skipped_statuses.add(IngestStatus.FAILED)
+        return [unit for unit in self.spec.units() if self.journal.status(unit) not in skipped_statuses]
+
+    def run(self, pool=None) -> IngestProgress:
+        # The reports are cached by the agent, pass a FRPool to also keep them in memory.
+        units = self.spec.units()
+        pending_units = self.pending_units()
+        progress = IngestProgress(total=len(units), skipped=len(units) - len(pending_units))
+        logging.info(f'Ingest started: {progress}')
+
+        for fetch_result in self.agent.iter_reports(pending_units):
+            if fetch_result.error is not None:
+                self.journal.record(fetch_result.unit, IngestStatus.FAILED, repr(fetch_result.error))
+                progress.failed += 1
+            elif fetch_result.result is None:
+                # Still missing is not written again, the journal doesn't grow on every resume.
+                if self.journal.status(fetch_result.unit) != IngestStatus.MISSING:
+                    self.journal.record(fetch_result.unit, IngestStatus.MISSING)
+                progress.missing += 1
+            else:
+                self.journal.record(fetch_result.unit, IngestStatus.DONE)
+                progress.done += 1
+                if pool is not None:
+                    pool.add_report(fetch_result.result)
+
+            if self.progress_callback:
+                self.progress_callback(progress)
+            if progress.finished % self.progress_every == 0:
+                logging.info(f'Ingest progress: {progress}')
+
+        logging.info(f'Ingest finished: {progress}')
+        return progress
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument('--codes', nargs='+', required=True)
+    arg_parser.add_argument('--report-type', default='C')
+    arg_parser.add_argument('--start', nargs=2, type=int, metavar=('YEAR', 'SEASON'), required=True)
+    arg_parser.add_argument('--end', nargs=2, type=int, metavar=('YEAR', 'SEASON'), required=True)
+    arg_parser.add_argument('--journal', default='./tmp/ingest_journal.jsonl')
+    args = arg_parser.parse_args()
+
+    job = BulkIngestJob(IngestJobSpec(args.codes, args.report_type, *args.start, *args.end), args.journal)
+    job.run()
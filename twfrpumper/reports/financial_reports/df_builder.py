@@ -0,0 +1,129 @@
+from array import array
+from typing import Dict, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from twfrpumper.toolbox.df_tool import concat_keep_categories
+
+# The columns of FRPool.report_df
+COLUMNS = ('code', 'company_name', 'y_and_s', 'item', 'zh', 'en', 'value')
+CATEGORICAL_COLUMNS = ('code', 'company_name', 'item', 'zh', 'en')
+
+
+class LongFrameBuilder(object):
+    """
+    Collects the rows of FRPool.report_df into one buffer per column. The repeated strings become categorical
+    columns and the values a float64 column once the frame is built.
+    """
+
+    def __init__(self):
+        self.__columns = {column: [] for column in COLUMNS if column != 'value'}
+        self.__values = array('d')
+
+    def __len__(self):
+        return len(self.__values)
+
+    def append(self, code: str, company_name: str, y_and_s: str, item: str, zh: str, en: str, value: float):
+        columns = self.__columns
+        columns['code'].append(code)
+        columns['company_name'].append(company_name)
+        columns['y_and_s'].append(y_and_s)
+        columns['item'].append(item)
+        columns['zh'].append(zh)
+        columns['en'].append(en)
+        self.__values.append(value)
+
+    def extend_frame(self, frame: pd.DataFrame):
+        for column, buffer in self.__columns.items():
+            buffer.extend(frame[column].tolist())
+        self.__values.extend(frame['value'].to_numpy(dtype=np.float64))
+
+    def to_frame(self) -> pd.DataFrame:
+        data = {}
+        for column, buffer in self.__columns.items():
+            data[column] = pd.Categorical(buffer) if column in CATEGORICAL_COLUMNS else buffer
+        data['value'] = np.frombuffer(self.__values, dtype=np.float64).copy()
+        return pd.DataFrame(data, columns=list(COLUMNS))
+
+
+def _frame_keys(frame: pd.DataFrame, columns) -> pd.MultiIndex:
+    return pd.MultiIndex.from_arrays([frame[column].astype(str) for column in columns])
+
+
+def upsert_rows(report_df: Optional[pd.DataFrame], new_df: pd.DataFrame, units: Optional[Set[Tuple[str, str]]] = None,
+                items: Optional[Set[str]] = None) -> pd.DataFrame:
+    """
+    Replaces the rows of report_df keyed by (code, y_and_s, item) with new_df. With units and items, every row of
+    those (code, y_and_s) units whose item is in items is replaced, even if new_df doesn't have it anymore.
+    """
+    if report_df is None or report_df.empty:
+        return concat_keep_categories([new_df], CATEGORICAL_COLUMNS)
+
+    # Only the rows of the touched companies are compared.
+    codes = set(new_df['code'].astype(str).unique())
+    if units:
+        codes.update(code for code, _ in units)
+    candidates = np.flatnonzero(report_df['code'].isin(codes).to_numpy())
+    candidate_df = report_df.iloc[candidates]
+
+    stale = _frame_keys(candidate_df, ('code', 'y_and_s', 'item')).isin(
+        _frame_keys(new_df, ('code', 'y_and_s', 'item')))
+    if units:
+        stale |= (_frame_keys(candidate_df, ('code', 'y_and_s')).isin(list(units))
+                  & candidate_df['item'].astype(str).isin(items or set()).to_numpy())
+
+    drop_mask = np.zeros(len(report_df), dtype=bool)
+    drop_mask[candidates[stale]] = True
+    return concat_keep_categories([report_df[~drop_mask], new_df], CATEGORICAL_COLUMNS)
+
+
+class PartitionedFrame(object):
+    """
+    FRPool.report_df kept as one frame per y_and_s. An upsert only rewrites the frames of the seasons it touches,
+    the whole frame is concatenated when it's read and kept until the next change.
+    """
+
+    def __init__(self):
+        self.__parts: Dict[str, pd.DataFrame] = {}
+        # The whole frame, None until it's read after a change
+        self.__frame: Optional[pd.DataFrame] = None
+        # The frame given to replace, split on the first upsert
+        self.__unsplit = False
+
+    @property
+    def frame(self) -> Optional[pd.DataFrame]:
+        if self.__frame is None and self.__parts:
+            self.__frame = concat_keep_categories(list(self.__parts.values()), CATEGORICAL_COLUMNS)
+        return self.__frame
+
+    def replace(self, frame: Optional[pd.DataFrame]):
+        self.__parts = {}
+        self.__frame = frame
+        self.__unsplit = frame is not None and not frame.empty
+
+    def __split(self):
+        frame = self.__frame
+        self.__parts = {str(y_and_s): frame.iloc[positions].reset_index(drop=True)
+                        for y_and_s, positions in frame.groupby('y_and_s', sort=False).indices.items()}
+        self.__unsplit = False
+
+    def upsert(self, new_df: pd.DataFrame, units: Optional[Set[Tuple[str, str]]] = None,
+               items: Optional[Set[str]] = None):
+        # See upsert_rows, the rows are replaced season by season.
+        if self.__unsplit:
+            self.__split()
+        new_parts = new_df.groupby(new_df['y_and_s'].astype(str), sort=False).indices
+        unit_parts: Dict[str, Set[Tuple[str, str]]] = {}
+        for code, y_and_s in units or ():
+            unit_parts.setdefault(y_and_s, set()).add((code, y_and_s))
+
+        for y_and_s in list(new_parts) + [y_and_s for y_and_s in unit_parts if y_and_s not in new_parts]:
+            positions = new_parts.get(y_and_s)
+            new_part = new_df.iloc[positions] if positions is not None else new_df.iloc[:0]
+            part = upsert_rows(self.__parts.get(y_and_s), new_part, unit_parts.get(y_and_s), items)
+            if part.empty:
+                self.__parts.pop(y_and_s, None)
+            else:
+                self.__parts[y_and_s] = part
+        self.__frame = None
@@ -1,16 +1,26 @@
-import requests
 import logging
-from os.path import exists, isdir, join
-from os import makedirs
-import time
-import random
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from os.path import join
+from typing import TYPE_CHECKING, AbstractSet, Dict, Iterable, Iterator, Optional, Tuple
 
-from bs4 import BeautifulSoup
+from twfrpumper.toolbox.fetch_engine import FetchEngine, FetchResult
+from twfrpumper.toolbox.http_transport import HttpTransport
+from twfrpumper.toolbox.cache_store import CacheStore, FileCacheStore
+from twfrpumper.toolbox.stats import NULL_STATS, Stats
 
 from twfrpumper.reports.financial_reports.sheet import Sheet
 from twfrpumper.reports.financial_reports.balance_sheet import BalanceSheet
 from twfrpumper.reports.financial_reports.comprehensive_income_sheet import ComprehensiveIncomeSheet
 from twfrpumper.reports.financial_reports.statements_of_cash_flows import StatementsOfCashFlows
+from twfrpumper.reports.financial_reports.ixbrl_parser import dollar_unit_of, parse_report
+from twfrpumper.reports.financial_reports.parsed_report_cache import ParsedReport, ParsedReportCache
+from twfrpumper.reports.financial_reports.negative_report_cache import MissingReason, NegativeReportCache
+from twfrpumper.reports.financial_reports.slim_report import SlimFinancialReport, SlimSheet
+from twfrpumper.toolbox.memory_tool import deep_getsizeof
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
 
 
 class FinancialReport(object):
@@ -23,7 +33,9 @@ class FinancialReport(object):
                  balance_sheet: BalanceSheet,
                  ci_sheet: ComprehensiveIncomeSheet,
                  cash_flows: StatementsOfCashFlows,
-                 soup: BeautifulSoup):
+                 soup: Optional['BeautifulSoup'] = None,
+                 content: Optional[str] = None,
+                 sheet_spans: Optional[Dict[str, Tuple[int, int]]] = None):
         self.stock_id = stock_id
         self.company_name = company_name
         self.year = year
@@ -32,74 +44,285 @@ class FinancialReport(object):
         self.balance_sheet = balance_sheet
         self.ci_sheet = ci_sheet
         self.cash_flows = cash_flows
-        self.soup = soup
+        self.__soup = soup
+        # The page and where its sheets are, (start, end) by Sheet.ID
+        self.content = content
+        self.sheet_spans = sheet_spans if sheet_spans else {}
+        self.key = (stock_id, year, season, report_type)
+        self.__hash = hash(self.key)
 
     def __hash__(self):
-        return hash(f'{self.stock_id}{self.year}{self.season}{self.report_type}')
+        return self.__hash
 
     def __eq__(self, other):
-        return self.__hash__() == other.__hash__()
+        return self.key == getattr(other, 'key', None)
+
+    @property
+    def soup(self) -> Optional['BeautifulSoup']:
+        # The DOM of the page is only built when it is asked for, the sheets are read without it.
+        if self.__soup is None and self.content is not None:
+            from bs4 import BeautifulSoup
+            self.__soup = BeautifulSoup(self.content, 'html.parser')
+        return self.__soup
+
+    def slim(self) -> SlimFinancialReport:
+        return SlimFinancialReport(
+            stock_id=self.stock_id,
+            company_name=self.company_name,
+            year=self.year,
+            season=self.season,
+            report_type=self.report_type,
+            balance_sheet=SlimSheet(self.balance_sheet.ID, self.balance_sheet.dict_format,
+                                    self.balance_sheet.dollar_unit),
+            ci_sheet=SlimSheet(self.ci_sheet.ID, self.ci_sheet.dict_format, self.ci_sheet.dollar_unit),
+            cash_flows=SlimSheet(self.cash_flows.ID, self.cash_flows.dict_format, self.cash_flows.dollar_unit)
+        )
+
+    def memory_usage(self) -> int:
+        return deep_getsizeof(self)
 
 
 class FinancialReportAgent(object):
-    def __init__(self, delay_initial=1, delay_max=3, file_folder="./tmp/"):
+    BASE_URL = 'https://mops.twse.com.tw'
+    REPORT_PATH = '/server-java/t164sb01'
+
+    SHEET_CLASSES = (BalanceSheet, ComprehensiveIncomeSheet, StatementsOfCashFlows)
+    # The messages of the MOPS pages without a report, e.g., the company wasn't listed yet or has no consolidated
+    # report
+    NO_DATA_MARKERS = ('查無資料', '查無所需資料', '檔案不存在', '無應編製合併財報')
+
+    def __init__(self, delay_initial=1, delay_max=3, file_folder="./tmp/", max_workers=4, max_rps=None,
+                 parsed_cache=True, lean=False, transport: Optional[HttpTransport] = None, base_url=None,
+                 cache_store: Optional[CacheStore] = None, parsed_cache_store: Optional[CacheStore] = None,
+                 negative_cache=True, stats: Optional[Stats] = None, items: Optional[Iterable[str]] = None,
+                 apply_units=False):
         self.delay_initial = delay_initial
         self.delay_max = delay_max
         self.file_folder = file_folder
+        # The stages (fr.*, http.*) and the counters of the agent, nothing is recorded by default.
+        self.stats = stats if stats else NULL_STATS
+        # The raw pages, by default one big5 html file per report in file_folder
+        self.cache_store = cache_store if cache_store else FileCacheStore(file_folder)
+        if parsed_cache:
+            self.parsed_cache = ParsedReportCache(join(file_folder, 'parsed'), store=parsed_cache_store)
+        else:
+            self.parsed_cache = None
+        # The reports known to be missing aren't requested again until their entries expire.
+        if negative_cache:
+            self.negative_cache = NegativeReportCache(join(file_folder, 'missing_reports.jsonl'))
+        else:
+            self.negative_cache = None
+        # In the lean mode, the reports only keep the parsed numbers (SlimFinancialReport).
+        self.lean = lean
+        # The account codes read from the sheets, all of them if None. The other rows aren't parsed at all.
+        self.items: Optional[AbstractSet[str]] = frozenset(items) if items is not None else None
+        # The values are multiplied by the units of their sheets (e.g., NT$ thousands) and the units become 1.
+        self.apply_units = apply_units
+        # The politeness budget is shared by all workers. By default, it keeps the average pace of the old
+        # random delay (one request per (delay_initial + delay_max) / 2 seconds).
+        if max_rps is None:
+            max_rps = 2 / (delay_initial + delay_max) if delay_initial + delay_max > 0 else 0
+        self.max_rps = max_rps
+        self.engine = FetchEngine(max_workers=max_workers)
+        if transport is None:
+            transport = HttpTransport(max_rps=max_rps, pool_size=max_workers, stage_stats=self.stats)
+        self.transport = transport
+        self.base_url = base_url if base_url else self.BASE_URL
 
-        if not (exists(self.file_folder) and isdir(self.file_folder)):
-            makedirs(self.file_folder, exist_ok=True)
+    def get_report(self, stock_id: str, year: int, season: int, report_type: str,
+                   items: Optional[Iterable[str]] = None, offline: bool = False):
+        # items: the account codes to read instead of the ones of the agent. offline: never goes to the network, None
+        # if neither a parsed entry serving the request nor the raw page is cached.
+        items = frozenset(items) if items is not None else self.items
+        with self.stats.stage('fr.get_report'):
+            report = self.__get_report(stock_id, year, season, report_type, items, offline)
+        if report:
+            self.stats.incr('fr.reports')
+        if report and self.lean:
+            return report.slim()
+        return report
 
-    def get_report(self, stock_id: str, year: int, season: int, report_type: str):
-        report_file_name = join(self.file_folder, f'{stock_id}_{report_type}_{year}_{season}.html')
-        if exists(report_file_name):
-            with open(report_file_name, 'r', encoding='big5') as f:
-                content = f.read()
-                soup = BeautifulSoup(content, 'html.parser')
-                company_name_dom = soup.find('ix:nonnumeric').find_next_sibling('ix:nonnumeric')
+    def __get_report(self, stock_id: str, year: int, season: int, report_type: str,
+                     items: Optional[AbstractSet[str]], offline: bool):
+        stats = self.stats
+        parse_items = items
+        if self.parsed_cache:
+            with stats.stage('fr.parsed_cache_read'):
+                parsed_report = self.parsed_cache.get(stock_id, year, season, report_type)
+            if parsed_report and parsed_report.units_applied != self.apply_units:
+                parsed_report = None
+            if parsed_report and parsed_report.covers(items):
+                stats.incr('fr.parsed_cache.hits')
+                return self.__build_report(stock_id, year, season, report_type, parsed_report.select(items))
+            stats.incr('fr.parsed_cache.misses')
+            if parsed_report and items is not None:
+                # Parsed again for the items of both, so the entry still serves the requests it served.
+                parse_items = items | parsed_report.items
+
+        report_key = self.report_key(stock_id, year, season, report_type)
+        with stats.stage('fr.cache_read'):
+            cached_content = self.cache_store.get(report_key)
+        if cached_content is not None:
+            stats.incr('fr.cache.hits')
+            content = cached_content.decode('big5')
         else:
-            resp = requests.get(
-                f'https://mops.twse.com.tw/server-java/t164sb01?step=1&'
-                f'CO_ID={stock_id}&'
-                f'SYEAR={year}&'
-                f'SSEASON={season}&'
-                f'REPORT_ID={report_type}')
-            resp.encoding = 'big5'
+            stats.incr('fr.cache.misses')
+            if offline:
+                return None
+            if self.negative_cache:
+                missing_entry = self.negative_cache.get(stock_id, year, season, report_type)
+                if missing_entry:
+                    stats.incr('fr.negative_cache.hits')
+                    logging.debug(f'Skip the missing report: {report_key} ({missing_entry.reason.value})')
+                    return None
+                if self.negative_cache.classify(year, season)[0] is MissingReason.SEASON_NOT_ENDED:
+                    self.negative_cache.record(stock_id, year, season, report_type)
+                    logging.warning(f"The season isn't over yet: {report_key}")
+                    return None
+
+            with stats.stage('fr.download'):
+                resp = self.transport.get(
+                    f'{self.base_url}{self.REPORT_PATH}?step=1&'
+                    f'CO_ID={stock_id}&'
+                    f'SYEAR={year}&'
+                    f'SSEASON={season}&'
+                    f'REPORT_ID={report_type}',
+                    encoding='big5',
+                    validator=self.is_complete_page)
+            if resp.status_code != 200:
+                # Not an answer about the report, it's asked again next time.
+                logging.warning(f"Can't get the report: {report_key} (status {resp.status_code})")
+                return None
             content = resp.text.replace('�', '|?|')
-            time.sleep(random.randint(self.delay_initial, self.delay_max))
-            soup = BeautifulSoup(content, 'html.parser')
-            company_name_dom = soup.find('ix:nonnumeric').find_next_sibling('ix:nonnumeric')
 
-            if company_name_dom:
-                with open(report_file_name, 'w', encoding='big5') as f:
-                    f.write(content)
+        # The company name, the units and the sheets in one pass, the page is never turned into a DOM.
+        with stats.stage('fr.parse'):
+            page = parse_report(content, parse_items, self.apply_units)
+
+        # The pages of unpublished reports have no iXBRL data at all.
+        if page.company_name is None:
+            if cached_content is not None:
+                logging.warning(f'No report in the cached page: {report_key}')
+            elif self.negative_cache:
+                # Only the no-data page of MOPS says the report is missing, another page is asked again soon.
+                reason = None if self.is_no_data_page(content) else MissingReason.UNRECOGNIZED_PAGE
+                missing_entry = self.negative_cache.record(stock_id, year, season, report_type, reason)
+                logging.warning(f"Can't get the report: {report_key} ({missing_entry.reason.value})")
             else:
-                logging.warning(f"Can't get the report: {report_file_name}")
-                return None
+                logging.warning(f"Can't get the report: {report_key}")
+            return None
+        if cached_content is None:
+            with stats.stage('fr.cache_write'):
+                self.cache_store.put(report_key, content.encode('big5'))
 
-        balance_table = soup.find('table')
-        balance_sheet = BalanceSheet(balance_table)
-        self.parse_sheet_unit(balance_sheet, soup)
-        ci_table = balance_table.find_next_sibling('table')
-        ci_sheet = ComprehensiveIncomeSheet(ci_table)
-        self.parse_sheet_unit(ci_sheet, soup)
-        cash_flows = StatementsOfCashFlows(ci_table.find_next_sibling('table'))
-        self.parse_sheet_unit(cash_flows, soup)
+        parsed_sheets = page.sheets
+        if parse_items != items:
+            parsed_sheets = {sheet_id: {code: row for code, row in rows.items() if code in items}
+                             for sheet_id, rows in page.sheets.items()}
+        balance_sheet, ci_sheet, cash_flows = self.__build_sheets(parsed_sheets, page.dollar_units)
+
+        if self.parsed_cache:
+            with stats.stage('fr.parsed_cache_write'):
+                self.parsed_cache.put(stock_id, year, season, report_type, ParsedReport(
+                    company_name=page.company_name,
+                    sheets=page.sheets,
+                    dollar_units=page.dollar_units,
+                    items=parse_items,
+                    units_applied=self.apply_units
+                ))
 
         return FinancialReport(
             stock_id=stock_id,
-            company_name=company_name_dom.text,
+            company_name=page.company_name,
             year=year,
             season=season,
             report_type=report_type,
             balance_sheet=balance_sheet,
             ci_sheet=ci_sheet,
             cash_flows=cash_flows,
-            soup=soup
+            content=content,
+            sheet_spans=page.sheet_spans
         )
 
+    def __build_sheets(self, sheets: Dict[str, dict], dollar_units: Dict[str, int]):
+        built = []
+        for sheet_class in self.SHEET_CLASSES:
+            sheet = sheet_class(None, sheets.get(sheet_class.ID, {}))
+            sheet.set_dollar_unit(dollar_units.get(sheet_class.ID, 0))
+            built.append(sheet)
+        return built
+
+    def __build_report(self, stock_id: str, year: int, season: int, report_type: str, parsed_report: ParsedReport):
+        balance_sheet, ci_sheet, cash_flows = self.__build_sheets(parsed_report.sheets, parsed_report.dollar_units)
+
+        return FinancialReport(
+            stock_id=stock_id,
+            company_name=parsed_report.company_name,
+            year=year,
+            season=season,
+            report_type=report_type,
+            balance_sheet=balance_sheet,
+            ci_sheet=ci_sheet,
+            cash_flows=cash_flows
+        )
+
+    @staticmethod
+    def report_key(stock_id: str, year: int, season: int, report_type: str) -> str:
+        return f'{stock_id}_{report_type}_{year}_{season}.html'
+
+    def is_cached(self, stock_id: str, year: int, season: int, report_type: str) -> bool:
+        if self.parsed_cache and self.parsed_cache.exists(stock_id, year, season, report_type):
+            return True
+        return self.cache_store.exists(self.report_key(stock_id, year, season, report_type))
+
+    def get_cached_report(self, stock_id: str, year: int, season: int, report_type: str):
+        # Never goes to the network, None if the report isn't cached (e.g., the parsed entry has other items or
+        # units, and the raw page is gone).
+        if not self.is_cached(stock_id, year, season, report_type):
+            return None
+        return self.get_report(stock_id, year, season, report_type, offline=True)
+
+    def iter_cached_reports(self, units: Iterable[Tuple[str, int, int, str]], processes: Optional[int] = None,
+                            chunksize: int = 16, items: Optional[Iterable[str]] = None
+                            ) -> Iterator[Tuple[Tuple[str, int, int, str], Optional[SlimFinancialReport]]]:
+        # Parses the cached reports on worker processes. Only the slim reports come back, the DOM stays in the
+        # workers. The results are yielded in the order of the units. items: as in get_report.
+        self.cache_store.flush()
+        if self.parsed_cache:
+            self.parsed_cache.store.flush()
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_parse_worker,
+                                 initargs=(self.file_folder, self.cache_store,
+                                           self.parsed_cache.store if self.parsed_cache else None,
+                                           frozenset(items) if items is not None else self.items,
+                                           self.apply_units)) as executor:
+            units = list(units)
+            yield from zip(units, executor.map(_parse_cached_report, units, chunksize=chunksize))
+
+    def iter_reports(self, units: Iterable[Tuple[str, int, int, str]],
+                     items: Optional[Iterable[str]] = None) -> Iterator[FetchResult]:
+        # units: (stock_id, year, season, report_type). Results are yielded as soon as they are finished. items: as in
+        # get_report.
+        if items is not None:
+            return self.engine.run(partial(self.get_report, items=frozenset(items)), units)
+        return self.engine.run(self.get_report, units)
+
+    @staticmethod
+    def is_complete_page(resp) -> bool:
+        # A report page cut in the middle has the iXBRL data but not the end of the page.
+        text = resp.text
+        return 'ix:nonnumeric' not in text.lower() or '</html>' in text[-1024:].lower()
+
+    def is_no_data_page(self, content: str) -> bool:
+        return any(marker in content for marker in self.NO_DATA_MARKERS)
+
+    @staticmethod
+    def find_company_name_dom(soup: 'BeautifulSoup'):
+        # The pages of unpublished reports have no iXBRL data at all.
+        first_dom = soup.find('ix:nonnumeric')
+        return first_dom.find_next_sibling('ix:nonnumeric') if first_dom else None
+
     @staticmethod
-    def parse_sheet_unit(sheet: Sheet, report_html: BeautifulSoup):
+    def parse_sheet_unit(sheet: Sheet, report_html: 'BeautifulSoup'):
         unit_string = report_html.find(
             'div', id=sheet.magic_id
         ).find_next(
@@ -108,14 +331,33 @@ class FinancialReportAgent(object):
             'span', 'en'
         ).string
 
-        if 'thousands' in unit_string:
-            sheet.set_dollar_unit(1000)
-        else:
-            logging.warning(f'Unknown unit: {unit_string}')
+        dollar_unit = dollar_unit_of(unit_string)
+        if dollar_unit:
+            sheet.set_dollar_unit(dollar_unit)
 
         return sheet
 
 
+_worker_agent: Optional[FinancialReportAgent] = None
+
+
+def _init_parse_worker(file_folder: str, cache_store: CacheStore, parsed_cache_store: Optional[CacheStore],
+                       items: Optional[AbstractSet[str]], apply_units: bool):
+    global _worker_agent
+    _worker_agent = FinancialReportAgent(file_folder=file_folder, lean=True, cache_store=cache_store,
+                                         parsed_cache=parsed_cache_store is not None,
+                                         parsed_cache_store=parsed_cache_store, negative_cache=False, items=items,
+                                         apply_units=apply_units)
+
+
+def _parse_cached_report(unit: Tuple[str, int, int, str]) -> Optional[SlimFinancialReport]:
+    try:
+        return _worker_agent.get_cached_report(*unit)
+    except Exception as e:
+        logging.warning(f"Can't parse the cached report: {unit}, {e!r}")
+        return None
+
+
 if __name__ == "__main__":
     agent = FinancialReportAgent()
     report = agent.get_report("2330", 2022, 3, "C")
\ No newline at end of file
@@ -0,0 +1,18 @@
+"""
+The charts of FRPool. Only imported when a chart is drawn, the data core never loads plotly.
+"""
+import pandas as pd
+import plotly.express as px
+
+
+def draw_item(item_df: pd.DataFrame, title_lang='zh', multiple=1, adjust=1):
+    # item_df: the rows of an item (ReportIndex.item_frame)
+    item_df = item_df.astype({'company_name': str})
+    item_df['value'] *= multiple
+    item_df['value'] += adjust
+    fig = px.line(item_df,
+                  x='y_and_s',
+                  y='value',
+                  color='company_name',
+                  title=f'{item_df.iloc[0][title_lang]}, Adjust: {adjust}, Multiple: {multiple}')
+    fig.show()
@@ -1,78 +1,98 @@
-from dataclasses import dataclass, asdict
 from os import makedirs, path
+from typing import Callable, Iterable, List, Optional, Set, Tuple, Union
 import logging
 
 import pandas as pd
-import plotly.express as px
 
 from twfrpumper.reports.financial_reports.financial_report_agent import FinancialReportAgent
 from twfrpumper.reports.financial_reports.financial_report_agent import FinancialReport
-
-
-@dataclass
-class DFRecord:
-    code: str
-    company_name: str
-    y_and_s: str
-    item: str
-    zh: str
-    en: str
-    value: float = 0.0
+from twfrpumper.reports.financial_reports.slim_report import SlimFinancialReport
+from twfrpumper.reports.financial_reports.metrics import METRIC_LABELS, build_item_frame, cal_metrics, required_items
+from twfrpumper.reports.financial_reports.df_builder import CATEGORICAL_COLUMNS, LongFrameBuilder, PartitionedFrame
+from twfrpumper.reports.financial_reports.report_index import ReportIndex
+from twfrpumper.toolbox.date_tool import DateTool
+from twfrpumper.toolbox.memory_tool import deep_getsizeof
+from twfrpumper.toolbox.df_tool import concat_keep_categories
+from twfrpumper.toolbox.parquet_tool import build_filters, load_partitioned, save_partitioned
+from twfrpumper.toolbox.stats import Stats
 
 
 class FRPool(object):
-    def __init__(self):
-        self.__agent = FinancialReportAgent()
+    def __init__(self, max_workers=4, max_rps=None, lean=False, agent: Optional[FinancialReportAgent] = None,
+                 stats: Optional[Stats] = None, items: Optional[Iterable[str]] = None):
+        # items: the account codes to read from the reports (e.g., metrics.REPORT_ITEMS), all of them if None. The
+        # items the EPS of season 4 is derived from are added. They are passed to the agent with every request, a
+        # given agent is left as it is.
+        self.__items = required_items(items) if items is not None else None
+        if agent is None:
+            agent = FinancialReportAgent(max_workers=max_workers, max_rps=max_rps, lean=lean, stats=stats,
+                                         items=self.__items)
+        self.__agent = agent
+        # Shared with the agent it creates, the stages of the pool are fr_pool.*
+        self.stats = stats if stats else self.__agent.stats
         self.reports = set()
         self.organized_report = {}
-        self.report_df = None
+        # report_df, one frame per y_and_s
+        self.__frames = PartitionedFrame()
+        self.__index = None
         self.name_mapping = {}
-
-    def __cal_metrics_and_to_df(self):
-        arr_for_df = []
-        for code, reports in self.organized_report.items():
-            for y_and_s, report in reports.items():
-                self.__special_case_for_season_4(y_and_s, reports, report)
-                self.__special_case_for_season_1_and_4(y_and_s, reports, report)
-                self.__cal_dbr(report)
-                self.__prepare_df_arr(code, y_and_s, reports, report, arr_for_df)
-
-        if self.report_df:
-            self.report_df = self.report_df.append(pd.DataFrame(arr_for_df), ignore_index=True)
-            self.report_df = self.report_df.drop_duplicates()
-        else:
-            self.report_df = pd.DataFrame(arr_for_df)
+        # The reports added after the last organize_reports
+        self.__pending_reports = set()
+
+    @property
+    def report_df(self) -> Optional[pd.DataFrame]:
+        return self.__frames.frame
+
+    @report_df.setter
+    def report_df(self, report_df: Optional[pd.DataFrame]):
+        self.__frames.replace(report_df)
+        self.__index = None
+
+    def __upsert(self, new_df: pd.DataFrame, units: Optional[Set[Tuple[str, str]]] = None,
+                 items: Optional[Set[str]] = None):
+        self.__frames.upsert(new_df, units, items)
+        self.__index = None
+
+    @property
+    def index(self) -> ReportIndex:
+        if self.__index is None:
+            self.__index = ReportIndex(self.report_df)
+        return self.__index
+
+    def __cal_metrics_and_to_df(self, units: Set[Tuple[str, int]]):
+        stats = self.stats
+        builder = LongFrameBuilder()
+        with stats.stage('fr_pool.rows'):
+            for code, y_and_s in units:
+                reports = self.organized_report[code]
+                self.__prepare_df_arr(code, y_and_s, reports, reports[y_and_s], builder)
+
+        # The metrics look back one season, so they are calculated on the whole history of the touched companies.
+        with stats.stage('fr_pool.metrics'):
+            touched_codes = {code for code, _ in units}
+            metrics_df = cal_metrics(build_item_frame({code: self.organized_report[code] for code in touched_codes}))
+            keys = pd.MultiIndex.from_arrays([metrics_df['code'], metrics_df['y_and_s'].astype(int)])
+            metrics_df = metrics_df[keys.isin(list(units))].copy()
+            metrics_df['company_name'] = metrics_df['code'] + '-' + metrics_df['code'].map(self.name_mapping)
+
+        with stats.stage('fr_pool.build_df'):
+            builder.extend_frame(metrics_df)
+            new_df = builder.to_frame()
+
+            # The items produced by organizing, the rows added by extend_item stay.
+            items = set(METRIC_LABELS)
+            for code, y_and_s in units:
+                for item in self.organized_report[code][y_and_s]:
+                    items.update((item, f'y_{item}', f'acc_{item}'))
+            self.__upsert(new_df, {(code, str(y_and_s)) for code, y_and_s in units}, items)
 
     @staticmethod
-    def __prepare_df_arr_for_common(code, company_name, y_and_s, item, object_, arr_for_df):
-        str_y_and_s = str(y_and_s)
-        zh = object_['zh']
-        en = object_['en']
-        record = DFRecord(
-            code=code,
-            company_name=company_name,
-            y_and_s=str_y_and_s,
-            item=item,
-            zh=zh,
-            en=en,
-            value=object_['values'][0]
-        )
-        arr_for_df.append(asdict(record))
+    def __prepare_df_arr_for_common(code, company_name, y_and_s, item, object_, builder):
+        builder.append(code, company_name, str(y_and_s), item, object_['zh'], object_['en'], object_['values'][0])
 
     @staticmethod
-    def __prepare_df_arr_for_ci_sheet(code, company_name, y_and_s, reports, report, item, object_, arr_for_df):
-        zh = object_['zh']
-        en = object_['en']
-        str_y_and_s = str(y_and_s)
-        record = DFRecord(
-            code=code,
-            company_name=company_name,
-            y_and_s=str_y_and_s,
-            item=item,
-            zh=zh,
-            en=en,
-            value=object_['values'][0]
-        )
+    def __prepare_df_arr_for_ci_sheet(code, company_name, y_and_s, reports, report, item, object_, builder):
+        value = object_['values'][0]
         if y_and_s % 10 == 4:
             ex_report = reports.get(y_and_s - 1, None)
             if ex_report and item in ex_report:
@@ -87,80 +107,105 @@ class FRPool(object):
                     value = val_8200 / (val_3110 / 10)
                 else:
                     value = object_['values'][0] - ex_report[item]['values'][2]
-                record.value = value
-                arr_for_df.append(asdict(record))
             else:
-                record.item = f'y_{item}'
-                arr_for_df.append(asdict(record))
-        else:
-            arr_for_df.append(asdict(record))
+                item = f'y_{item}'
+
+        builder.append(code, company_name, str(y_and_s), item, object_['zh'], object_['en'], value)
 
     @staticmethod
-    def __prepare_df_arr_for_cash_flows(code, company_name, y_and_s, reports, item, object_, arr_for_df):
-        zh = object_['zh']
-        en = object_['en']
-        str_y_and_s = str(y_and_s)
-        record = DFRecord(
-            code=code,
-            company_name=company_name,
-            y_and_s=str_y_and_s,
-            item=item,
-            zh=zh,
-            en=en,
-            value=object_['values'][0]
-        )
-        if y_and_s % 10 == 1:
-            arr_for_df.append(asdict(record))
-        else:
+    def __prepare_df_arr_for_cash_flows(code, company_name, y_and_s, reports, item, object_, builder):
+        value = object_['values'][0]
+        if y_and_s % 10 != 1:
             ex_report = reports.get(y_and_s - 1, None)
             if ex_report and item in ex_report:
                 value = object_['values'][0] - ex_report[item]['values'][0]
-                record.value = value
-                arr_for_df.append(asdict(record))
             else:
-                record.item = f'acc_{item}'
-                arr_for_df.append(asdict(record))
+                item = f'acc_{item}'
+
+        builder.append(code, company_name, str(y_and_s), item, object_['zh'], object_['en'], value)
 
-    def __prepare_df_arr(self, code, y_and_s, reports, report, arr_for_df):
+    def __prepare_df_arr(self, code, y_and_s, reports, report, builder):
         company_name = f'{code}-{self.name_mapping[code]}'
         for item, object_ in report.items():
             if '4000' <= item <= '9850':
-                self.__prepare_df_arr_for_ci_sheet(code, company_name, y_and_s, reports, report, item, object_, arr_for_df)
+                self.__prepare_df_arr_for_ci_sheet(code, company_name, y_and_s, reports, report, item, object_, builder)
             elif 'A00010' <= item <= 'E00210':
-                self.__prepare_df_arr_for_cash_flows(code, company_name, y_and_s, reports, item, object_, arr_for_df)
+                self.__prepare_df_arr_for_cash_flows(code, company_name, y_and_s, reports, item, object_, builder)
             else:
-                self.__prepare_df_arr_for_common(code, company_name, y_and_s, item, object_, arr_for_df)
+                self.__prepare_df_arr_for_common(code, company_name, y_and_s, item, object_, builder)
 
-    def add_report(self, report: FinancialReport):
+    def add_report(self, report: Union[FinancialReport, SlimFinancialReport]):
         if report:
+            if report not in self.reports:
+                self.__pending_reports.add(report)
             self.reports.add(report)
             if report.stock_id not in self.name_mapping:
                 self.name_mapping.update({report.stock_id: report.company_name})
 
     def add_range_reports(self, stock_id: str, report_type: str, start_y: int, start_s: int, end_y: int, end_s: int):
-        start_y_s = start_y * 10 + start_s
-        end_y_s = end_y * 10 + end_s
-        while start_y_s <= end_y_s:
-            self.add_report(self.__agent.get_report(stock_id, start_y, start_s, report_type))
-            start_s += 1
-            if start_s == 5:
-                start_s = 1
-                start_y += 1
-
-            start_y_s = start_y * 10 + start_s
+        self.add_reports([stock_id], report_type, start_y, start_s, end_y, end_s)
+
+    def add_reports(self, stock_ids: Iterable[str], report_type: str, start_y: int, start_s: int, end_y: int,
+                    end_s: int, callback: Optional[Callable[[FinancialReport], None]] = None) -> List[FinancialReport]:
+        # Tickers are interleaved, so the workers spread over companies instead of walking one company at a time.
+        seasons = list(DateTool.season_range(start_y, start_s, end_y, end_s))
+        units = [(stock_id, year, season, report_type) for year, season in seasons for stock_id in stock_ids]
+        added = []
+        for fetch_result in self.__agent.iter_reports(units, items=self.__items):
+            report = fetch_result.result
+            if report:
+                self.add_report(report)
+                added.append(report)
+                if callback:
+                    callback(report)
+        return added
+
+    def add_cached_reports(self, stock_ids: Iterable[str], report_type: str, start_y: int, start_s: int, end_y: int,
+                           end_s: int, processes: Optional[int] = None, chunksize: int = 16) -> List[SlimFinancialReport]:
+        # Parses the cached reports on several processes, the reports which are not cached are skipped.
+        seasons = list(DateTool.season_range(start_y, start_s, end_y, end_s))
+        units = [(stock_id, year, season, report_type) for stock_id in stock_ids for year, season in seasons]
+        added = []
+        for _, report in self.__agent.iter_cached_reports(units, processes=processes, chunksize=chunksize,
+                                                             items=self.__items):
+            if report:
+                self.add_report(report)
+                added.append(report)
+        return added
+
+    def memory_usage(self) -> int:
+        # The objects shared by reports (e.g., interned labels) are counted once.
+        return deep_getsizeof(self.reports)
 
     def organize_reports(self) -> None:
-        for report in self.reports:
-            year_season = report.year * 10 + report.season
-            self.organized_report.setdefault(report.stock_id, {})
-            self.organized_report[report.stock_id].update({year_season: report.balance_sheet.dict_format})
-            self.organized_report[report.stock_id][year_season].update(report.ci_sheet.dict_format)
-            self.organized_report[report.stock_id][year_season].update(report.cash_flows.dict_format)
-
-        self.__cal_metrics_and_to_df()
+        with self.stats.stage('fr_pool.organize'):
+            self.__organize_reports()
+
+    def __organize_reports(self):
+        # Only the new reports and the seasons right after them (which are derived from them) are organized again.
+        units = set()
+        self.stats.incr('fr_pool.reports_organized', len(self.__pending_reports))
+        with self.stats.stage('fr_pool.dict_format'):
+            for report in self.__pending_reports:
+                year_season = report.year * 10 + report.season
+                self.organized_report.setdefault(report.stock_id, {})
+                # Merged into a new dict, the dict_format of the sheets stays untouched.
+                self.organized_report[report.stock_id][year_season] = {
+                    **report.balance_sheet.dict_format,
+                    **report.ci_sheet.dict_format,
+                    **report.cash_flows.dict_format
+                }
+                units.add((report.stock_id, year_season))
+                next_year_season = year_season + 1 if report.season != 4 else (report.year + 1) * 10 + 1
+                units.add((report.stock_id, next_year_season))
+        self.__pending_reports.clear()
+
+        units = {(code, y_and_s) for code, y_and_s in units if y_and_s in self.organized_report[code]}
+        if units:
+            self.__cal_metrics_and_to_df(units)
 
     def list_items(self):
-        return self.report_df[['item', 'zh', 'en']].drop_duplicates().values.tolist()
+        return self.index.items()
 
     def save_as_csv(self, file_path):
         folders = path.dirname(file_path)
@@ -169,33 +214,37 @@ class FRPool(object):
 
     def load_csv(self, file_path: str):
         if path.exists(file_path) and file_path.endswith('.csv'):
-            loaded_df = pd.read_csv(file_path)
-            loaded_df['y_and_s'] = loaded_df['y_and_s'].astype(str)
-            if self.report_df:
-                self.report_df = self.report_df.append(pd.DataFrame(loaded_df), ignore_index=True)
-                self.report_df = self.report_df.drop_duplicates()
-            else:
-                self.report_df = pd.DataFrame(loaded_df)
+            loaded_df = pd.read_csv(file_path, dtype={'code': str, 'y_and_s': str})
+            self.__upsert(loaded_df)
         else:
             logging.error(f'{file_path} is not exist or not a csv.')
 
-    def draw(self, item, title_lang='zh', multiple=1, adjust=1):
+    def save_as_parquet(self, folder: str):
+        save_partitioned(self.report_df, folder, self.report_df['code'], self.report_df['y_and_s'].str[:4],
+                         sort_by=['item', 'y_and_s'])
+
+    def load_parquet(self, folder: str, codes: Optional[Iterable[str]] = None, years: Optional[Iterable[int]] = None,
+                     items: Optional[Iterable[str]] = None, columns: Optional[List[str]] = None):
+        # Only the partitions of the codes and years, and the row groups of the items are read.
+        if path.isdir(folder):
+            loaded_df = load_partitioned(folder, columns, build_filters(codes, years, item=items))
+            if columns is None:
+                self.__upsert(loaded_df)
+            else:
+                self.report_df = loaded_df
+        else:
+            logging.error(f'{folder} is not exist or not a folder.')
 
-        item_df = self.report_df[(self.report_df.item == item)].sort_values(by=['y_and_s'])
-        item_df['value'] *= multiple
-        item_df['value'] += adjust
-        fig = px.line(item_df,
-                      x='y_and_s',
-                      y='value',
-                      color='company_name',
-                      title=f'{item_df.iloc[0][title_lang]}, Adjust: {adjust}, Multiple: {multiple}')
-        fig.show()
+    def draw(self, item, title_lang='zh', multiple=1, adjust=1):
+        # plotly is loaded on the first chart, the pool itself doesn't need it.
+        from twfrpumper.reports.financial_reports.fr_plot import draw_item
+        draw_item(self.index.item_frame(item), title_lang, multiple, adjust)
 
     def extend_item(self, *items, func, item_name, zh, en):
         items_df = []
-        first_item_df = self.report_df[(self.report_df.item == items[0])]
+        first_item_df = self.index.item_frame(items[0])
         for item in items:
-            items_df.append(self.report_df[(self.report_df.item == item)].sort_values(by=['y_and_s'])['value'].values)
+            items_df.append(self.index.item_frame(item)['value'].values)
 
         result_values = func(*items_df)
         new_item = first_item_df.copy()
@@ -203,114 +252,12 @@ class FRPool(object):
         new_item['zh'] = [zh] * result_values.size
         new_item['en'] = [en] * result_values.size
         new_item['value'] = result_values
-        if self.report_df[(self.report_df.item == item_name)].size:
-            self.report_df = self.report_df.drop(self.report_df[self.report_df.item == item_name].index)
+        report_df = self.report_df
+        old_positions = self.index.item_positions(item_name)
+        if old_positions.size:
+            report_df = report_df.drop(report_df.index[old_positions])
 
-        self.report_df = pd.concat([self.report_df, new_item], ignore_index=True)
-
-    @staticmethod
-    def __special_case_for_season_4(y_and_s, reports, report):
-        if y_and_s % 10 == 4:  # season 4
-            ex_y_and_s = y_and_s - 1
-            if ex_y_and_s not in reports:
-                return
-            ex_report = reports[ex_y_and_s]
-
-            ex_gross_profit = ex_report['5900']['values'][2]
-            s_gross_profit = report['5900']['values'][0] - ex_gross_profit
-
-            ex_total_operating_revenue = ex_report['4000']['values'][2]
-            s_total_operating_revenue = report['4000']['values'][0] - ex_total_operating_revenue
-
-            ex_net_operating_income = ex_report['6900']['values'][2]
-            s_net_operating_income = report['6900']['values'][0] - ex_net_operating_income
-
-            ex_profit = ex_report['8200']['values'][2]
-            s_profit = report['8200']['values'][0] - ex_profit
-        else:
-            s_total_operating_revenue = report['4000']['values'][0]
-            s_gross_profit = report['5900']['values'][0]
-            s_net_operating_income = report['6900']['values'][0]
-            s_profit = report['8200']['values'][0]
-
-        s_total_asset = report['1XXX']['values'][0]
-        s_total_equity = report['3XXX']['values'][0]
-        s_roa = round((s_profit / s_total_asset) * 100, 2)
-        s_roe = round((s_profit / s_total_equity) * 100, 2)
-        s_gross_margin = round((s_gross_profit / s_total_operating_revenue) * 100, 2)
-        s_operating_margin = round((s_net_operating_income / s_total_operating_revenue) * 100, 2)
-        s_net_profit_margin = round((s_profit / s_total_operating_revenue) * 100, 2)
-
-        report.update({
-            's_roa': {
-                'zh': 'ROA(季)',
-                'en': 'ROA(Season)',
-                'values': [s_roa]
-            },
-            's_roe': {
-                'zh': 'ROE(季)',
-                'en': 'ROE(Season)',
-                'values': [s_roe]
-            },
-            's_gross_margin': {
-                'zh': '毛利率(季)',
-                'en': 'Gross Margin(Season)',
-                'values': [s_gross_margin]
-            },
-            's_operating_margin': {
-                'zh': '營業利益率(季)',
-                'en': 'Operating Margin(Season)',
-                'values': [s_operating_margin]
-            },
-            's_net_profit_margin': {
-                'zh': '淨利率(季)',
-                'en': 'Net Profit Margin(Season)',
-                'values': [s_net_profit_margin]
-            },
-        })
-
-    @staticmethod
-    def __cal_dbr(report):
-        report.update({
-            'dbr': {
-                'zh': '負債比率',
-                'en': 'Debt Burden Ratio',
-                'values': [round((report['2XXX']['values'][0] / report['1XXX']['values'][0]) * 100, 2)]
-            }
-        })
-
-    @staticmethod
-    def __special_case_for_season_1_and_4(y_and_s, reports, report):
-        ex_y_and_s = y_and_s - 1 if y_and_s % 10 != 1 else y_and_s - 7
-        if ex_y_and_s not in reports.keys():
-            return
-
-        ex_s_report = reports[ex_y_and_s]
-        curr_inventories = report['130X']['values'][0]
-        ex_s_curr_inv = ex_s_report['130X']['values'][0] if '130X' in ex_s_report else 0
-        avg_inv = (curr_inventories + ex_s_curr_inv) / 2
-
-        if y_and_s % 10 == 4:
-            curr_toc = report['5000']['values'][0]
-            ex_s_acc_toc = ex_s_report['5000']['values'][2] if '5000' in ex_s_report else 0
-            s_total_operating_costs = curr_toc - ex_s_acc_toc
-        else:
-            s_total_operating_costs = report['5000']['values'][0]
-
-        s_it = round(s_total_operating_costs / avg_inv, 2) if avg_inv else 0
-        s_it_days = round(90 / s_it, 2) if s_it else 0
-        report.update({
-            's_it': {
-                'zh': 's_it',
-                'en': 's_inventory_turnover',
-                'values': [s_it]
-            },
-            's_it_days': {
-                'zh': 's_it_days',
-                'en': 's_inventory_turnover_days',
-                'values': [s_it_days]
-            }
-        })
+        self.report_df = concat_keep_categories([report_df, new_item], CATEGORICAL_COLUMNS)
 
 
 if __name__ == '__main__':
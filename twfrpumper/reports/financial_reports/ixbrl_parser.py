@@ -0,0 +1,344 @@
+from html.parser import HTMLParser
+from typing import AbstractSet, Dict, Iterable, List, NamedTuple, Optional, Tuple
+import logging
+
+from twfrpumper.reports.financial_reports.sheet import Sheet
+from twfrpumper.reports.financial_reports.balance_sheet import BalanceSheet
+from twfrpumper.reports.financial_reports.comprehensive_income_sheet import ComprehensiveIncomeSheet
+from twfrpumper.reports.financial_reports.statements_of_cash_flows import StatementsOfCashFlows
+
+# Bump it whenever the output of the parser changes, so the stale parsed data can be found.
+PARSER_VERSION = 4
+
+# The sheets are the first three tables of a report, in this order.
+SHEET_ORDER = (BalanceSheet.ID, ComprehensiveIncomeSheet.ID, StatementsOfCashFlows.ID)
+# The page is fed in chunks, so the parser can stop after the last sheet it needs.
+CHUNK_SIZE = 1 << 16
+# The unit strings of MOPS (e.g., 'Unit: NT$ thousands') without the 'Unit:', and their dollar units
+DOLLAR_UNITS = {'nt$ thousands': 1000, 'nt$ millions': 1000000, 'nt$': 1}
+
+
+def dollar_unit_of(unit_string: str) -> int:
+    # 0 if the unit is unknown, e.g., 'NT$ ten thousands' is not read as thousands.
+    phrase = ' '.join(unit_string.lower().split())
+    if phrase.startswith('unit:'):
+        phrase = phrase[len('unit:'):].lstrip()
+    dollar_unit = DOLLAR_UNITS.get(phrase)
+    if dollar_unit is None:
+        logging.warning(f'Unknown unit: {unit_string}')
+        return 0
+    return dollar_unit
+
+
+def is_monetary(code: str, unit_ref: Optional[str]) -> bool:
+    # The values in the dollar unit of the sheet: not the per-share rows (the EPS, 9700 to 9899) nor the values in
+    # shares or ratios (by the unitRef of the ix:nonFraction, e.g., 'TWD_per_share', 'shares', 'pure').
+    if '9700' <= code < '9900':
+        return False
+    if unit_ref is None:
+        return True
+    unit_ref = unit_ref.lower()
+    return 'share' not in unit_ref and unit_ref not in ('pure', 'percent', '%')
+
+
+def sheet_of(code: str) -> str:
+    # The sheet an account code belongs to, by the code ranges FRPool organizes the items with.
+    if '4000' <= code <= '9850':
+        return ComprehensiveIncomeSheet.ID
+    if 'A00010' <= code <= 'E00210':
+        return StatementsOfCashFlows.ID
+    return BalanceSheet.ID
+
+
+class ParsedPage(NamedTuple):
+    # None if the page has no iXBRL data (an unpublished report)
+    company_name: Optional[str]
+    # {Sheet.ID: dict_format}
+    sheets: Dict[str, dict]
+    # {Sheet.ID: dollar unit}, 1 if the units were applied to the values, 0 if unknown
+    dollar_units: Dict[str, int]
+    # {Sheet.ID: (start, end)}, the offsets of the table of a sheet in the page
+    sheet_spans: Dict[str, Tuple[int, int]]
+
+
+class _Cell(object):
+    __slots__ = ('is_code', 'text', 'has_tag', 'zh', 'en', 'value', 'sign', 'unit_ref')
+
+    def __init__(self, is_code: bool):
+        self.is_code = is_code
+        self.text = []
+        self.has_tag = False
+        self.zh = None
+        self.en = None
+        self.value = None
+        self.sign = None
+        self.unit_ref = None
+
+
+class IXBRLSheetParser(HTMLParser):
+    """
+    Reads the rows of the balance sheet, the comprehensive income sheet and the statements of cash flows in one pass
+    over the report, without building a DOM. The result is the same as Sheet.dict_format of each sheet.
+
+    With items, only the rows of those account codes are read: the other rows are skipped before their labels and
+    values, the sheets without any of the items are skipped as a whole, and the parsing stops after the last sheet
+    needed. Every sheet is in the result, empty if nothing was read from it.
+
+    The header is read in the same pass: the company name (the second ix:nonnumeric), the unit of every sheet (the
+    span.en of the div.rptidx after the div of the sheet, the first unit of the page if a sheet has none) and where
+    the tables of the sheets are. With apply_units, the monetary values are multiplied by their dollar units, the
+    EPS and the values in shares or ratios are kept as they are (see is_monetary).
+    """
+
+    def __init__(self, items: Optional[Iterable[str]] = None, apply_units: bool = False):
+        super().__init__(convert_charrefs=True)
+        self.items: Optional[AbstractSet[str]] = frozenset(items) if items is not None else None
+        self.apply_units = apply_units
+        self.sheets: Dict[str, dict] = {sheet_id: {} for sheet_id in SHEET_ORDER}
+        if self.items is None:
+            self.__sheet_ids = set(SHEET_ORDER)
+        else:
+            self.__sheet_ids = {sheet_of(item) for item in self.items}
+        self.company_name: Optional[str] = None
+        # The unit strings, None is the first one of the page
+        self.unit_strings: Dict[Optional[str], str] = {}
+        # (line, column) of the start and the end of the table of every sheet
+        self.sheet_positions: Dict[str, List[Tuple[int, int]]] = {}
+        self.__nonnumeric_count = 0
+        # The sheet the next div.rptidx belongs to, True inside that div.rptidx
+        self.__unit_sheet: Optional[str] = None
+        self.__in_rptidx = False
+        # 'name' or 'unit' when the text belongs to the header
+        self.__header_capture = None
+        self.__header_captured = []
+        self.__sheet_id: Optional[str] = None
+        self.__factor = 1
+        self.__last_table = max((SHEET_ORDER.index(sheet_id) + 1 for sheet_id in self.__sheet_ids), default=0)
+        self.__table_depth = 0
+        self.__table_count = 0
+        self.__result: Optional[dict] = None
+        self.__row: Optional[List[_Cell]] = None
+        # The code of the row isn't one of the items
+        self.__skip_row = False
+        self.__cell: Optional[_Cell] = None
+        # 'zh', 'en' or 'value' when the text belongs to a label span or a ix:nonfraction
+        self.__capture = None
+        self.__captured = []
+
+    @property
+    def done(self) -> bool:
+        # All the sheets needed are read, the rest of the page (the notes) doesn't matter.
+        return self.__table_count >= self.__last_table and self.__result is None
+
+    def parse(self, content: str) -> Dict[str, dict]:
+        for start in range(0, len(content), CHUNK_SIZE):
+            self.feed(content[start:start + CHUNK_SIZE])
+            if self.done:
+                return self.sheets
+        self.close()
+        return self.sheets
+
+    def dollar_unit(self, sheet_id: str) -> int:
+        # The unit of the values read from the sheet
+        unit_string = self.unit_strings.get(sheet_id, self.unit_strings.get(None))
+        if unit_string is None:
+            return 0
+        dollar_unit = dollar_unit_of(unit_string)
+        return 1 if self.apply_units and dollar_unit else dollar_unit
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'table':
+            self.__table_depth += 1
+            if self.__table_depth == 1:
+                self.__sheet_id = None
+                if self.__table_count < len(SHEET_ORDER):
+                    self.__sheet_id = SHEET_ORDER[self.__table_count]
+                    self.sheet_positions[self.__sheet_id] = [self.getpos()]
+                if self.__sheet_id in self.__sheet_ids:
+                    self.__result = self.sheets[self.__sheet_id]
+                    self.__factor = 1
+                    if self.apply_units:
+                        unit_string = self.unit_strings.get(self.__sheet_id, self.unit_strings.get(None))
+                        self.__factor = (dollar_unit_of(unit_string) or 1) if unit_string else 1
+                else:
+                    self.__result = None
+                self.__table_count += 1
+            return
+
+        if self.__result is None:
+            if self.__table_depth == 0:
+                self.__header_starttag(tag, attrs)
+            return
+
+        if tag == 'tr':
+            self.__end_row()
+            self.__row = []
+        elif tag == 'td':
+            self.__end_cell()
+            if self.__skip_row:
+                return
+            if self.__row is None:
+                self.__row = []
+            self.__cell = _Cell(dict(attrs).get('style') == 'text-align:center')
+        elif self.__cell is not None:
+            cell = self.__cell
+            cell.has_tag = True
+            if tag == 'span' and self.__capture is None:
+                classes = (dict(attrs).get('class') or '').split()
+                if 'zh' in classes and cell.zh is None:
+                    self.__start_capture('zh')
+                elif 'en' in classes and cell.en is None:
+                    self.__start_capture('en')
+            elif tag == 'ix:nonfraction' and cell.value is None and self.__capture is None:
+                attrs = dict(attrs)
+                cell.sign = attrs.get('sign')
+                cell.unit_ref = attrs.get('unitref')
+                self.__start_capture('value')
+
+    def __header_starttag(self, tag, attrs):
+        if tag == 'ix:nonnumeric':
+            self.__nonnumeric_count += 1
+            if self.__nonnumeric_count == 2:
+                self.__start_header_capture('name')
+        elif tag == 'div':
+            attrs = dict(attrs)
+            if attrs.get('id') in SHEET_ORDER:
+                self.__unit_sheet = attrs['id']
+            elif 'rptidx' in (attrs.get('class') or '').split():
+                self.__in_rptidx = True
+        elif tag == 'span' and self.__in_rptidx and self.__header_capture is None:
+            if 'en' in (dict(attrs).get('class') or '').split():
+                self.__start_header_capture('unit')
+
+    def __start_header_capture(self, name):
+        self.__header_capture = name
+        self.__header_captured = []
+
+    def __end_header_capture(self):
+        text = ''.join(self.__header_captured).strip()
+        if self.__header_capture == 'name':
+            self.company_name = text
+        else:
+            self.unit_strings.setdefault(None, text)
+            if self.__unit_sheet is not None:
+                self.unit_strings.setdefault(self.__unit_sheet, text)
+            self.__unit_sheet = None
+            self.__in_rptidx = False
+        self.__header_capture = None
+
+    def handle_endtag(self, tag):
+        if tag == 'table':
+            if self.__table_depth == 1:
+                self.__end_row()
+                self.__result = None
+                if self.__sheet_id is not None:
+                    self.sheet_positions[self.__sheet_id].append(self.getpos())
+            self.__table_depth = max(self.__table_depth - 1, 0)
+        elif self.__result is None:
+            if self.__header_capture is not None and (
+                    (tag == 'ix:nonnumeric' and self.__header_capture == 'name')
+                    or (tag == 'span' and self.__header_capture == 'unit')):
+                self.__end_header_capture()
+            return
+        elif tag == 'tr':
+            self.__end_row()
+        elif tag == 'td':
+            self.__end_cell()
+        elif (tag == 'span' and self.__capture in ('zh', 'en')) or (tag == 'ix:nonfraction' and self.__capture == 'value'):
+            setattr(self.__cell, self.__capture, ''.join(self.__captured))
+            self.__capture = None
+
+    def handle_data(self, data):
+        if self.__cell is None:
+            if self.__header_capture is not None:
+                self.__header_captured.append(data)
+            return
+        if self.__capture is not None:
+            self.__captured.append(data)
+        elif not self.__cell.has_tag:
+            self.__cell.text.append(data)
+
+    def __start_capture(self, name):
+        self.__capture = name
+        self.__captured = []
+
+    def __end_cell(self):
+        if self.__cell is not None:
+            cell = self.__cell
+            self.__cell = None
+            if self.__capture is not None:
+                setattr(cell, self.__capture, ''.join(self.__captured))
+                self.__capture = None
+            if self.items is not None and not self.__row and cell.is_code and not cell.has_tag:
+                code = ''.join(cell.text).strip()
+                if code and code != '-' and code not in self.items:
+                    # The label and the value cells of the row aren't even read.
+                    self.__skip_row = True
+                    return
+            self.__row.append(cell)
+
+    def __end_row(self):
+        self.__end_cell()
+        self.__skip_row = False
+        row = self.__row
+        self.__row = None
+        if not row:
+            return
+
+        for idx, cell in enumerate(row):
+            if not cell.is_code or cell.has_tag:
+                continue
+            code = ''.join(cell.text).lstrip()
+            if not code or code == '-' or idx + 1 >= len(row):
+                continue
+
+            label = row[idx + 1]
+            values = []
+            for value_cell in row[idx + 2:]:
+                if value_cell.value is None:
+                    values.append(float('nan'))
+                else:
+                    values.append(Sheet.to_number(value_cell.value.strip(), value_cell.sign))
+            if self.__factor != 1 and is_monetary(code, None):
+                values = [value * self.__factor if is_monetary(code, value_cell.unit_ref) else value
+                          for value, value_cell in zip(values, row[idx + 2:])]
+            self.__result[code] = {
+                'zh': (label.zh or '').strip(),
+                'en': (label.en or '').strip(),
+                'values': values
+            }
+
+
+def _offsets(content: str, positions: Dict[str, List[Tuple[int, int]]]) -> Dict[str, Tuple[int, int]]:
+    # (line, column) of HTMLParser.getpos() to the offsets in the content, the lines are walked once.
+    flat = sorted({position for sheet_positions in positions.values() for position in sheet_positions})
+    offsets = {}
+    line, line_start = 1, 0
+    for position in flat:
+        while line < position[0]:
+            line_start = content.index('\n', line_start) + 1
+            line += 1
+        offsets[position] = line_start + position[1]
+    spans = {}
+    for sheet_id, sheet_positions in positions.items():
+        start = offsets[sheet_positions[0]]
+        # The end tag starts at the end position
+        end = content.find('>', offsets[sheet_positions[1]]) + 1 if len(sheet_positions) > 1 else len(content)
+        spans[sheet_id] = (start, end)
+    return spans
+
+
+def parse_sheets(content: str, items: Optional[Iterable[str]] = None) -> Dict[str, dict]:
+    return IXBRLSheetParser(items).parse(content)
+
+
+def parse_report(content: str, items: Optional[Iterable[str]] = None, apply_units: bool = False) -> ParsedPage:
+    # The sheets and the header of a report page in one pass
+    parser = IXBRLSheetParser(items, apply_units)
+    sheets = parser.parse(content)
+    return ParsedPage(
+        company_name=parser.company_name,
+        sheets=sheets,
+        dollar_units={sheet_id: parser.dollar_unit(sheet_id) for sheet_id in SHEET_ORDER},
+        sheet_spans=_offsets(content, parser.sheet_positions)
+    )
@@ -0,0 +1,134 @@
+from typing import Dict, FrozenSet, Iterable
+
+import numpy as np
+import pandas as pd
+
+# item: (zh, en)
+METRIC_LABELS = {
+    's_roa': ('ROA(季)', 'ROA(Season)'),
+    's_roe': ('ROE(季)', 'ROE(Season)'),
+    's_gross_margin': ('毛利率(季)', 'Gross Margin(Season)'),
+    's_operating_margin': ('營業利益率(季)', 'Operating Margin(Season)'),
+    's_net_profit_margin': ('淨利率(季)', 'Net Profit Margin(Season)'),
+    'dbr': ('負債比率', 'Debt Burden Ratio'),
+    's_it': ('s_it', 's_inventory_turnover'),
+    's_it_days': ('s_it_days', 's_inventory_turnover_days'),
+}
+
+# The items read by the metrics
+STOCK_ITEMS = ('1XXX', '2XXX', '3XXX', '130X')
+# Accumulated in the comprehensive income sheet, values[2] of season 3 is needed to get season 4 alone.
+FLOW_ITEMS = ('4000', '5000', '5900', '6900', '8200')
+METRIC_ITEMS = STOCK_ITEMS + FLOW_ITEMS
+# The season 4 EPS is derived from the capital stock and the profit of the year and of season 3.
+EPS_ITEMS = {'9750': ('3100', '8200'), '9850': ('3110', '8200')}
+# What FRPool needs for the metrics and the EPS, the item whitelist of the jobs which only look at them
+REPORT_ITEMS = METRIC_ITEMS + ('3100', '3110', '9750', '9850')
+
+
+def required_items(items: Iterable[str]) -> FrozenSet[str]:
+    # The items with the ones FRPool derives them from
+    items = set(items)
+    for eps_item, source_items in EPS_ITEMS.items():
+        if eps_item in items:
+            items.update(source_items)
+    return frozenset(items)
+
+
+def build_item_frame(organized_report: Dict[str, Dict[int, dict]]) -> pd.DataFrame:
+    """
+    Collects the items used by the metrics into a wide frame indexed by (code, y_and_s). The flow items have two
+    columns, '<item>' for values[0] and '<item>_acc' for values[2].
+    """
+    codes = []
+    y_and_s_list = []
+    columns = {item: [] for item in STOCK_ITEMS + FLOW_ITEMS}
+    columns.update({f'{item}_acc': [] for item in FLOW_ITEMS})
+    nan = float('nan')
+    for code, reports in organized_report.items():
+        for y_and_s, report in reports.items():
+            codes.append(code)
+            y_and_s_list.append(y_and_s)
+            for item in STOCK_ITEMS:
+                columns[item].append(report[item]['values'][0] if item in report else nan)
+            for item in FLOW_ITEMS:
+                values = report[item]['values'] if item in report else ()
+                columns[item].append(values[0] if values else nan)
+                columns[f'{item}_acc'].append(values[2] if len(values) > 2 else nan)
+
+    index = pd.MultiIndex.from_arrays([codes, np.array(y_and_s_list, dtype=np.int64)], names=['code', 'y_and_s'])
+    return pd.DataFrame({name: np.array(values, dtype=np.float64) for name, values in columns.items()}, index=index)
+
+
+def _lagged(item_frame: pd.DataFrame, ex_y_and_s: np.ndarray):
+    codes = item_frame.index.get_level_values('code')
+    ex_index = pd.MultiIndex.from_arrays([codes, ex_y_and_s], names=['code', 'y_and_s'])
+    exists = ex_index.isin(item_frame.index)
+    return item_frame.reindex(ex_index), exists
+
+
+def _ratio(numerator, denominator):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.round(numerator / denominator * 100, 2)
+
+
+def cal_metrics(item_frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Calculates the metrics of every (code, y_and_s) in bulk and returns them in the long format
+    (code, y_and_s, item, zh, en, value).
+    """
+    y_and_s = item_frame.index.get_level_values('y_and_s').to_numpy()
+    season = y_and_s % 10
+    is_season_4 = season == 4
+
+    # The seasonal values of season 4 = the accumulated values of the year - the accumulated values of season 3
+    ex_frame, ex_exists = _lagged(item_frame, y_and_s - 1)
+    seasonal = {}
+    for item in ('4000', '5900', '6900', '8200'):
+        seasonal[item] = np.where(is_season_4,
+                                  item_frame[item].to_numpy() - ex_frame[f'{item}_acc'].to_numpy(),
+                                  item_frame[item].to_numpy())
+
+    # Season 4 without season 3 can't be split out of the year.
+    has_seasonal = ~is_season_4 | ex_exists
+    total_asset = item_frame['1XXX'].to_numpy()
+    total_equity = item_frame['3XXX'].to_numpy()
+    revenue = seasonal['4000']
+    metrics = {
+        's_roa': (_ratio(seasonal['8200'], total_asset), has_seasonal),
+        's_roe': (_ratio(seasonal['8200'], total_equity), has_seasonal),
+        's_gross_margin': (_ratio(seasonal['5900'], revenue), has_seasonal),
+        's_operating_margin': (_ratio(seasonal['6900'], revenue), has_seasonal),
+        's_net_profit_margin': (_ratio(seasonal['8200'], revenue), has_seasonal),
+        'dbr': (_ratio(item_frame['2XXX'].to_numpy(), total_asset), np.ones(y_and_s.size, dtype=bool)),
+    }
+
+    # Inventory turnover compares with the previous season, which is season 4 of last year for season 1.
+    inv_frame, inv_exists = _lagged(item_frame, np.where(season == 1, y_and_s - 7, y_and_s - 1))
+    ex_inventories = np.nan_to_num(inv_frame['130X'].to_numpy(), nan=0.0)
+    avg_inv = (item_frame['130X'].to_numpy() + ex_inventories) / 2
+    ex_acc_toc = np.nan_to_num(inv_frame['5000_acc'].to_numpy(), nan=0.0)
+    total_operating_costs = np.where(is_season_4,
+                                     item_frame['5000'].to_numpy() - ex_acc_toc,
+                                     item_frame['5000'].to_numpy())
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s_it = np.where(avg_inv != 0, np.round(total_operating_costs / avg_inv, 2), 0.0)
+        s_it_days = np.where(s_it != 0, np.round(90 / s_it, 2), 0.0)
+    metrics['s_it'] = (s_it, inv_exists)
+    metrics['s_it_days'] = (s_it_days, inv_exists)
+
+    codes = item_frame.index.get_level_values('code').to_numpy()
+    str_y_and_s = y_and_s.astype(str)
+    frames = []
+    for item, (values, mask) in metrics.items():
+        zh, en = METRIC_LABELS[item]
+        frames.append(pd.DataFrame({
+            'code': codes[mask],
+            'y_and_s': str_y_and_s[mask],
+            'item': item,
+            'zh': zh,
+            'en': en,
+            'value': values[mask]
+        }))
+
+    return pd.concat(frames, ignore_index=True)
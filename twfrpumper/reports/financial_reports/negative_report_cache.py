@@ -0,0 +1,126 @@
+from datetime import timedelta
+from enum import Enum
+from os import makedirs, path, replace
+from typing import Dict, NamedTuple, Optional, Tuple
+import json
+import threading
+import time
+
+from twfrpumper.toolbox.date_tool import DateTool
+
+Unit = Tuple[str, int, int, str]
+
+
+class MissingReason(Enum):
+    # The season isn't over yet, no report can exist.
+    SEASON_NOT_ENDED = 'season_not_ended'
+    # The season is over, but the deadline of the report isn't passed yet.
+    NOT_PUBLISHED = 'not_published'
+    # The deadline is passed and there is still no report, e.g., the company wasn't listed yet.
+    NO_REPORT = 'no_report'
+    # MOPS answered with neither the report nor its no-data page, e.g., an error or a maintenance page.
+    UNRECOGNIZED_PAGE = 'unrecognized_page'
+
+
+class MissingEntry(NamedTuple):
+    reason: MissingReason
+    recorded_at: float
+    expires_at: float
+
+
+class NegativeReportCache(object):
+    """
+    Remembers the reports MOPS doesn't have, so they aren't requested again before the entry expires. The entries
+    near a publication deadline expire soon, since the report can show up any day; the entries long after the
+    deadline are kept for long_ttl seconds, and the ones of unrecognized pages for transient_ttl. The entries are kept in an append-only JSON lines file, the last line of
+    a unit wins.
+    """
+
+    def __init__(self, file_path: str, short_ttl: float = 6 * 3600, long_ttl: float = 30 * 86400,
+                 deadline_margin: timedelta = timedelta(days=14), transient_ttl: float = 3600):
+        self.file_path = file_path
+        self.short_ttl = short_ttl
+        self.long_ttl = long_ttl
+        self.transient_ttl = transient_ttl
+        # Late and corrected reports still show up for a while after the deadline.
+        self.deadline_margin = deadline_margin
+        self.entries: Dict[Unit, MissingEntry] = {}
+        self.__lock = threading.Lock()
+        folder = path.dirname(file_path)
+        if folder:
+            makedirs(folder, exist_ok=True)
+        self.__load()
+
+    def __load(self):
+        if not path.exists(self.file_path):
+            return
+        with open(self.file_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line may be cut by a crash.
+                    continue
+                unit = tuple(entry['unit'])
+                if entry.get('reason') is None:
+                    self.entries.pop(unit, None)
+                else:
+                    self.entries[unit] = MissingEntry(MissingReason(entry['reason']), entry['at'], entry['expires'])
+
+    def __append(self, entry: dict):
+        with open(self.file_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+
+    def classify(self, year: int, season: int, now: Optional[float] = None) -> Tuple[MissingReason, float]:
+        # The reason a report of the season is missing now, and when to ask MOPS again.
+        now = now if now is not None else time.time()
+        season_end = DateTool.season_end(year, season).timestamp()
+        if now < season_end:
+            return MissingReason.SEASON_NOT_ENDED, season_end
+
+        deadline = DateTool.season_report_deadline(year, season)
+        if now <= deadline.timestamp():
+            return MissingReason.NOT_PUBLISHED, now + self.short_ttl
+        if now <= (deadline + self.deadline_margin).timestamp():
+            return MissingReason.NO_REPORT, now + self.short_ttl
+        return MissingReason.NO_REPORT, now + self.long_ttl
+
+    def get(self, stock_id: str, year: int, season: int, report_type: str) -> Optional[MissingEntry]:
+        entry = self.entries.get((stock_id, year, season, report_type))
+        if entry is None or entry.expires_at <= time.time():
+            return None
+        return entry
+
+    def is_missing(self, stock_id: str, year: int, season: int, report_type: str) -> bool:
+        return self.get(stock_id, year, season, report_type) is not None
+
+    def record(self, stock_id: str, year: int, season: int, report_type: str,
+               reason: Optional[MissingReason] = None) -> MissingEntry:
+        now = time.time()
+        classified_reason, expires_at = self.classify(year, season, now)
+        if reason is MissingReason.UNRECOGNIZED_PAGE:
+            expires_at = now + self.transient_ttl
+        entry = MissingEntry(reason if reason else classified_reason, now, expires_at)
+        unit = (stock_id, year, season, report_type)
+        with self.__lock:
+            self.__append({'unit': list(unit), 'reason': entry.reason.value, 'at': now, 'expires': expires_at})
+            self.entries[unit] = entry
+        return entry
+
+    def forget(self, stock_id: str, year: int, season: int, report_type: str):
+        unit = (stock_id, year, season, report_type)
+        with self.__lock:
+            if self.entries.pop(unit, None) is not None:
+                self.__append({'unit': list(unit), 'reason': None, 'at': time.time()})
+
+    def compact(self):
+        # Rewrites the file with the entries not expired yet.
+        now = time.time()
+        tmp_file_path = f'{self.file_path}.tmp'
+        with self.__lock:
+            self.entries = {unit: entry for unit, entry in self.entries.items() if entry.expires_at > now}
+            with open(tmp_file_path, 'w', encoding='utf-8') as f:
+                for unit, entry in self.entries.items():
+                    f.write(json.dumps({'unit': list(unit), 'reason': entry.reason.value,
+                                        'at': entry.recorded_at, 'expires': entry.expires_at}) + '\n')
+            replace(tmp_file_path, self.file_path)
@@ -0,0 +1,77 @@
+from typing import AbstractSet, Dict, Iterable, Optional
+import logging
+import pickle
+import zlib
+
+from twfrpumper.reports.financial_reports.ixbrl_parser import PARSER_VERSION
+from twfrpumper.toolbox.cache_store import CacheStore, FileCacheStore
+
+
+class ParsedReport(object):
+    def __init__(self, company_name: str, sheets: Dict[str, dict], dollar_units: Dict[str, int],
+                 items: Optional[Iterable[str]] = None, units_applied: bool = False):
+        # sheets: {Sheet.ID: dict_format}, dollar_units: {Sheet.ID: dollar unit}
+        self.company_name = company_name
+        self.sheets = sheets
+        self.dollar_units = dollar_units
+        # The account codes the sheets were parsed for, None if all of them
+        self.items: Optional[AbstractSet[str]] = frozenset(items) if items is not None else None
+        # The values were multiplied by their dollar units when they were parsed
+        self.units_applied = units_applied
+
+    def covers(self, items: Optional[AbstractSet[str]]) -> bool:
+        if self.items is None:
+            return True
+        return items is not None and items <= self.items
+
+    def select(self, items: Optional[AbstractSet[str]]) -> 'ParsedReport':
+        # Only the rows of the items, the report itself if it has no other rows.
+        if items is None or self.items == items:
+            return self
+        sheets = {sheet_id: {code: row for code, row in dict_format.items() if code in items}
+                  for sheet_id, dict_format in self.sheets.items()}
+        return ParsedReport(self.company_name, sheets, self.dollar_units, items, self.units_applied)
+
+
+class ParsedReportCache(object):
+    """
+    The second cache tier of FinancialReportAgent. It keeps the parsed sheets of a report as a compressed pickle,
+    so a cached report is never parsed again. Entries written by another PARSER_VERSION are treated as missing.
+    An entry parsed for some items only serves the requests for a subset of them.
+    """
+
+    def __init__(self, file_folder="./tmp/parsed/", store: Optional[CacheStore] = None):
+        self.file_folder = file_folder
+        self.store = store if store else FileCacheStore(file_folder)
+
+    @staticmethod
+    def key(stock_id: str, year: int, season: int, report_type: str) -> str:
+        return f'{stock_id}_{report_type}_{year}_{season}.pkl.z'
+
+    def exists(self, stock_id: str, year: int, season: int, report_type: str) -> bool:
+        return self.store.exists(self.key(stock_id, year, season, report_type))
+
+    def get(self, stock_id: str, year: int, season: int, report_type: str) -> Optional[ParsedReport]:
+        key = self.key(stock_id, year, season, report_type)
+        data = self.store.get(key)
+        if data is None:
+            return None
+
+        try:
+            entry = pickle.loads(zlib.decompress(data))
+        except Exception as e:
+            logging.warning(f"Can't read the parsed report: {key}, {e!r}")
+            return None
+
+        if entry[0] != PARSER_VERSION:
+            return None
+
+        _, company_name, sheets, dollar_units, items, units_applied = entry
+        return ParsedReport(company_name, sheets, dollar_units, items, units_applied)
+
+    def put(self, stock_id: str, year: int, season: int, report_type: str, parsed_report: ParsedReport):
+        self.store.put(self.key(stock_id, year, season, report_type), zlib.compress(pickle.dumps(
+            (PARSER_VERSION, parsed_report.company_name, parsed_report.sheets, parsed_report.dollar_units,
+             parsed_report.items, parsed_report.units_applied),
+            protocol=pickle.HIGHEST_PROTOCOL
+        )))
@@ -0,0 +1,54 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+class ReportIndex(object):
+    """
+    Row positions of FRPool.report_df by item and by code, built once per frame. The slices by item are sorted by
+    y_and_s and cached until the frame changes (FRPool drops the index whenever report_df is replaced).
+    """
+
+    def __init__(self, report_df: pd.DataFrame):
+        self.report_df = report_df
+        self.__item_positions: Optional[Dict[str, np.ndarray]] = None
+        self.__code_positions: Optional[Dict[str, np.ndarray]] = None
+        self.__item_frames: Dict[str, pd.DataFrame] = {}
+        self.__items: Optional[List[list]] = None
+
+    @staticmethod
+    def __group_positions(column: pd.Series) -> Dict[str, np.ndarray]:
+        codes, uniques = pd.factorize(column, sort=False)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        return {str(key): order[bounds[idx]:bounds[idx + 1]] for idx, key in enumerate(uniques)}
+
+    def item_positions(self, item: str) -> np.ndarray:
+        if self.__item_positions is None:
+            self.__item_positions = self.__group_positions(self.report_df['item'])
+        return self.__item_positions.get(item, np.empty(0, dtype=np.intp))
+
+    def code_positions(self, code: str) -> np.ndarray:
+        if self.__code_positions is None:
+            self.__code_positions = self.__group_positions(self.report_df['code'])
+        return self.__code_positions.get(str(code), np.empty(0, dtype=np.intp))
+
+    def item_frame(self, item: str) -> pd.DataFrame:
+        # The cached frame is shared, copy it before changing it.
+        if item not in self.__item_frames:
+            item_df = self.report_df.iloc[self.item_positions(item)]
+            self.__item_frames[item] = item_df.sort_values(by=['y_and_s'], kind='stable')
+        return self.__item_frames[item]
+
+    def code_frame(self, code: str) -> pd.DataFrame:
+        return self.report_df.iloc[self.code_positions(code)]
+
+    def get(self, item: str, code: str) -> pd.DataFrame:
+        item_df = self.item_frame(item)
+        return item_df[item_df['code'] == code]
+
+    def items(self) -> List[list]:
+        if self.__items is None:
+            self.__items = self.report_df[['item', 'zh', 'en']].drop_duplicates().values.tolist()
+        return self.__items
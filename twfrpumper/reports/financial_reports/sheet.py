@@ -9,6 +9,7 @@ class Sheet(abc.ABC):
         self.magic_id = ""
         self.dollar_unit = 0
         self.sheet = None
+        self.parsed = None
 
     def set_dollar_unit(self, dollar_unit):
         self.dollar_unit = dollar_unit
@@ -21,6 +22,10 @@ class Sheet(abc.ABC):
 
     @cached_property
     def dict_format(self):
+        if self.parsed is not None:
+            # Already read by the IXBRLSheetParser
+            return self.parsed
+
         result = {}
         row_codes = self.sheet.find_all('td', attrs={'style': 'text-align:center'})
         for row_code in row_codes:
@@ -0,0 +1,87 @@
+from array import array
+from typing import Dict, Tuple
+import sys
+
+from twfrpumper.toolbox.memory_tool import deep_getsizeof
+
+
+class SlimSheet(object):
+    """
+    Keeps only the numbers of a sheet. The values of all rows live in one array, the labels are interned, so they
+    are shared by every report of a pool.
+    """
+    __slots__ = ('ID', 'dollar_unit', 'codes', 'zh', 'en', 'offsets', 'values')
+
+    def __init__(self, sheet_id: str, dict_format: dict, dollar_unit: int = 0):
+        self.ID = sheet_id
+        self.dollar_unit = dollar_unit
+        self.codes = tuple(sys.intern(code) for code in dict_format)
+        self.zh = tuple(sys.intern(row['zh']) for row in dict_format.values())
+        self.en = tuple(sys.intern(row['en']) for row in dict_format.values())
+        self.values = array('d')
+        offsets = array('I', [0])
+        for row in dict_format.values():
+            self.values.extend(row['values'])
+            offsets.append(len(self.values))
+        self.offsets = offsets
+
+    @property
+    def dict_format(self) -> dict:
+        # Built on demand, the result is not kept.
+        result = {}
+        offsets = self.offsets
+        for idx, code in enumerate(self.codes):
+            result[code] = {
+                'zh': self.zh[idx],
+                'en': self.en[idx],
+                'values': self.values[offsets[idx]:offsets[idx + 1]].tolist()
+            }
+        return result
+
+    def set_dollar_unit(self, dollar_unit):
+        self.dollar_unit = dollar_unit
+
+
+class SlimFinancialReport(object):
+    __slots__ = ('stock_id', 'company_name', 'year', 'season', 'report_type',
+                 'balance_sheet', 'ci_sheet', 'cash_flows', 'key', '_hash')
+    # The DOM is released after parsing.
+    soup = None
+
+    def __init__(self,
+                 stock_id: str,
+                 company_name: str,
+                 year: int,
+                 season: int,
+                 report_type: str,
+                 balance_sheet: SlimSheet,
+                 ci_sheet: SlimSheet,
+                 cash_flows: SlimSheet):
+        self.stock_id = stock_id
+        self.company_name = company_name
+        self.year = year
+        self.season = season
+        self.report_type = report_type
+        self.balance_sheet = balance_sheet
+        self.ci_sheet = ci_sheet
+        self.cash_flows = cash_flows
+        self.key: Tuple[str, int, int, str] = (stock_id, year, season, report_type)
+        self._hash = hash(self.key)
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        return self.key == getattr(other, 'key', None)
+
+    def memory_usage(self) -> int:
+        return deep_getsizeof(self)
+
+    def __getstate__(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__ if slot != '_hash'}
+
+    def __setstate__(self, state: Dict):
+        for slot, value in state.items():
+            setattr(self, slot, value)
+        # str hashes are salted per process
+        self._hash = hash(self.key)
@@ -1,14 +1,19 @@
+from typing import TYPE_CHECKING
+
 from twfrpumper.reports.financial_reports.sheet import Sheet
-from bs4 import BeautifulSoup
+
+if TYPE_CHECKING:
+    from bs4 import BeautifulSoup
 
 
 class StatementsOfCashFlows(Sheet):
     ID = 'StatementsOfCashFlows'
 
-    def __init__(self, sheet: BeautifulSoup):
+    def __init__(self, sheet: 'BeautifulSoup', parsed: dict = None):
         self.magic_id = ''
         self.sheet = sheet
         self.dollar_unit = 0
+        self.parsed = parsed
 
     def magic_id(self):
         return 'StatementsOfCashFlows'
\ No newline at end of file
@@ -1,18 +1,18 @@
-import requests
 import io
-from os.path import exists, isdir, join
-from os import makedirs
 from datetime import date, datetime, timedelta
 
 from enum import Enum
-from typing import Union
-import time
-import random
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional, Tuple, Union
+import hashlib
 import logging
-
-import pandas as pd
+import threading
+import time
 
 from twfrpumper.toolbox.date_tool import DateTool
+from twfrpumper.toolbox.fetch_engine import FetchEngine, FetchResult
+from twfrpumper.toolbox.http_transport import HttpTransport, TransportError
+from twfrpumper.toolbox.cache_store import CacheStore, FileCacheStore
+from twfrpumper.toolbox.stats import NULL_STATS, Stats
 
 
 class MarketType(Enum):
@@ -79,71 +79,152 @@ class MonthlyRevenueReport(object):
         return self.__hash__() == other.__hash__()
 
 
+class _MemoEntry(NamedTuple):
+    digest: bytes
+    created: float
+    published: Optional[datetime]
+    report: MonthlyRevenueReport
+
+
 class MonthlyRevenueAgent(object):
     FILE_PATH_MAPPING = {
         MarketType.LISTED_STOCK: '/t21/sii/',
         MarketType.OTC_MARKET: '/t21/otc/'
     }
 
-    def __init__(self, delay_initial=1, delay_max=3, file_folder="./tmp/monthly_revenue"):
+    BASE_URL = 'https://mops.twse.com.tw'
+    DOWNLOAD_PATH = '/server-java/FileDownLoad'
+
+    def __init__(self, delay_initial=1, delay_max=3, file_folder="./tmp/monthly_revenue",
+                 transport: Optional[HttpTransport] = None, base_url=None, cache_store: Optional[CacheStore] = None,
+                 recent_ttl: float = 600, max_workers=4, stats: Optional[Stats] = None):
         self.delay_initial = delay_initial
         self.delay_max = delay_max
         self.file_folder = file_folder
+        # The stages (mr.*, http.*) and the counters of the agent, nothing is recorded by default.
+        self.stats = stats if stats else NULL_STATS
+        self.cache_store = cache_store if cache_store else FileCacheStore(file_folder)
+        if transport is None:
+            # The same average pace as the old random delay between delay_initial and delay_max seconds
+            max_rps = 2 / (delay_initial + delay_max) if delay_initial + delay_max > 0 else 0
+            transport = HttpTransport(max_rps=max_rps, pool_size=max_workers, stage_stats=self.stats)
+        self.transport = transport
+        self.engine = FetchEngine(max_workers=max_workers)
+        self.base_url = base_url if base_url else self.BASE_URL
         self.today = date.today()
-        if not (exists(self.file_folder) and isdir(self.file_folder)):
-            makedirs(self.file_folder, exist_ok=True)
+        # The reports of the recent months can still change, their files are downloaded again after recent_ttl
+        # seconds. The parsed reports are kept in memory until their content changes.
+        self.recent_ttl = recent_ttl
+        self.__memo: Dict[str, _MemoEntry] = {}
+        self.__memo_lock = threading.Lock()
 
     def get_report(self, year, month, market=MarketType.LISTED_STOCK):
-        for_pd_csv = None
-        tw_year = DateTool.to_tw_year(year)
-        report_file_name = join(self.file_folder, f'monthly_revenue_{year}_{month}_{market.value}.html')
+        with self.stats.stage('mr.get_report'):
+            report = self.__get_report(year, month, market)
+        if report:
+            self.stats.incr('mr.reports')
+        return report
+
+    def __get_report(self, year, month, market):
+        stats = self.stats
+        report_key = f'monthly_revenue_{year}_{month}_{market.value}.html'
+        cached_content = None
+        info = self.cache_store.info(report_key)
+        if info is not None:
+            memo = self.__memo.get(report_key)
+            if memo and memo.created == info.created and self.is_fresh(memo.published, info.created):
+                stats.incr('mr.memo.hits')
+                return memo.report
+
+            with stats.stage('mr.cache_read'):
+                cached_bytes = self.cache_store.get(report_key)
+            if cached_bytes is not None:
+                cached_content = cached_bytes.decode('utf-8')
+                published = self.published_date(cached_content, year, month)
+                if published and self.is_fresh(published, info.created):
+                    stats.incr('mr.cache.hits')
+                    return self.__memoize(report_key, cached_content, info.created, published, year, month, market)
+                # Out of its TTL, revalidated below
+                stats.incr('mr.cache.stale')
+        stats.incr('mr.cache.misses')
 
-        if exists(report_file_name):
-            for_pd_csv = report_file_name
-        else:
-            resp = requests.post(
-                url='https://mops.twse.com.tw/server-java/FileDownLoad',
-                data={
-                    'step': '9',
-                    'functionName': 'show_file2',
-                    'filePath': self.FILE_PATH_MAPPING[market],
-                    'fileName': f't21sc03_{tw_year}_{month}.csv'
-                }
-            )
-            time.sleep(random.randint(self.delay_initial, self.delay_max))
-
-            resp.encoding = 'utf-8'
-            resp_len = len(resp.text)
-            if resp.text[:2] == '﻿出' and resp_len > 136:
-                _, _, rp_day = resp.text[136:147].strip('"').split('/')
-                rp_date_str = f'{DateTool.tw_year_to_year(int(tw_year))}/{month}/{rp_day}'
-                rp_date = datetime.strptime(rp_date_str, f"%Y/%m/%d")
-                today_datetime = datetime.combine(self.today, datetime.min.time())
-
-                for_pd_csv = io.StringIO(resp.content.decode('utf-8'))
-
-                if today_datetime > rp_date + timedelta(days=30):
-                    with open(report_file_name, 'w') as f:
-                        f.write(resp.text)
-                else:
-                    return MonthlyRevenueReport(
+        try:
+            with stats.stage('mr.download'):
+                resp = self.transport.post(
+                    f'{self.base_url}{self.DOWNLOAD_PATH}',
+                    data={
+                        'step': '9',
+                        'functionName': 'show_file2',
+                        'filePath': self.FILE_PATH_MAPPING[market],
+                        'fileName': f't21sc03_{DateTool.to_tw_year(year)}_{month}.csv'
+                    },
+                    encoding='utf-8'
+                )
+            content = resp.text
+        except TransportError as e:
+            content = None
+            logging.warning(f"Can't get: {year}-{month} monthly report, {e}")
+
+        published = self.published_date(content, year, month) if content else None
+        if published is None:
+            if cached_content is not None:
+                # Better the last copy than nothing, it will be revalidated next time.
+                logging.warning(f"Can't revalidate: {year}-{month} monthly report, use the cached one")
+                return self.__memoize(report_key, cached_content, info.created, self.published_date(
+                    cached_content, year, month), year, month, market)
+            if content is not None:
+                logging.warning(f"Can't get: {year}-{month} monthly report")
+            return None
+
+        # The recent reports are cached too, they are revalidated once their TTL is over.
+        with stats.stage('mr.cache_write'):
+            self.cache_store.put(report_key, content.encode('utf-8'))
+        created = self.cache_store.info(report_key).created
+        return self.__memoize(report_key, content, created, published, year, month, market)
+
+    def __memoize(self, report_key: str, content: str, created: float, published: Optional[datetime],
+                  year: int, month: int, market: MarketType) -> MonthlyRevenueReport:
+        digest = hashlib.sha1(content.encode('utf-8')).digest()
+        with self.__memo_lock:
+            memo = self.__memo.get(report_key)
+            if memo and memo.digest == digest:
+                # The content didn't change, the parsed report is still good.
+                report = memo.report
+            else:
+                # pandas is loaded with the first report, the workers which only download don't pay for it.
+                import pandas as pd
+                with self.stats.stage('mr.csv_parse'):
+                    report = MonthlyRevenueReport(
                         year=year,
                         month=month,
-                        report_df=pd.read_csv(for_pd_csv),
+                        report_df=pd.read_csv(io.StringIO(content)),
                         market=market
                     )
-            else:
-                logging.warning(f"Can't get: {year}-{month} monthly report")
-                return None
+            self.__memo[report_key] = _MemoEntry(digest, created, published, report)
+        return report
+
+    def is_fresh(self, published: Optional[datetime], created: float) -> bool:
+        # The files downloaded 30 days after the report date are final, the others are good for recent_ttl seconds.
+        if published and created > (published + timedelta(days=30)).timestamp():
+            return True
+        return time.time() - created < self.recent_ttl
+
+    @staticmethod
+    def published_date(content: str, year: int, month: int) -> Optional[datetime]:
+        # The report date in the header of the csv, None if the content isn't a monthly revenue report.
+        if content[:2] != '\ufeff出' or len(content) <= 136:
+            return None
+        _, _, rp_day = content[136:147].strip('"').split('/')
+        return datetime.strptime(f'{year}/{month}/{rp_day}', f"%Y/%m/%d")
 
-        return MonthlyRevenueReport(
-            year=year,
-            month=month,
-            report_df=pd.read_csv(for_pd_csv),
-            market=market
-        )
+    def iter_reports(self, units: Iterable[Tuple[int, int, MarketType]]) -> Iterator[FetchResult]:
+        # units: (year, month, market). Results are yielded as soon as they are finished, all the workers share the
+        # rate limit of the host.
+        return self.engine.run(self.get_report, units)
 
     def get_last_month_report(self, market=MarketType.LISTED_STOCK):
+        # A long-running agent moves on to the next month by itself.
+        self.today = date.today()
         if self.today.month == 1:
             year, mon = (self.today.year - 1, 12)
         else:
@@ -0,0 +1,63 @@
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from twfrpumper.reports.monthly_revenue.monthly_revenue_agent import MarketType, MonthlyRevenueReport
+from twfrpumper.toolbox.df_tool import concat_keep_categories
+
+CATEGORICAL_COLUMNS = ('code', 'industry')
+NUMERIC_COLUMNS = ('operating_revenue', 'or_prev_mon', 'or_prev_year', 'or_vs_pm', 'or_vs_py', 'acc_or',
+                   'acc_or_prev_year', 'acc_or_vs_prev_year')
+# The members in the order of their values, so sorting by market_type sorts by MarketType.value.
+MARKET_TYPE_DTYPE = pd.CategoricalDtype(categories=list(MarketType))
+
+
+def _market_code(market: MarketType) -> int:
+    return MARKET_TYPE_DTYPE.categories.get_loc(market)
+
+
+def normalize_frame(df: pd.DataFrame) -> pd.DataFrame:
+    # The dtypes every frame of a MRPool has: the numbers as float64 (the csv has some '-' and blank cells) and the
+    # repeated strings as categoricals.
+    df = df.copy(deep=False)
+    for column in NUMERIC_COLUMNS:
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype('float64')
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype('category')
+    if 'market_type' in df.columns and df['market_type'].dtype != MARKET_TYPE_DTYPE:
+        df['market_type'] = pd.Categorical(list(df['market_type']), dtype=MARKET_TYPE_DTYPE)
+    if 'y_and_m' in df.columns:
+        df['y_and_m'] = df['y_and_m'].astype(str)
+    return df
+
+
+def build_report_df(reports: Iterable[MonthlyRevenueReport], report_df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    """
+    Adds the reports to report_df with a single concat. The rows of a (y_and_m, market_type) already in report_df
+    are replaced, and the result is ordered by y_and_m, market_type and then the rows of each csv, no matter in
+    which order the reports come.
+    """
+    reports = sorted(reports, key=lambda report: (report.str_y_and_m, report.market.value))
+    if not reports:
+        return report_df
+
+    frames = []
+    if report_df is not None and not report_df.empty:
+        new_keys = pd.MultiIndex.from_tuples([(report.str_y_and_m, _market_code(report.market)) for report in reports])
+        old_keys = pd.MultiIndex.from_arrays([report_df['y_and_m'].astype(str),
+                                              normalize_frame(report_df[['market_type']])['market_type'].cat.codes])
+        frames.append(report_df[~old_keys.isin(new_keys)])
+
+    # The csv frames are concatenated as they are and converted once, converting each small frame costs more than
+    # the concat itself.
+    added_df = pd.concat([report.report_df for report in reports], ignore_index=True)
+    market_codes = np.repeat([_market_code(report.market) for report in reports],
+                             [len(report.report_df) for report in reports])
+    added_df['market_type'] = pd.Categorical.from_codes(market_codes, dtype=MARKET_TYPE_DTYPE)
+    frames.append(normalize_frame(added_df))
+
+    new_df = concat_keep_categories(frames, CATEGORICAL_COLUMNS)
+    return new_df.sort_values(by=['y_and_m', 'market_type'], kind='stable', ignore_index=True)
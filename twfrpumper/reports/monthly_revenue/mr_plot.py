@@ -0,0 +1,31 @@
+"""
+The charts of MRPool. Only imported when a chart is drawn, the data core never loads plotly.
+"""
+from typing import Iterable
+
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objs as go
+
+
+def draw_item(item_df: pd.DataFrame, item: str, title: str):
+    fig = px.line(item_df,
+                  x='y_and_m',
+                  y=item,
+                  color='company_name',
+                  title=title)
+    fig.show()
+
+
+def draw_overview(pivot_item_df: pd.DataFrame, industries: Iterable[str]):
+    # pivot_item_df: (month x industry), the industries are drawn in the given order.
+    fig = go.Figure()
+    for industry in industries:
+        fig.add_trace(go.Scatter(x=pivot_item_df.index, y=pivot_item_df[industry].values,
+                                 name = industry,
+                                 mode = 'markers+lines',
+                                 line=dict(shape='linear'),
+                                 connectgaps=True))
+
+    fig.update_layout(title = "Overview for All Industries")
+    fig.show()
@@ -1,14 +1,20 @@
 from dataclasses import dataclass
-from typing import List
+from os import path
+from typing import Callable, Iterable, List, Optional, Union
+import logging
 
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objs as go
-import numpy as np
 
 from twfrpumper.reports.monthly_revenue.monthly_revenue_agent import MonthlyRevenueAgent
 from twfrpumper.reports.monthly_revenue.monthly_revenue_agent import MonthlyRevenueReport
 from twfrpumper.reports.monthly_revenue.monthly_revenue_agent import MarketType
+from twfrpumper.reports.monthly_revenue.mr_df_builder import CATEGORICAL_COLUMNS, build_report_df, normalize_frame
+from twfrpumper.reports.monthly_revenue.mr_screener import MRScreener
+from twfrpumper.toolbox.df_tool import concat_keep_categories
+from twfrpumper.toolbox.date_tool import DateTool
+from twfrpumper.toolbox.trend_tool import linear_trend, rolling_linear_trend
+from twfrpumper.toolbox.parquet_tool import build_filters, load_partitioned, save_partitioned
+from twfrpumper.toolbox.stats import Stats
 
 ITEM_ZH_MAPPING = {
     'operating_revenue': '營業收入-當月營收',
@@ -33,37 +39,93 @@ class DFRecord:
 
 
 class MRPool(object):
-    def __init__(self, delay_initial, delay_max):
-        self.__agent = MonthlyRevenueAgent(delay_initial=delay_initial, delay_max=delay_max)
+    def __init__(self, delay_initial, delay_max, max_workers=4, agent: Optional[MonthlyRevenueAgent] = None,
+                 stats: Optional[Stats] = None):
+        self.__agent = agent if agent else MonthlyRevenueAgent(delay_initial=delay_initial, delay_max=delay_max,
+                                                               max_workers=max_workers, stats=stats)
+        # Shared with the agent it creates, the stages of the pool are mr_pool.*
+        self.stats = stats if stats else self.__agent.stats
         self.reports = set()
+        # The reports already in report_df
+        self.__organized_reports = set()
         self.organized_report = {}
-        self.report_df = None
+        self.__report_df = None
+        self.__screener = None
         self.name_mapping = {}
 
+    @property
+    def report_df(self) -> Optional[pd.DataFrame]:
+        return self.__report_df
+
+    @report_df.setter
+    def report_df(self, report_df: Optional[pd.DataFrame]):
+        self.__report_df = report_df
+        self.__screener = None
+
+    @property
+    def screener(self) -> MRScreener:
+        # Rebuilt on first use after report_df changes.
+        if self.__screener is None:
+            with self.stats.stage('mr_pool.screener'):
+                self.__screener = MRScreener(self.__report_df)
+        return self.__screener
+
     def add_report(self, report: MonthlyRevenueReport):
         if report:
             self.reports.add(report)
 
     def add_range_reports(self, start_y: int, start_m: int, end_y: int, end_m: int,
-                          market_type: MarketType = MarketType.LISTED_STOCK):
-        start_y_m = start_y * 100 + start_m
-        end_y_m = end_y * 100 + end_m
-        while start_y_m <= end_y_m:
-            self.add_report(self.__agent.get_report(start_y, start_m, market_type))
-            start_m += 1
-            if start_m == 13:
-                start_m = 1
-                start_y += 1
-            start_y_m = start_y * 100 + start_m
+                          market_type: Union[MarketType, Iterable[MarketType]] = MarketType.LISTED_STOCK,
+                          callback: Optional[Callable[[MonthlyRevenueReport], None]] = None
+                          ) -> List[MonthlyRevenueReport]:
+        # The months of all the markets are fetched concurrently and added as they arrive. The returned list (and
+        # report_df after organize_reports) is in the order of (month, market) whatever the download order was.
+        markets = [market_type] if isinstance(market_type, MarketType) else list(market_type)
+        units = [(year, month, market) for year, month in DateTool.month_range(start_y, start_m, end_y, end_m)
+                 for market in markets]
+        added = []
+        for fetch_result in self.__agent.iter_reports(units):
+            report = fetch_result.result
+            if report:
+                self.add_report(report)
+                added.append(report)
+                if callback:
+                    callback(report)
+        return sorted(added, key=lambda report: (report.str_y_and_m, report.market.value))
 
     def organize_reports(self):
-        list_r = list(self.reports)
-        if not list_r:
+        # Only the reports added since the last call are built, then merged with report_df in one concat.
+        new_reports = [report for report in self.reports if report not in self.__organized_reports]
+        if not new_reports:
             return None
-        self.report_df = list_r[0].report_df
-        for i in range(1, len(list_r)):
-            self.report_df = pd.concat([self.report_df, list_r[i].report_df], ignore_index=True)
-
+        with self.stats.stage('mr_pool.build_df'):
+            self.report_df = build_report_df(new_reports, self.report_df)
+        self.stats.incr('mr_pool.reports_organized', len(new_reports))
+        self.__organized_reports.update(new_reports)
+
+    def save_as_parquet(self, folder: str):
+        # MarketType members are kept by name, parquet can't store enum objects.
+        saved_df = self.report_df.assign(
+            market_type=self.report_df['market_type'].astype(object).map(lambda market: market.name))
+        save_partitioned(saved_df, folder, saved_df['code'], saved_df['y_and_m'].str[:4],
+                         sort_by=['industry', 'y_and_m'])
+
+    def load_parquet(self, folder: str, codes: Optional[Iterable[int]] = None, years: Optional[Iterable[int]] = None,
+                     industries: Optional[Iterable[str]] = None, columns: Optional[List[str]] = None):
+        if not path.isdir(folder):
+            logging.error(f'{folder} is not exist or not a folder.')
+            return
+
+        loaded_df = load_partitioned(folder, columns, build_filters(codes, years, industry=industries))
+        if 'market_type' in loaded_df.columns:
+            loaded_df['market_type'] = loaded_df['market_type'].astype(str).map(lambda name: MarketType[name])
+        loaded_df = normalize_frame(loaded_df)
+        if self.report_df is None or columns is not None:
+            self.report_df = loaded_df
+        else:
+            self.report_df = concat_keep_categories([self.report_df, loaded_df], CATEGORICAL_COLUMNS).drop_duplicates(
+                subset=['code', 'y_and_m', 'market_type'], keep='last').sort_values(
+                by=['y_and_m', 'market_type'], kind='stable', ignore_index=True)
 
     def draw(self, item, company_codes, title_lang=True):
         title = item
@@ -71,50 +133,51 @@ class MRPool(object):
             title = ITEM_ZH_MAPPING[item]
 
         item_df = self.report_df[self.report_df.code.isin(company_codes)].sort_values(by=['y_and_m'])
-
-        fig = px.line(item_df,
-                      x='y_and_m',
-                      y=item,
-                      color='company_name',
-                      title=title)
-        fig.show()
+        # plotly is loaded on the first chart, the pool itself doesn't need it.
+        from twfrpumper.reports.monthly_revenue.mr_plot import draw_item
+        draw_item(item_df, item, title)
+
+    def pivot(self, item: str = 'operating_revenue', by: str = 'industry', aggfunc: str = 'sum') -> pd.DataFrame:
+        # (month x industry or code), every month from the first to the last one has a row, NaN if it has no data.
+        pivot_df = pd.pivot_table(self.report_df[[by, item, 'y_and_m']],
+                                  values=item,
+                                  index='y_and_m',
+                                  columns=by,
+                                  aggfunc=aggfunc,
+                                  observed=True)
+        first_y_and_m, last_y_and_m = int(pivot_df.index.min()), int(pivot_df.index.max())
+        months = DateTool.month_range(first_y_and_m // 100, first_y_and_m % 100, last_y_and_m // 100,
+                                      last_y_and_m % 100)
+        return pivot_df.reindex([f'{year * 100 + month}' for year, month in months])
+
+    def trends(self, item: str = 'operating_revenue', by: str = 'industry', aggfunc: str = 'sum',
+               only_positive=False) -> pd.DataFrame:
+        # The slope and the intercept (per month) of every industry or company, fitted all at once. The months
+        # without data are left out of the fit.
+        pivot_df = self.pivot(item, by, aggfunc)
+        trend = linear_trend(pivot_df.to_numpy())
+        trend_df = pd.DataFrame({'slope': trend.slope, 'intercept': trend.intercept, 'points': trend.points},
+                                index=pivot_df.columns)
+        if only_positive:
+            trend_df = trend_df[trend_df['slope'] > 0]
+        return trend_df.sort_values(by='slope', ascending=False, kind='stable')
+
+    def rolling_trends(self, window: int = 12, item: str = 'operating_revenue', by: str = 'industry',
+                       aggfunc: str = 'sum', min_periods: Optional[int] = None) -> pd.DataFrame:
+        # The slope of the last window months, for every month and every industry or company.
+        pivot_df = self.pivot(item, by, aggfunc)
+        trend = rolling_linear_trend(pivot_df.to_numpy(), window, min_periods)
+        return pd.DataFrame(trend.slope, index=pivot_df.index, columns=pivot_df.columns)
 
     def overview(self, aggfunc: str='sum', only_positive=False) -> List:
-        overview = self.report_df[['industry', 'operating_revenue', 'y_and_m']]
-
-        item_df = overview.sort_values(by=['y_and_m'])
-        pivot_item_df = pd.pivot_table(item_df,
-                      values='operating_revenue',
-                      index='y_and_m',
-                      columns='industry',
-                      aggfunc=aggfunc)
-        fig = go.Figure()
-
-        industries_slope_intercept = []
-
-        for industry in pivot_item_df.columns:
-            x_seq = np.arange(pivot_item_df[industry].size)
-            slope, intercept = np.polyfit(x_seq, pivot_item_df[industry].values, 1)
-
-            if slope <= 0 and only_positive:
-                continue
-
-            fig.add_trace(go.Scatter(x=pivot_item_df.index, y=pivot_item_df[industry].values,
-                                     name = industry,
-                                     mode = 'markers+lines',
-                                     line=dict(shape='linear'),
-                                     connectgaps=True))
-
-            industries_slope_intercept.append({
-                'name': industry,
-                'slope': slope,
-                'intercept': intercept
-            })
-            
-        fig.update_layout(title = "Overview for All Industries")
-        fig.show()
-        return sorted(industries_slope_intercept, key=lambda industry: industry['slope'], reverse=True)
-    
+        pivot_item_df = self.pivot('operating_revenue', 'industry', aggfunc)
+        trend_df = self.trends('operating_revenue', 'industry', aggfunc, only_positive)
+
+        from twfrpumper.reports.monthly_revenue.mr_plot import draw_overview
+        draw_overview(pivot_item_df, trend_df.index)
+        return [{'name': industry, 'slope': row.slope, 'intercept': row.intercept}
+                for industry, row in trend_df.iterrows()]
+
 
 if __name__ == "__main__":
     mr_pool = MRPool(5,10)
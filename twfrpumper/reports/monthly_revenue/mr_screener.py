@@ -0,0 +1,145 @@
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from twfrpumper.toolbox.date_tool import DateTool
+
+# The items kept as (month x code) matrices
+MATRIX_ITEMS = ('operating_revenue', 'or_vs_py', 'acc_or')
+
+
+def _shift(matrix: np.ndarray, periods: int) -> np.ndarray:
+    # The values of periods months ago, NaN before the first month.
+    shifted = np.full(matrix.shape, np.nan)
+    if periods < matrix.shape[0]:
+        shifted[periods:] = matrix[:matrix.shape[0] - periods]
+    return shifted
+
+
+def _rolling_sum(matrix: np.ndarray, window: int) -> np.ndarray:
+    # The sum of the last window months, NaN if any of them is missing.
+    if window == 1:
+        return matrix
+    summed = np.full(matrix.shape, np.nan)
+    if window <= matrix.shape[0]:
+        summed[window - 1:] = sliding_window_view(matrix, window, axis=0).sum(axis=2)
+    return summed
+
+
+def _growth(current: np.ndarray, previous: np.ndarray) -> np.ndarray:
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(previous > 0, np.round((current / previous - 1) * 100, 2), np.nan)
+
+
+class MRScreener(object):
+    """
+    Dense (month x code) matrices of MRPool.report_df, with every month from the first to the last one, and the
+    metrics of all companies computed on them at once. The metrics are cached, so a query only picks the rows of a
+    month. Build a new screener when report_df changes (MRPool does it by itself).
+    """
+
+    def __init__(self, report_df: pd.DataFrame):
+        # Factorized first, so only the unique values are converted.
+        y_and_m_positions, y_and_m_uniques = pd.factorize(report_df['y_and_m'])
+        y_and_m_uniques = np.array([int(value) for value in y_and_m_uniques])
+        first_y_and_m, last_y_and_m = int(y_and_m_uniques.min()), int(y_and_m_uniques.max())
+        months = [year * 100 + month for year, month in DateTool.month_range(
+            first_y_and_m // 100, first_y_and_m % 100, last_y_and_m // 100, last_y_and_m % 100)]
+        self.months = pd.Index([str(month) for month in months], name='y_and_m')
+        month_positions = np.searchsorted(np.array(months), y_and_m_uniques)[y_and_m_positions]
+
+        code_positions, codes = pd.factorize(report_df['code'], sort=True)
+        self.codes = pd.Index([str(code) for code in codes], name='code')
+
+        self.matrices: Dict[str, np.ndarray] = {}
+        for item in MATRIX_ITEMS:
+            matrix = np.full((len(months), len(codes)), np.nan)
+            matrix[month_positions, code_positions] = report_df[item].to_numpy(dtype=np.float64)
+            self.matrices[item] = matrix
+
+        # The industry of each code in its latest month, the later rows overwrite the earlier ones.
+        order = np.argsort(month_positions, kind='stable')
+        latest_positions = np.empty(len(codes), dtype=np.intp)
+        latest_positions[code_positions[order]] = order
+        self.industries = pd.Series(report_df['industry'].to_numpy()[latest_positions].astype(str), index=self.codes)
+        self.__metrics: Dict[tuple, np.ndarray] = {}
+
+    def __frame(self, matrix: np.ndarray) -> pd.DataFrame:
+        return pd.DataFrame(matrix, index=self.months, columns=self.codes)
+
+    def __cached(self, key: tuple, compute) -> np.ndarray:
+        if key not in self.__metrics:
+            self.__metrics[key] = compute()
+        return self.__metrics[key]
+
+    def matrix(self, item: str) -> pd.DataFrame:
+        return self.__frame(self.matrices[item])
+
+    def __yoy(self, window: int) -> np.ndarray:
+        def compute():
+            summed = _rolling_sum(self.matrices['operating_revenue'], window)
+            return _growth(summed, _shift(summed, 12))
+        return self.__cached(('yoy', window), compute)
+
+    def __mom(self, window: int) -> np.ndarray:
+        def compute():
+            summed = _rolling_sum(self.matrices['operating_revenue'], window)
+            return _growth(summed, _shift(summed, window))
+        return self.__cached(('mom', window), compute)
+
+    def yoy(self, window: int = 1) -> pd.DataFrame:
+        # The growth (%) of the revenue of the last window months over the same months of last year.
+        return self.__frame(self.__yoy(window))
+
+    def mom(self, window: int = 1) -> pd.DataFrame:
+        # The growth (%) of the revenue of the last window months over the window months before them.
+        return self.__frame(self.__mom(window))
+
+    def acceleration(self, short_window: int = 3, long_window: int = 12) -> pd.DataFrame:
+        # How much faster the revenue grows lately: the short_window-month YoY minus the long_window-month YoY.
+        return self.__frame(self.__cached(('acceleration', short_window, long_window),
+                                          lambda: self.__yoy(short_window) - self.__yoy(long_window)))
+
+    def streak(self, item: str = 'or_vs_py', threshold: float = 0.0) -> pd.DataFrame:
+        # The number of months in a row, up to each month, the item has been above threshold.
+        def compute():
+            with np.errstate(invalid='ignore'):
+                above = self.matrices[item] > threshold
+            positions = np.arange(above.shape[0])[:, np.newaxis]
+            last_below = np.maximum.accumulate(np.where(above, -1, positions), axis=0)
+            return (positions - last_below).astype(np.float64)
+        return self.__frame(self.__cached(('streak', item, threshold), compute))
+
+    def __month_position(self, month: Optional[str]) -> int:
+        return len(self.months) - 1 if month is None else self.months.get_loc(str(month))
+
+    def top(self, metric: pd.DataFrame, n: int = 50, month: Optional[str] = None, ascending=False,
+            industries: Optional[Iterable[str]] = None, per_industry=False) -> pd.DataFrame:
+        """
+        The n companies with the highest (lowest if ascending) values of a metric frame of this screener in a month,
+        the last month by default. With per_industry, the top n of every industry.
+        """
+        values = metric.iloc[self.__month_position(month)]
+        screened_df = pd.DataFrame({'industry': self.industries.to_numpy(), 'value': values.to_numpy()},
+                                   index=self.codes).dropna(subset=['value'])
+        if industries is not None:
+            screened_df = screened_df[screened_df['industry'].isin(list(industries))]
+
+        screened_df = screened_df.sort_values(by='value', ascending=ascending, kind='stable')
+        if per_industry:
+            return screened_df.groupby('industry', sort=True).head(n)
+        return screened_df.head(n)
+
+    def where(self, metric: pd.DataFrame, above: Optional[float] = None, below: Optional[float] = None,
+              month: Optional[str] = None) -> pd.DataFrame:
+        # The companies whose value of a metric frame is within (above, below) in a month, the last month by default.
+        values = metric.iloc[self.__month_position(month)].to_numpy()
+        mask = ~np.isnan(values)
+        if above is not None:
+            mask &= values > above
+        if below is not None:
+            mask &= values < below
+        return pd.DataFrame({'industry': self.industries.to_numpy()[mask], 'value': values[mask]},
+                            index=self.codes[mask])
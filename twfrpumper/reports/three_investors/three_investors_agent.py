@@ -0,0 +1,153 @@
+from datetime import date, timedelta
+from typing import Iterable, Iterator, Optional, Tuple
+import json
+import logging
+
+import pandas as pd
+
+from twfrpumper.toolbox.fetch_engine import FetchEngine, FetchResult
+from twfrpumper.toolbox.http_transport import HttpTransport, TransportError
+from twfrpumper.toolbox.cache_store import CacheStore, FileCacheStore
+
+# The fields of T86 by their names, the names changed in 2017-12-18 when the foreign dealers were split out.
+FIELD_MAPPING = {
+    '證券代號': 'code',
+    '證券名稱': 'name',
+    '外陸資買進股數(不含外資自營商)': 'foreign_buy',
+    '外陸資賣出股數(不含外資自營商)': 'foreign_sell',
+    '外陸資買賣超股數(不含外資自營商)': 'foreign_net',
+    '外資買進股數': 'foreign_buy',
+    '外資賣出股數': 'foreign_sell',
+    '外資買賣超股數': 'foreign_net',
+    '外資自營商買賣超股數': 'foreign_dealer_net',
+    '投信買進股數': 'trust_buy',
+    '投信賣出股數': 'trust_sell',
+    '投信買賣超股數': 'trust_net',
+    '自營商買賣超股數': 'dealer_net',
+    '三大法人買賣超股數': 'total_net',
+}
+NUMERIC_COLUMNS = ('foreign_buy', 'foreign_sell', 'foreign_net', 'foreign_dealer_net', 'trust_buy', 'trust_sell',
+                   'trust_net', 'dealer_net', 'total_net')
+COLUMNS = ('code', 'name') + NUMERIC_COLUMNS
+
+
+class ThreeInvestorsReport(object):
+    # The daily trading of the three institutional investors (三大法人) of every stock.
+    def __init__(self, trade_date: date, report_df: pd.DataFrame):
+        self.trade_date = trade_date
+        self.str_date = trade_date.strftime('%Y%m%d')
+        self.report_df = report_df.assign(date=self.str_date)
+
+    def __hash__(self):
+        return hash(self.str_date)
+
+    def __eq__(self, other):
+        return self.str_date == getattr(other, 'str_date', None)
+
+
+class ThreeInvestorsAgent(object):
+    BASE_URL = 'https://www.twse.com.tw'
+    REPORT_PATH = '/rwd/zh/fund/T86'
+
+    def __init__(self, delay_initial=1, delay_max=3, file_folder="./tmp/three_investors",
+                 transport: Optional[HttpTransport] = None, base_url=None, cache_store: Optional[CacheStore] = None,
+                 max_workers=4):
+        self.delay_initial = delay_initial
+        self.delay_max = delay_max
+        self.file_folder = file_folder
+        # One json file per day
+        self.cache_store = cache_store if cache_store else FileCacheStore(file_folder)
+        if transport is None:
+            # The same average pace as a random delay between delay_initial and delay_max seconds
+            max_rps = 2 / (delay_initial + delay_max) if delay_initial + delay_max > 0 else 0
+            transport = HttpTransport(max_rps=max_rps, pool_size=max_workers)
+        self.transport = transport
+        self.engine = FetchEngine(max_workers=max_workers)
+        self.base_url = base_url if base_url else self.BASE_URL
+
+    @staticmethod
+    def report_key(trade_date: date) -> str:
+        return f'three_investors_{trade_date.strftime("%Y%m%d")}.json'
+
+    @staticmethod
+    def is_json(resp) -> bool:
+        # TWSE answers the blocked requests with a html page.
+        try:
+            json.loads(resp.text)
+            return True
+        except ValueError:
+            return False
+
+    def get_report(self, year: int, month: int, day: int) -> Optional[ThreeInvestorsReport]:
+        # None if there is no trading on the day.
+        trade_date = date(year, month, day)
+        report_key = self.report_key(trade_date)
+        cached_content = self.cache_store.get(report_key)
+        if cached_content is not None:
+            content = json.loads(cached_content.decode('utf-8'))
+        else:
+            try:
+                resp = self.transport.get(
+                    f'{self.base_url}{self.REPORT_PATH}',
+                    params={
+                        'date': trade_date.strftime('%Y%m%d'),
+                        'selectType': 'ALLBUT0999',
+                        'response': 'json'
+                    },
+                    encoding='utf-8',
+                    validator=self.is_json
+                )
+            except TransportError as e:
+                logging.warning(f"Can't get: {trade_date} three investors report, {e}")
+                return None
+
+            content = json.loads(resp.text)
+            # The data of a day is final on the next day, the holidays without data are cached too.
+            if trade_date < date.today():
+                self.cache_store.put(report_key, resp.text.encode('utf-8'))
+
+        if content.get('stat') != 'OK' or not content.get('data'):
+            logging.info(f'No three investors report on {trade_date}: {content.get("stat")}')
+            return None
+
+        return ThreeInvestorsReport(trade_date, self.to_frame(content['fields'], content['data']))
+
+    @staticmethod
+    def to_frame(fields, data) -> pd.DataFrame:
+        positions = {}
+        for position, field in enumerate(fields):
+            column = FIELD_MAPPING.get(field.strip())
+            if column and column not in positions:
+                positions[column] = position
+
+        columns = {}
+        for column in COLUMNS:
+            position = positions.get(column)
+            values = [row[position] for row in data] if position is not None else [None] * len(data)
+            if column in NUMERIC_COLUMNS:
+                columns[column] = pd.to_numeric(pd.Series(values, dtype=object).str.replace(',', '', regex=False),
+                                                errors='coerce').astype('float64')
+            else:
+                columns[column] = pd.Series(values, dtype=object).str.strip()
+        return pd.DataFrame(columns)
+
+    @staticmethod
+    def date_range(start_date: date, end_date: date) -> Iterator[date]:
+        # The weekdays, the holidays are found by the empty reports.
+        trade_date = start_date
+        while trade_date <= end_date:
+            if trade_date.weekday() < 5:
+                yield trade_date
+            trade_date += timedelta(days=1)
+
+    def iter_reports(self, dates: Iterable[date]) -> Iterator[FetchResult]:
+        # Results are yielded as soon as they are finished, the units are (year, month, day).
+        units: Iterable[Tuple[int, int, int]] = ((trade_date.year, trade_date.month, trade_date.day)
+                                                 for trade_date in dates)
+        return self.engine.run(self.get_report, units)
+
+
+if __name__ == "__main__":
+    ti_agent = ThreeInvestorsAgent()
+    ti_report = ti_agent.get_report(2023, 6, 1)
+    print(ti_report.report_df.head())
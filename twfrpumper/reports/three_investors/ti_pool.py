@@ -0,0 +1,149 @@
+from datetime import date, timedelta
+from os import path
+from typing import Callable, Iterable, List, Optional
+import logging
+
+import pandas as pd
+
+from twfrpumper.reports.three_investors.three_investors_agent import ThreeInvestorsAgent, ThreeInvestorsReport
+from twfrpumper.toolbox.date_tool import DateTool
+from twfrpumper.toolbox.df_tool import concat_keep_categories
+from twfrpumper.toolbox.parquet_tool import load_partitioned, write_partitions
+
+CATEGORICAL_COLUMNS = ('code', 'name')
+# Hive-style partitions by the month of the trading day: <folder>/p_month=<yyyymm>/*.parquet
+PARTITION_COLUMNS = ['p_month']
+INVESTOR_COLUMNS = {
+    'foreign': 'foreign_net',
+    'foreign_dealer': 'foreign_dealer_net',
+    'trust': 'trust_net',
+    'dealer': 'dealer_net',
+    'total': 'total_net',
+}
+
+
+def _month_bounds(start_date: date, end_date: date):
+    # (first day, last day) of every month in the range, cut by the range.
+    for year, month in DateTool.month_range(start_date.year, start_date.month, end_date.year, end_date.month):
+        next_year, next_month = DateTool.to_next_year_month(year, month)
+        yield max(start_date, date(year, month, 1)), min(end_date, date(next_year, next_month, 1) - timedelta(days=1))
+
+
+def build_filters(codes: Optional[Iterable[str]] = None, start_date: Optional[date] = None,
+                  end_date: Optional[date] = None) -> Optional[list]:
+    # The months prune the partitions, the dates and the codes skip row groups by their statistics.
+    filters = []
+    if start_date is not None and end_date is not None:
+        filters.append(('p_month', 'in', [first_day.year * 100 + first_day.month
+                                          for first_day, _ in _month_bounds(start_date, end_date)]))
+    if start_date is not None:
+        filters.append(('date', '>=', start_date.strftime('%Y%m%d')))
+    if end_date is not None:
+        filters.append(('date', '<=', end_date.strftime('%Y%m%d')))
+    if codes is not None:
+        filters.append(('code', 'in', [str(code) for code in codes]))
+    return filters or None
+
+
+def build_report_df(reports: Iterable[ThreeInvestorsReport], report_df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+    # One concat, the days already in report_df are replaced and the rows are ordered by date and code.
+    reports = sorted(reports, key=lambda report: report.str_date)
+    frames = [report.report_df for report in reports]
+    if report_df is not None:
+        frames.insert(0, report_df[~report_df['date'].isin({report.str_date for report in reports})])
+    return concat_keep_categories(frames, CATEGORICAL_COLUMNS).sort_values(
+        by=['date', 'code'], kind='stable', ignore_index=True)
+
+
+def save_frame(report_df: pd.DataFrame, folder: str):
+    # The stored days of the same months are merged in, since a partition is rewritten as a whole.
+    saved_df = report_df
+    months = [int(month) for month in report_df['date'].str[:6].unique()
+              if path.isdir(path.join(folder, f'p_month={month}'))]
+    if months:
+        stored_df = load_partitioned(folder, filters=[('p_month', 'in', months)], partition_columns=PARTITION_COLUMNS)
+        if not stored_df.empty:
+            stored_df = stored_df[~stored_df['date'].isin(set(report_df['date']))]
+            saved_df = concat_keep_categories([stored_df, report_df], CATEGORICAL_COLUMNS)
+    write_partitions(saved_df, folder, {'p_month': saved_df['date'].str[:6]}, sort_by=['date', 'code'])
+
+
+class TIPool(object):
+    def __init__(self, delay_initial=1, delay_max=3, max_workers=4, agent: Optional[ThreeInvestorsAgent] = None):
+        self.__agent = agent if agent else ThreeInvestorsAgent(delay_initial=delay_initial, delay_max=delay_max,
+                                                               max_workers=max_workers)
+        self.reports = set()
+        # The reports already in report_df
+        self.__organized_reports = set()
+        self.report_df = None
+
+    def add_report(self, report: ThreeInvestorsReport):
+        if report:
+            self.reports.add(report)
+
+    def __fetch_range(self, start_date: date, end_date: date,
+                      callback: Optional[Callable[[ThreeInvestorsReport], None]] = None) -> List[ThreeInvestorsReport]:
+        fetched = []
+        for fetch_result in self.__agent.iter_reports(self.__agent.date_range(start_date, end_date)):
+            report = fetch_result.result
+            if report:
+                fetched.append(report)
+                if callback:
+                    callback(report)
+        return sorted(fetched, key=lambda report: report.str_date)
+
+    def add_range_reports(self, start_date: date, end_date: date,
+                          callback: Optional[Callable[[ThreeInvestorsReport], None]] = None) -> List[ThreeInvestorsReport]:
+        # The days are fetched concurrently, the returned list is in the order of the days.
+        added = self.__fetch_range(start_date, end_date, callback)
+        for report in added:
+            self.add_report(report)
+        return added
+
+    def organize_reports(self):
+        # Only the reports added since the last call are built.
+        new_reports = [report for report in self.reports if report not in self.__organized_reports]
+        if not new_reports:
+            return None
+        self.report_df = build_report_df(new_reports, self.report_df)
+        self.__organized_reports.update(new_reports)
+
+    def save_as_parquet(self, folder: str):
+        save_frame(self.report_df, folder)
+
+    def ingest(self, folder: str, start_date: date, end_date: date):
+        # Fetches a long range month by month and stores each month before the next one. Only one month is kept in
+        # memory and the pool itself stays untouched; an interrupted ingest keeps the finished months.
+        for first_day, last_day in _month_bounds(start_date, end_date):
+            reports = self.__fetch_range(first_day, last_day)
+            if reports:
+                save_frame(build_report_df(reports), folder)
+            logging.info(f'Three investors reports stored: {first_day} - {last_day}, {len(reports)} days')
+
+    def load_parquet(self, folder: str, codes: Optional[Iterable[str]] = None, start_date: Optional[date] = None,
+                     end_date: Optional[date] = None, columns: Optional[List[str]] = None):
+        if not path.isdir(folder):
+            logging.error(f'{folder} is not exist or not a folder.')
+            return
+        self.report_df = self.read_parquet(folder, codes, start_date, end_date, columns)
+
+    @staticmethod
+    def read_parquet(folder: str, codes: Optional[Iterable[str]] = None, start_date: Optional[date] = None,
+                     end_date: Optional[date] = None, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        # Only the partitions, the row groups and the columns needed are read.
+        return load_partitioned(folder, columns, build_filters(codes, start_date, end_date),
+                                partition_columns=PARTITION_COLUMNS)
+
+    @staticmethod
+    def net_buys(folder: str, codes: Iterable[str], start_date: date, end_date: date,
+                 investor: str = 'foreign') -> pd.DataFrame:
+        # (date x code) net buys in shares of an investor: foreign, foreign_dealer, trust, dealer or total.
+        column = INVESTOR_COLUMNS[investor]
+        net_df = TIPool.read_parquet(folder, codes, start_date, end_date, columns=['date', 'code', column])
+        return net_df.pivot_table(values=column, index='date', columns='code', aggfunc='sum', observed=True)
+
+
+if __name__ == "__main__":
+    ti_pool = TIPool()
+    ti_pool.ingest('./tmp/three_investors_store', date(2023, 1, 1), date(2023, 3, 31))
+    print(TIPool.net_buys('./tmp/three_investors_store', ['2330', '2317'], date(2023, 1, 1), date(2023, 3, 31)))
@@ -0,0 +1,122 @@
+import tempfile
+import time
+import unittest
+
+from benchmarks.stand_in_server import StandInServer
+from benchmarks.synthetic import ixbrl_report
+from twfrpumper.reports.financial_reports.financial_report_agent import FinancialReportAgent
+from twfrpumper.reports.financial_reports.negative_report_cache import MissingReason
+from twfrpumper.toolbox.fetch_engine import HostRateLimiter
+from twfrpumper.toolbox.http_transport import HttpTransport
+
+UNITS = [('1101', 2022, 1, 'C'), ('1102', 2022, 1, 'C'), ('1103', 2022, 2, 'C')]
+
+
+class IterCachedReportsTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory(prefix='twfr-test-')
+        self.agent = self.new_agent()
+        for stock_id, year, season, report_type in UNITS:
+            self.agent.cache_store.put(self.agent.report_key(stock_id, year, season, report_type),
+                                       ixbrl_report(stock_id, year, season).encode('big5'))
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def new_agent(self) -> FinancialReportAgent:
+        return FinancialReportAgent(file_folder=self.folder.name, lean=True, negative_cache=False, apply_units=True)
+
+    @staticmethod
+    def values(report) -> dict:
+        return {sheet.ID: (sheet.dollar_unit, sheet.dict_format)
+                for sheet in (report.balance_sheet, report.ci_sheet, report.cash_flows)}
+
+    def test_workers_apply_the_units_of_the_agent(self):
+        pooled = dict(self.agent.iter_cached_reports(UNITS, processes=2, chunksize=1))
+        for unit in UNITS:
+            in_process = self.new_agent().get_report(*unit)
+            self.assertEqual(self.values(pooled[unit]), self.values(in_process))
+            self.assertEqual(pooled[unit].ci_sheet.dollar_unit, 1)
+
+    def test_workers_keep_the_parsed_entries_of_the_agent(self):
+        list(self.agent.iter_cached_reports(UNITS, processes=2, chunksize=1))
+        for unit in UNITS:
+            self.assertTrue(self.new_agent().parsed_cache.get(*unit).units_applied)
+
+
+class GetCachedReportTest(unittest.TestCase):
+    UNIT = ('1101', 2022, 1, 'C')
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory(prefix='twfr-test-')
+        self.requests = []
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def new_agent(self, **kwargs) -> FinancialReportAgent:
+        # Every request is recorded and fails at once.
+        transport = HttpTransport(max_rps=0, max_retries=0, rate_limiter=HostRateLimiter())
+        transport.request = lambda method, url, **_: self.requests.append(url) or 1 / 0
+        return FinancialReportAgent(file_folder=self.folder.name, negative_cache=False, transport=transport,
+                                    **kwargs)
+
+    def cache_parsed_entry_only(self, **kwargs):
+        agent = self.new_agent(**kwargs)
+        agent.cache_store.put(agent.report_key(*self.UNIT), ixbrl_report(*self.UNIT[:3]).encode('big5'))
+        self.assertIsNotNone(agent.get_report(*self.UNIT))
+        agent.cache_store.delete(agent.report_key(*self.UNIT))
+
+    def test_other_items_without_the_page(self):
+        self.cache_parsed_entry_only(items=['1XXX'])
+        self.assertIsNone(self.new_agent(items=['1XXX', '2XXX']).get_cached_report(*self.UNIT))
+        self.assertEqual(self.requests, [])
+
+    def test_other_units_without_the_page(self):
+        self.cache_parsed_entry_only()
+        self.assertIsNone(self.new_agent(apply_units=True).get_cached_report(*self.UNIT))
+        self.assertEqual(self.requests, [])
+
+    def test_parsed_entry_serving_the_request(self):
+        self.cache_parsed_entry_only(items=['1XXX', '2XXX'])
+        report = self.new_agent(items=['1XXX']).get_cached_report(*self.UNIT)
+        self.assertEqual(list(report.balance_sheet.dict_format), ['1XXX'])
+        self.assertEqual(self.requests, [])
+
+
+class NegativeCacheTest(unittest.TestCase):
+    UNIT = ('1101', 2022, 1, 'C')
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory(prefix='twfr-test-')
+        self.server = StandInServer(companies=3, note_tables=0).start()
+        transport = HttpTransport(max_rps=0, max_retries=0, rate_limiter=HostRateLimiter())
+        self.agent = FinancialReportAgent(file_folder=self.folder.name, parsed_cache=False, transport=transport,
+                                          base_url=self.server.url)
+
+    def tearDown(self):
+        self.agent.transport.close()
+        self.server.stop()
+        self.folder.cleanup()
+
+    def test_no_data_page_is_recorded(self):
+        self.server.inject('t164sb01', 'no_data')
+        self.assertIsNone(self.agent.get_report(*self.UNIT))
+        self.assertIs(self.agent.negative_cache.get(*self.UNIT).reason, MissingReason.NO_REPORT)
+        self.assertIsNone(self.agent.get_report(*self.UNIT))
+        self.assertEqual(self.server.hits['t164sb01'], 1)
+
+    def test_error_status_is_not_recorded(self):
+        self.server.inject('t164sb01', '404')
+        self.assertIsNone(self.agent.get_report(*self.UNIT))
+        self.assertIsNone(self.agent.negative_cache.get(*self.UNIT))
+        self.assertIsNotNone(self.agent.get_report(*self.UNIT))
+        self.assertEqual(self.server.hits['t164sb01'], 2)
+
+    def test_unrecognized_page_expires_soon(self):
+        entry = self.agent.negative_cache.record(*self.UNIT, MissingReason.UNRECOGNIZED_PAGE)
+        self.assertLessEqual(entry.expires_at, time.time() + self.agent.negative_cache.transient_ttl)
+
+
+if __name__ == '__main__':
+    unittest.main()
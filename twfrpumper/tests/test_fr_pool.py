@@ -0,0 +1,39 @@
+import tempfile
+import unittest
+
+from benchmarks.synthetic import ixbrl_report
+from twfrpumper.reports.financial_reports.financial_report_agent import FinancialReportAgent
+from twfrpumper.reports.financial_reports.fr_pool import FRPool
+
+UNITS = [('1101', 2022, 1, 'C'), ('1101', 2022, 2, 'C')]
+
+
+class FRPoolItemsTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory(prefix='twfr-test-')
+        self.agent = FinancialReportAgent(file_folder=self.folder.name, lean=True, negative_cache=False)
+        for stock_id, year, season, report_type in UNITS:
+            self.agent.cache_store.put(self.agent.report_key(stock_id, year, season, report_type),
+                                       ixbrl_report(stock_id, year, season).encode('big5'))
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_given_agent_is_left_as_it_is(self):
+        pool = FRPool(agent=self.agent, items=['1XXX'])
+        self.assertIsNone(self.agent.items)
+        reports = pool.add_cached_reports(['1101'], 'C', 2022, 1, 2022, 2, processes=1)
+        self.assertEqual(len(reports), 2)
+        for report in reports:
+            self.assertEqual(list(report.balance_sheet.dict_format), ['1XXX'])
+
+    def test_items_of_the_pool_over_the_ones_of_the_agent(self):
+        self.agent.items = frozenset(['2XXX'])
+        pool = FRPool(agent=self.agent, items=['1XXX'])
+        reports = pool.add_cached_reports(['1101'], 'C', 2022, 1, 2022, 1, processes=1)
+        self.assertEqual(list(reports[0].balance_sheet.dict_format), ['1XXX'])
+        self.assertEqual(self.agent.items, frozenset(['2XXX']))
+
+
+if __name__ == '__main__':
+    unittest.main()
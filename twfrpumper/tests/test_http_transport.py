@@ -0,0 +1,95 @@
+import threading
+import unittest
+
+from benchmarks.stand_in_server import StandInServer
+from twfrpumper.toolbox.fetch_engine import FetchEngine, HostRateLimiter
+from twfrpumper.toolbox.http_transport import HttpTransport, TransportError
+
+
+class HttpTransportTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer(companies=3, note_tables=0, stall=1.0).start()
+        self.url = f'{self.server.url}/server-java/t164sb01?step=1&CO_ID=1101&SYEAR=2022&SSEASON=1&REPORT_ID=C'
+        # No rate limit, short timeouts and backoffs, and a limiter of its own
+        self.transport = HttpTransport(max_rps=0, timeout=(1.0, 0.3), max_retries=2, backoff_base=0.01,
+                                       rate_limiter=HostRateLimiter())
+
+    def tearDown(self):
+        self.transport.close()
+        self.server.stop()
+
+    def assert_report(self, resp):
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('</html>', resp.text)
+
+    def test_retries_server_errors(self):
+        self.server.inject('t164sb01', '503', '429')
+        self.assert_report(self.transport.get(self.url, encoding='big5'))
+        self.assertEqual(self.server.hits['t164sb01'], 3)
+        self.assertEqual(self.transport.stats.retries, 2)
+        self.assertEqual(self.transport.stats.failures, 0)
+
+    def test_retries_read_timeouts(self):
+        self.server.inject('t164sb01', 'stall')
+        self.assert_report(self.transport.get(self.url, encoding='big5'))
+        self.assertEqual(self.transport.stats.retries, 1)
+
+    def test_retries_truncated_bodies(self):
+        self.server.inject('t164sb01', 'truncate')
+        self.assert_report(self.transport.get(self.url, encoding='big5'))
+        self.assertEqual(self.transport.stats.retries, 1)
+
+    def test_retries_throttling_pages(self):
+        self.server.inject('t164sb01', 'throttle')
+        self.assert_report(self.transport.get(self.url, encoding='big5'))
+        self.assertEqual(self.transport.stats.retries, 1)
+
+    def test_retries_invalid_bodies(self):
+        self.server.inject('t164sb01', 'truncate')
+        calls = []
+
+        def validator(resp):
+            calls.append(resp)
+            return len(calls) > 1
+
+        self.assert_report(self.transport.get(self.url, encoding='big5', validator=validator))
+        # The truncated body is retried before the validator sees it, then the validator asks for one more.
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(self.transport.stats.retries, 2)
+
+    def test_gives_up_after_max_retries(self):
+        self.server.inject('t164sb01', '503', '503', '503')
+        with self.assertRaises(TransportError):
+            self.transport.get(self.url)
+        self.assertEqual(self.server.hits['t164sb01'], 3)
+        self.assertEqual(self.transport.stats.failures, 1)
+
+    def test_sessions_are_reused_across_runs(self):
+        engine = FetchEngine(max_workers=2)
+        threads = set()
+
+        def fetch(idx):
+            threads.add(threading.current_thread())
+            return self.transport.get(self.url).status_code
+
+        try:
+            for _ in range(3):
+                results = list(engine.run(fetch, [(idx,) for idx in range(4)]))
+                self.assertEqual([result.result for result in results], [200] * 4)
+        finally:
+            engine.close()
+        self.assertLessEqual(len(threads), 2)
+        self.assertLessEqual(self.transport.session_count, 2)
+
+    def test_sessions_of_finished_threads_are_closed(self):
+        for _ in range(3):
+            thread = threading.Thread(target=lambda: self.transport.get(self.url))
+            thread.start()
+            thread.join()
+        self.transport.get(self.url)
+        # Only the session of this thread is left.
+        self.assertEqual(self.transport.session_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import tempfile
+import unittest
+from datetime import date
+from os import makedirs, path
+
+import pandas as pd
+
+from twfrpumper.reports.three_investors.three_investors_agent import NUMERIC_COLUMNS, ThreeInvestorsReport
+from twfrpumper.reports.three_investors.ti_pool import PARTITION_COLUMNS, build_report_df, save_frame
+from twfrpumper.toolbox.parquet_tool import load_partitioned
+
+
+def report(trade_date: date, net: int) -> ThreeInvestorsReport:
+    return ThreeInvestorsReport(trade_date, pd.DataFrame(
+        {'code': ['1101', '2330'], 'name': ['台泥', '台積電'], **{column: [net, -net] for column in NUMERIC_COLUMNS}}))
+
+
+class SaveFrameTest(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory(prefix='twfr-test-')
+        self.dataset = path.join(self.folder.name, 'three_investors')
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def load(self) -> pd.DataFrame:
+        return load_partitioned(self.dataset, partition_columns=PARTITION_COLUMNS)
+
+    def test_pre_created_folder(self):
+        makedirs(self.dataset)
+        save_frame(build_report_df([report(date(2023, 5, 2), 1)]), self.dataset)
+        self.assertEqual(len(self.load()), 2)
+
+    def test_merges_the_stored_days_of_the_month(self):
+        save_frame(build_report_df([report(date(2023, 5, 2), 1), report(date(2023, 5, 3), 2)]), self.dataset)
+        save_frame(build_report_df([report(date(2023, 5, 3), 3), report(date(2023, 6, 1), 4)]), self.dataset)
+        loaded_df = self.load().sort_values(['date', 'code'], ignore_index=True)
+        self.assertEqual(list(loaded_df['date'].unique()), ['20230502', '20230503', '20230601'])
+        self.assertEqual(list(loaded_df['foreign_net']), [1, -1, 3, -3, 4, -4])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,385 @@
+from multiprocessing.util import Finalize
+from os.path import exists, getmtime, getsize, isdir, join
+from os import getpid, makedirs, remove, replace
+from typing import Dict, NamedTuple, Optional, Tuple, Union
+import abc
+import sqlite3
+import threading
+import time
+import zlib
+
+
+class CacheEntryInfo(NamedTuple):
+    size: int
+    created: float
+
+
+class CacheStore(abc.ABC):
+    """
+    Where the agents keep the downloaded files. The keys are the file names the agents used to write into their
+    folders.
+    """
+
+    @abc.abstractmethod
+    def exists(self, key: str) -> bool:
+        return NotImplemented
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        return NotImplemented
+
+    @abc.abstractmethod
+    def put(self, key: str, data: bytes):
+        return NotImplemented
+
+    @abc.abstractmethod
+    def delete(self, key: str):
+        return NotImplemented
+
+    @abc.abstractmethod
+    def info(self, key: str) -> Optional[CacheEntryInfo]:
+        return NotImplemented
+
+    def flush(self):
+        # Writes what the store buffered, before another process reads it.
+        pass
+
+
+class FileCacheStore(CacheStore):
+    # One plain file per key, the way the agents have always cached.
+    def __init__(self, file_folder: str):
+        self.file_folder = file_folder
+        if not (exists(self.file_folder) and isdir(self.file_folder)):
+            makedirs(self.file_folder, exist_ok=True)
+
+    def file_name(self, key: str) -> str:
+        return join(self.file_folder, key)
+
+    def exists(self, key: str) -> bool:
+        return exists(self.file_name(key))
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self.file_name(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, data: bytes):
+        file_name = self.file_name(key)
+        # Written aside first, so a crash never leaves a broken file behind.
+        tmp_file_name = f'{file_name}.tmp'
+        with open(tmp_file_name, 'wb') as f:
+            f.write(data)
+        replace(tmp_file_name, file_name)
+
+    def delete(self, key: str):
+        if self.exists(key):
+            remove(self.file_name(key))
+
+    def info(self, key: str) -> Optional[CacheEntryInfo]:
+        file_name = self.file_name(key)
+        if not exists(file_name):
+            return None
+        return CacheEntryInfo(size=getsize(file_name), created=getmtime(file_name))
+
+
+class SQLiteCacheStore(CacheStore):
+    """
+    Keeps the blobs and their manifest (size, creation and last access time) in a single SQLite file, a folder of
+    many thousands of reports becomes one file.
+
+    The blobs read lately stay uncompressed, up to hot_bytes, and are copied straight from the memory map of the
+    file: reading a hot report is one primary key lookup and a copy, about as fast as reading the plain file from the
+    page cache and without its open and stat (see the cache_store_* benchmarks). The other blobs are zlib-compressed,
+    about 8x smaller; a compressed blob which is read is decompressed once and becomes hot again. The database is
+    in WAL mode, which needs a local disk.
+
+    The manifest is also kept in memory: exists and info don't query SQLite, and the size of the store is a running
+    total. The writes are buffered and committed in batches of WRITE_FLUSH_SIZE entries (or WRITE_FLUSH_BYTES), by
+    flush() and at exit; the coldest blobs are compressed when a batch is committed. The entries other processes
+    write are read by get, but exists and info only see them after refresh().
+
+    When max_bytes is set, the least recently used entries are evicted; entries older than max_age seconds are
+    treated as missing and dropped.
+    """
+
+    ACCESS_FLUSH_SIZE = 256
+    WRITE_FLUSH_SIZE = 64
+    WRITE_FLUSH_BYTES = 16 * 2 ** 20
+    # The address space SQLite may map, not memory
+    MMAP_SIZE = 2 ** 30
+
+    def __init__(self, db_path: str, max_bytes: Optional[int] = None, max_age: Optional[float] = None,
+                 compress_level: int = 6, hot_bytes: int = 256 * 2 ** 20):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.compress_level = compress_level
+        # The bytes of the blobs kept uncompressed
+        self.hot_bytes = hot_bytes
+        self.__open()
+
+        with self.__lock:
+            connection = self.__connection
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS blobs ('
+                'key TEXT PRIMARY KEY, size INTEGER NOT NULL, raw_size INTEGER NOT NULL, created REAL NOT NULL, '
+                'accessed REAL NOT NULL, compressed INTEGER NOT NULL DEFAULT 1, data BLOB NOT NULL)'
+            )
+            # The blob goes last, the other columns of a row are read without going through its overflow pages.
+            if 'compressed' not in [row[1] for row in connection.execute('PRAGMA table_info(blobs)')]:
+                # Written when every blob was compressed
+                connection.execute('ALTER TABLE blobs ADD COLUMN compressed INTEGER NOT NULL DEFAULT 1')
+            connection.execute('CREATE INDEX IF NOT EXISTS blobs_accessed ON blobs (accessed)')
+            connection.commit()
+            self.__load_manifest()
+
+    def __open(self):
+        self.__local = threading.local()
+        self.__lock = threading.RLock()
+        self.__pid = getpid()
+        # {key: (size, raw_size, created, compressed)} of the entries, committed or not
+        self.__manifest: Dict[str, Tuple[int, int, float, bool]] = {}
+        self.__total_bytes = 0
+        self.__hot_bytes = 0
+        # {key: (data, raw_size, created, compressed)} of the uncommitted writes, None for a delete
+        self.__pending: Dict[str, Optional[Tuple[bytes, int, float, bool]]] = {}
+        self.__pending_bytes = 0
+        self.__accessed: Dict[str, float] = {}
+        self.__finalize_at_exit()
+
+    def __finalize_at_exit(self):
+        # The last batch is written at exit, the worker processes included.
+        Finalize(self, _write_batch, args=(self.db_path, self.__pending, self.__accessed), exitpriority=10)
+
+    def __getstate__(self):
+        # The connections and the buffers belong to the process, the other processes open their own.
+        self.flush()
+        return {'db_path': self.db_path, 'max_bytes': self.max_bytes, 'max_age': self.max_age,
+                'compress_level': self.compress_level, 'hot_bytes': self.hot_bytes}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__open()
+        with self.__lock:
+            self.__load_manifest()
+
+    @property
+    def __connection(self) -> sqlite3.Connection:
+        if self.__pid != getpid():
+            # A forked copy, the connection and the buffers are the parent's.
+            self.__local = threading.local()
+            self.__pid = getpid()
+            self.__pending.clear()
+            self.__pending_bytes = 0
+            self.__accessed.clear()
+            self.__finalize_at_exit()
+        connection = getattr(self.__local, 'connection', None)
+        if connection is None:
+            connection = _connect(self.db_path)
+            connection.execute(f'PRAGMA mmap_size={self.MMAP_SIZE}')
+            self.__local.connection = connection
+        return connection
+
+    def __load_manifest(self):
+        self.__manifest.clear()
+        self.__total_bytes = self.__hot_bytes = 0
+        expired = []
+        for key, size, raw_size, created, compressed in self.__connection.execute(
+                'SELECT key, size, raw_size, created, compressed FROM blobs'):
+            if self.__is_expired(created):
+                expired.append((key,))
+            else:
+                self.__remember(key, (size, raw_size, created, bool(compressed)))
+        if expired:
+            self.__connection.executemany('DELETE FROM blobs WHERE key = ?', expired)
+            self.__connection.commit()
+
+    def refresh(self):
+        # Reloads the manifest, with the entries the other processes wrote
+        with self.__lock:
+            self.__flush()
+            self.__load_manifest()
+
+    def __flush(self):
+        if self.__pending or self.__accessed:
+            _write_batch(self.__connection, self.__pending, self.__accessed)
+            self.__pending_bytes = 0
+        if self.__hot_bytes > self.hot_bytes:
+            self.__compress_cold()
+
+    def flush(self):
+        with self.__lock:
+            self.__flush()
+
+    def close(self):
+        self.flush()
+        connection = getattr(self.__local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self.__local.connection = None
+
+    def __is_expired(self, created: float) -> bool:
+        return self.max_age is not None and time.time() - created > self.max_age
+
+    def exists(self, key: str) -> bool:
+        return self.info(key) is not None
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self.__lock:
+            entry = self.__manifest.get(key)
+            if entry is not None and self.__is_expired(entry[2]):
+                self.__delete(key)
+                return None
+            if key in self.__pending:
+                pending = self.__pending[key]
+                if pending is None:
+                    return None
+                return zlib.decompress(pending[0]) if pending[3] else pending[0]
+
+        row = self.__read(key)
+        with self.__lock:
+            if row is None:
+                if entry is not None:
+                    # Deleted by another process
+                    self.__forget(key)
+                return None
+            data, size, raw_size, created, compressed = row
+            if self.__is_expired(created):
+                self.__delete(key)
+                return None
+            if entry is None:
+                # Written by another process
+                self.__remember(key, (size, raw_size, created, bool(compressed)))
+
+            # The access times are written in batches, a read costs no write.
+            self.__accessed[key] = time.time()
+            if compressed:
+                # Read again soon, most likely: it's kept uncompressed from now on.
+                data = zlib.decompress(data)
+                self.__put(key, data, created)
+            elif len(self.__accessed) >= self.ACCESS_FLUSH_SIZE:
+                self.__flush()
+        return data
+
+    def __read(self, key: str) -> Optional[tuple]:
+        # The blob is copied from the memory map straight into the bytes, a SELECT would copy it twice.
+        connection = self.__connection
+        connection.execute('BEGIN')
+        try:
+            row = connection.execute('SELECT rowid, size, raw_size, created, compressed FROM blobs WHERE key = ?',
+                                     (key,)).fetchone()
+            if row is None:
+                return None
+            with connection.blobopen('blobs', 'data', row[0], readonly=True) as blob:
+                return (blob.read(),) + row[1:]
+        finally:
+            connection.commit()
+
+    def put(self, key: str, data: bytes):
+        with self.__lock:
+            self.__put(key, data, time.time())
+            if self.max_bytes is not None and self.__total_bytes > self.max_bytes:
+                self.__evict()
+
+    def __put(self, key: str, data: bytes, created: float):
+        # Written uncompressed, the blob is compressed once it's cold.
+        self.__remember(key, (len(data), len(data), created, False))
+        self.__pending[key] = (data, len(data), created, False)
+        self.__pending_bytes += len(data)
+        if len(self.__pending) >= self.WRITE_FLUSH_SIZE or self.__pending_bytes >= self.WRITE_FLUSH_BYTES:
+            self.__flush()
+
+    def delete(self, key: str):
+        with self.__lock:
+            self.__delete(key)
+
+    def __delete(self, key: str):
+        self.__forget(key)
+        self.__pending[key] = None
+        self.__accessed.pop(key, None)
+        if len(self.__pending) >= self.WRITE_FLUSH_SIZE:
+            self.__flush()
+
+    def __remember(self, key: str, entry: Tuple[int, int, float, bool]):
+        self.__forget(key)
+        self.__manifest[key] = entry
+        self.__total_bytes += entry[0]
+        if not entry[3]:
+            self.__hot_bytes += entry[0]
+
+    def __forget(self, key: str):
+        entry = self.__manifest.pop(key, None)
+        if entry is not None:
+            self.__total_bytes -= entry[0]
+            if not entry[3]:
+                self.__hot_bytes -= entry[0]
+
+    def info(self, key: str) -> Optional[CacheEntryInfo]:
+        entry = self.__manifest.get(key)
+        if entry is None or self.__is_expired(entry[2]):
+            return None
+        return CacheEntryInfo(size=entry[1], created=entry[2])
+
+    def total_bytes(self) -> int:
+        # The stored bytes of the entries this process knows
+        return self.__total_bytes
+
+    def __compress_cold(self):
+        # The least recently read uncompressed blobs are compressed until the hot ones fit in hot_bytes.
+        connection = self.__connection
+        while self.__hot_bytes > self.hot_bytes:
+            rows = connection.execute('SELECT key, data, raw_size, created FROM blobs WHERE compressed = 0 '
+                                      'ORDER BY accessed LIMIT 16').fetchall()
+            if not rows:
+                break
+            for key, data, raw_size, created in rows:
+                compressed = zlib.compress(data, self.compress_level)
+                connection.execute('UPDATE blobs SET data = ?, size = ?, compressed = 1 WHERE key = ?',
+                                   (compressed, len(compressed), key))
+                if key in self.__manifest:
+                    self.__remember(key, (len(compressed), raw_size, created, True))
+            connection.commit()
+
+    def __evict(self):
+        # The least recently used entries go first, the batch and the access times are written before choosing.
+        self.__flush()
+        while self.__total_bytes > self.max_bytes:
+            rows = self.__connection.execute('SELECT key FROM blobs ORDER BY accessed LIMIT 64').fetchall()
+            if not rows:
+                break
+            for key, in rows:
+                self.__forget(key)
+                self.__pending[key] = None
+                if self.__total_bytes <= self.max_bytes:
+                    break
+            self.__flush()
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(db_path, timeout=30)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    return connection
+
+
+def _write_batch(connection: Union[sqlite3.Connection, str], pending: dict, accessed: dict):
+    # Commits the buffered writes, deletes and access times of a SQLiteCacheStore in one transaction.
+    if not (pending or accessed):
+        return
+    if isinstance(connection, str):
+        connection = _connect(connection)
+    connection.executemany(
+        'INSERT OR REPLACE INTO blobs (key, data, size, raw_size, created, accessed, compressed) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        [(key, entry[0], len(entry[0]), entry[1], entry[2], accessed.get(key, entry[2]), int(entry[3]))
+         for key, entry in pending.items() if entry is not None]
+    )
+    connection.executemany('DELETE FROM blobs WHERE key = ?',
+                           [(key,) for key, entry in pending.items() if entry is None])
+    connection.executemany('UPDATE blobs SET accessed = ? WHERE key = ?',
+                           [(time_accessed, key) for key, time_accessed in accessed.items()])
+    connection.commit()
+    pending.clear()
+    accessed.clear()
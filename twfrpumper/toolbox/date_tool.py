@@ -72,3 +72,34 @@ class DateTool:
             month = 1
         return year, month
 
+
+    @staticmethod
+    def season_range(start_y: int, start_s: int, end_y: int, end_s: int):
+        end_y_s = end_y * 10 + end_s
+        while start_y * 10 + start_s <= end_y_s:
+            yield start_y, start_s
+            start_s += 1
+            if start_s == 5:
+                start_s = 1
+                start_y += 1
+
+    @staticmethod
+    def season_end(year: int, season: int) -> datetime:
+        if season == 4:
+            return datetime(year=year + 1, month=1, day=1)
+        return datetime(year=year, month=season * 3 + 1, day=1)
+
+    @staticmethod
+    def season_report_deadline(year: int, season: int) -> datetime:
+        # The legal deadlines of the financial reports: Q1 5/15, Q2 8/14, Q3 11/14 and the annual report 3/31.
+        if season == 4:
+            return datetime(year=year + 1, month=3, day=31, hour=23, minute=59, second=59)
+        month, day = {1: (5, 15), 2: (8, 14), 3: (11, 14)}[season]
+        return datetime(year=year, month=month, day=day, hour=23, minute=59, second=59)
+
+    @staticmethod
+    def month_range(start_y: int, start_m: int, end_y: int, end_m: int):
+        end_y_m = end_y * 100 + end_m
+        while start_y * 100 + start_m <= end_y_m:
+            yield start_y, start_m
+            start_y, start_m = DateTool.to_next_year_month(start_y, start_m)
@@ -0,0 +1,23 @@
+from typing import Iterable, List
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+
+def concat_keep_categories(frames: List[pd.DataFrame], categorical_columns: Iterable[str]) -> pd.DataFrame:
+    # pd.concat falls back to object columns when the categories differ, so they are unified first.
+    frames = [frame for frame in frames if frame is not None]
+    if not frames:
+        return pd.DataFrame()
+
+    frames = [frame.copy(deep=False) for frame in frames]
+    for column in categorical_columns:
+        if not all(column in frame.columns for frame in frames):
+            continue
+        categories = union_categoricals(
+            [frame[column].astype('category') for frame in frames], ignore_order=True
+        ).categories
+        for frame in frames:
+            frame[column] = pd.Categorical(frame[column], categories=categories)
+
+    return pd.concat(frames, ignore_index=True)
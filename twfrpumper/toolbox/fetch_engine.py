@@ -0,0 +1,120 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, Iterator, NamedTuple, Optional, Tuple
+from urllib.parse import urlparse
+import threading
+import logging
+import time
+
+
+class TokenBucket(object):
+    def __init__(self, rate: float, capacity: float = 1.0):
+        # rate: tokens refilled per second, capacity: the largest burst allowed
+        self.rate = rate
+        self.capacity = capacity
+        self.__tokens = capacity
+        self.__updated_at = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        if self.rate <= 0:
+            return 0.0
+
+        with self.__lock:
+            now = time.monotonic()
+            self.__tokens = min(self.capacity, self.__tokens + (now - self.__updated_at) * self.rate)
+            self.__updated_at = now
+            # Reserve the tokens first, so the callers are served in the order they came.
+            self.__tokens -= tokens
+            wait = -self.__tokens / self.rate if self.__tokens < 0 else 0.0
+
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def tighten(self, rate: float, capacity: float = 1.0):
+        # Keeps the stricter of the rates (a rate <= 0 is no limit) and the smaller of the capacities.
+        with self.__lock:
+            now = time.monotonic()
+            if self.rate > 0:
+                self.__tokens = min(self.capacity, self.__tokens + (now - self.__updated_at) * self.rate)
+            self.__updated_at = now
+            if rate > 0 and (self.rate <= 0 or rate < self.rate):
+                if self.rate <= 0:
+                    # The tokens of an unlimited bucket were never counted.
+                    self.__tokens = capacity
+                self.rate = rate
+            self.capacity = min(self.capacity, capacity)
+            self.__tokens = min(self.__tokens, self.capacity)
+
+
+class HostRateLimiter(object):
+    """
+    The token buckets of the hosts. The agents of a host share its bucket, whatever max_rps each was given: a bucket
+    keeps the strictest rate (and the smallest burst) asked for so far, a looser rate never relaxes it.
+    """
+
+    def __init__(self):
+        self.__buckets: Dict[str, TokenBucket] = {}
+        self.__lock = threading.Lock()
+
+    def bucket(self, host: str, rate: float, capacity: float = 1.0) -> TokenBucket:
+        with self.__lock:
+            bucket = self.__buckets.get(host)
+            if bucket is None:
+                bucket = self.__buckets[host] = TokenBucket(rate, capacity)
+            elif (rate > 0 and (bucket.rate <= 0 or rate < bucket.rate)) or capacity < bucket.capacity:
+                bucket.tighten(rate, capacity)
+            return bucket
+
+    def acquire(self, url: str, rate: float, capacity: float = 1.0) -> float:
+        return self.bucket(urlparse(url).netloc, rate, capacity).acquire()
+
+
+# Shared by all agents in the process, so the politeness budget of a host is never exceeded.
+HOST_RATE_LIMITER = HostRateLimiter()
+
+
+class FetchResult(NamedTuple):
+    unit: Tuple
+    result: object
+    error: Optional[BaseException]
+
+
+class FetchEngine(object):
+    """
+    Runs the units on a thread pool which lives as long as the engine, so the threads, and the keep-alive sessions
+    the transport keeps per thread, are reused from one run to the next.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max_workers
+        self.__executor: Optional[ThreadPoolExecutor] = None
+        self.__lock = threading.Lock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        with self.__lock:
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='fetch')
+            return self.__executor
+
+    def close(self):
+        with self.__lock:
+            executor, self.__executor = self.__executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def run(self, func: Callable, units: Iterable[Tuple]) -> Iterator[FetchResult]:
+        futures = {self.executor.submit(func, *unit): unit for unit in units}
+        try:
+            for future in as_completed(futures):
+                unit = futures[future]
+                try:
+                    yield FetchResult(unit, future.result(), None)
+                except Exception as e:
+                    logging.warning(f"Fetch failed: {unit}, {e!r}")
+                    yield FetchResult(unit, None, e)
+        finally:
+            # The units not started yet are dropped if the results aren't read to the end.
+            for future in futures:
+                future.cancel()
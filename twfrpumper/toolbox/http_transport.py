@@ -0,0 +1,192 @@
+from collections import deque
+from typing import Callable, Deque, List, Optional, Tuple
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from twfrpumper.toolbox.fetch_engine import HOST_RATE_LIMITER, HostRateLimiter
+from twfrpumper.toolbox.stats import NULL_STATS, Stats
+
+# The pages MOPS returns instead of the data when it is queried too often
+THROTTLE_MARKERS = (
+    'FOR SECURITY REASONS, THIS PAGE CAN NOT BE ACCESSED',
+    '查詢過於頻繁',
+)
+
+
+class TransportError(Exception):
+    pass
+
+
+class TransportStats(object):
+    def __init__(self, latency_window: int = 1000):
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.bytes_downloaded = 0
+        self.total_latency = 0.0
+        # The latencies of the latest requests, in seconds
+        self.latencies: Deque[float] = deque(maxlen=latency_window)
+        self.__lock = threading.Lock()
+
+    def record(self, latency: float, size: int = 0, retry: bool = False, failure: bool = False):
+        with self.__lock:
+            self.requests += 1
+            self.bytes_downloaded += size
+            self.total_latency += latency
+            self.latencies.append(latency)
+            if retry:
+                self.retries += 1
+            if failure:
+                self.failures += 1
+
+    @property
+    def mean_latency(self) -> float:
+        return self.total_latency / self.requests if self.requests else 0.0
+
+    def snapshot(self) -> dict:
+        with self.__lock:
+            latencies = sorted(self.latencies)
+        return {
+            'requests': self.requests,
+            'retries': self.retries,
+            'failures': self.failures,
+            'bytes_downloaded': self.bytes_downloaded,
+            'mean_latency': self.mean_latency,
+            'p95_latency': latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+        }
+
+
+class HttpTransport(object):
+    """
+    Keep-alive sessions (one per thread, closed when the thread is gone) with explicit timeouts, the per-host rate limit, and retries with
+    exponential backoff and full jitter on 5xx/429 responses, throttling pages, truncated bodies and connection
+    errors.
+    """
+
+    def __init__(self, max_rps: float = 0.5, timeout: Tuple[float, float] = (5.0, 30.0), max_retries: int = 4,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0, pool_size: int = 8,
+                 throttle_markers: Tuple[str, ...] = THROTTLE_MARKERS,
+                 rate_limiter: HostRateLimiter = HOST_RATE_LIMITER, stage_stats: Stats = NULL_STATS):
+        self.max_rps = max_rps
+        # (connect timeout, read timeout)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_size = pool_size
+        self.throttle_markers = throttle_markers
+        self.rate_limiter = rate_limiter
+        self.stats = TransportStats()
+        # The waits of the rate limit, the network time and the downloaded bytes, next to the stages of the agents
+        self.stage_stats = stage_stats
+        self.__local = threading.local()
+        # The sessions and the threads they belong to
+        self.__sessions: List[Tuple[threading.Thread, requests.Session]] = []
+        self.__lock = threading.Lock()
+
+    @property
+    def session(self) -> requests.Session:
+        session = getattr(self.__local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self.__local.session = session
+            with self.__lock:
+                # The sessions of the finished threads are closed, their connections can't be reused.
+                alive = []
+                for thread, thread_session in self.__sessions:
+                    if thread.is_alive():
+                        alive.append((thread, thread_session))
+                    else:
+                        thread_session.close()
+                alive.append((threading.current_thread(), session))
+                self.__sessions = alive
+        return session
+
+    @property
+    def session_count(self) -> int:
+        return len(self.__sessions)
+
+    def close(self):
+        with self.__lock:
+            for _, session in self.__sessions:
+                session.close()
+            self.__sessions.clear()
+        self.__local = threading.local()
+
+    def backoff(self, attempt: int, resp: Optional[requests.Response] = None) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        retry_after = resp.headers.get('Retry-After') if resp is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(float(retry_after), self.backoff_max))
+        return delay
+
+    def retry_reason(self, resp: requests.Response,
+                     validator: Optional[Callable[[requests.Response], bool]] = None) -> Optional[str]:
+        if resp.status_code >= 500 or resp.status_code == 429:
+            return f'status {resp.status_code}'
+
+        content_length = resp.headers.get('Content-Length')
+        if (content_length and content_length.isdigit() and 'Content-Encoding' not in resp.headers
+                and int(content_length) != len(resp.content)):
+            return f'truncated body ({len(resp.content)} of {content_length} bytes)'
+
+        if resp.status_code == 200:
+            text = resp.text
+            for marker in self.throttle_markers:
+                if marker in text:
+                    return 'throttled'
+            if validator and not validator(resp):
+                return 'invalid body'
+
+        return None
+
+    def request(self, method: str, url: str, encoding: Optional[str] = None,
+                validator: Optional[Callable[[requests.Response], bool]] = None, **kwargs) -> requests.Response:
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(self.max_retries + 1):
+            self.stage_stats.add_duration('http.wait', self.rate_limiter.acquire(url, self.max_rps))
+            start = time.monotonic()
+            resp = None
+            try:
+                resp = self.session.request(method, url, **kwargs)
+                if encoding:
+                    resp.encoding = encoding
+                reason = self.retry_reason(resp, validator)
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.ContentDecodingError) as e:
+                reason = repr(e)
+
+            last_attempt = attempt == self.max_retries
+            latency = time.monotonic() - start
+            size = len(resp.content) if resp is not None else 0
+            self.stats.record(latency, size=size, retry=reason is not None and not last_attempt,
+                              failure=reason is not None and last_attempt)
+            if self.stage_stats.enabled:
+                self.stage_stats.add_duration('http.network', latency)
+                self.stage_stats.incr('http.requests')
+                self.stage_stats.incr('http.bytes', size)
+                if reason is not None:
+                    self.stage_stats.incr('http.failures' if last_attempt else 'http.retries')
+            if reason is None:
+                return resp
+            if last_attempt:
+                raise TransportError(f'{method} {url} failed after {attempt + 1} attempts: {reason}')
+
+            delay = self.backoff(attempt, resp)
+            logging.warning(f'Retry {method} {url} in {delay:.1f}s: {reason}')
+            time.sleep(delay)
+            self.stage_stats.add_duration('http.backoff', delay)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
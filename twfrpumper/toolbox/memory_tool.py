@@ -0,0 +1,32 @@
+from collections.abc import Mapping
+import sys
+
+
+def deep_getsizeof(obj) -> int:
+    # Sums sys.getsizeof of the object and everything it refers to, each object is counted once.
+    seen = set()
+    stack = [obj]
+    size = 0
+    while stack:
+        current = stack.pop()
+        if id(current) in seen or isinstance(current, type):
+            continue
+        seen.add(id(current))
+        size += sys.getsizeof(current)
+
+        if isinstance(current, (str, bytes, bytearray, int, float, bool)) or current is None:
+            continue
+        if isinstance(current, Mapping):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+
+        if hasattr(current, '__dict__'):
+            stack.append(current.__dict__)
+        for cls in type(current).__mro__:
+            for slot in getattr(cls, '__slots__', ()):
+                if hasattr(current, slot):
+                    stack.append(getattr(current, slot))
+
+    return size
@@ -0,0 +1,52 @@
+from os import makedirs
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+# Hive-style partitions: <folder>/p_code=<code>/p_year=<year>/*.parquet
+# They are extra columns, so the real columns keep their own dtypes in the files.
+PARTITION_COLUMNS = ['p_code', 'p_year']
+MAX_PARTITIONS = 1 << 20
+
+
+def write_partitions(df: pd.DataFrame, folder: str, partitions: Dict[str, pd.Series],
+                     sort_by: Optional[List[str]] = None):
+    # partitions: {partition column: the value of every row}, the partitions in df replace the stored ones.
+    makedirs(folder, exist_ok=True)
+    partitioned_df = df.assign(**{column: values.astype(str).to_numpy() for column, values in partitions.items()})
+    if sort_by:
+        # Sorted rows give tight min/max statistics, so filters can skip whole row groups.
+        partitioned_df = partitioned_df.sort_values(by=sort_by, kind='stable')
+    partitioned_df.to_parquet(
+        folder,
+        engine='pyarrow',
+        index=False,
+        partition_cols=list(partitions),
+        existing_data_behavior='delete_matching',
+        # The whole market split by code and year is well over the default limit of 1024 partitions.
+        max_partitions=MAX_PARTITIONS
+    )
+
+
+def save_partitioned(df: pd.DataFrame, folder: str, codes: pd.Series, years: pd.Series,
+                     sort_by: Optional[List[str]] = None):
+    write_partitions(df, folder, {'p_code': codes, 'p_year': years}, sort_by)
+
+
+def build_filters(codes: Optional[Iterable] = None, years: Optional[Iterable[int]] = None,
+                  **column_values: Optional[Iterable]) -> Optional[list]:
+    filters = []
+    if codes is not None:
+        filters.append(('p_code', 'in', [str(code) for code in codes]))
+    if years is not None:
+        filters.append(('p_year', 'in', [str(year) for year in years]))
+    for column, values in column_values.items():
+        if values is not None:
+            filters.append((column, 'in', list(values)))
+    return filters or None
+
+
+def load_partitioned(folder: str, columns: Optional[List[str]] = None, filters: Optional[list] = None,
+                     partition_columns: Iterable[str] = PARTITION_COLUMNS) -> pd.DataFrame:
+    loaded_df = pd.read_parquet(folder, engine='pyarrow', columns=columns, filters=filters)
+    return loaded_df.drop(columns=[column for column in partition_columns if column in loaded_df.columns])
@@ -0,0 +1,149 @@
+from typing import Callable, Dict, List, NamedTuple, Optional
+import logging
+import threading
+import time
+
+
+class StageEvent(NamedTuple):
+    name: str
+    seconds: float
+
+
+class StageTotals(object):
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+
+class _Stage(object):
+    __slots__ = ('stats', 'name', 'start')
+
+    def __init__(self, stats: 'Stats', name: str):
+        self.stats = stats
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stats.add_duration(self.name, time.perf_counter() - self.start)
+
+
+class _NullStage(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return None
+
+
+_NULL_STAGE = _NullStage()
+
+
+class Stats(object):
+    """
+    The durations of the stages (e.g., http.network, fr.parse, fr_pool.metrics) and the counters (cache hits, bytes,
+    reports) of the agents and the pools sharing it. Every finished stage is also passed to the sinks.
+
+    The stages of the workers are timed on their own threads, so the totals of a stage can add up to more than the
+    wall time. A disabled Stats (NULL_STATS) records nothing and its stage() is a shared no-op.
+    """
+
+    def __init__(self, enabled: bool = True, sinks: Optional[List[Callable[[StageEvent], None]]] = None):
+        self.enabled = enabled
+        self.sinks = list(sinks) if sinks else []
+        self.__stages: Dict[str, StageTotals] = {}
+        self.__counters: Dict[str, float] = {}
+        self.__started_at = time.perf_counter()
+        self.__lock = threading.Lock()
+
+    def add_sink(self, sink: Callable[[StageEvent], None]):
+        self.sinks.append(sink)
+
+    def stage(self, name: str):
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def add_duration(self, name: str, seconds: float):
+        if not self.enabled:
+            return
+        with self.__lock:
+            totals = self.__stages.get(name)
+            if totals is None:
+                totals = self.__stages[name] = StageTotals()
+            totals.add(seconds)
+        if self.sinks:
+            event = StageEvent(name, seconds)
+            for sink in self.sinks:
+                sink(event)
+
+    def incr(self, name: str, value: float = 1):
+        if not self.enabled:
+            return
+        with self.__lock:
+            self.__counters[name] = self.__counters.get(name, 0) + value
+
+    def reset(self):
+        with self.__lock:
+            self.__stages.clear()
+            self.__counters.clear()
+            self.__started_at = time.perf_counter()
+
+    @property
+    def elapsed(self) -> float:
+        # The wall time since the Stats was created or reset
+        return time.perf_counter() - self.__started_at
+
+    def snapshot(self) -> dict:
+        elapsed = self.elapsed
+        with self.__lock:
+            stages = {name: {'count': totals.count,
+                             'total': totals.total,
+                             'mean': totals.total / totals.count,
+                             'max': totals.max} for name, totals in self.__stages.items()}
+            counters = dict(self.__counters)
+        return {
+            'elapsed': elapsed,
+            'stages': stages,
+            'counters': counters,
+            # e.g., fr.reports per second of wall time
+            'rates': {name: value / elapsed for name, value in counters.items()} if elapsed > 0 else {},
+        }
+
+    def summary(self) -> str:
+        snapshot = self.snapshot()
+        lines = [f'Elapsed: {snapshot["elapsed"]:.3f}s']
+        for name, stage in sorted(snapshot['stages'].items(), key=lambda item: -item[1]['total']):
+            lines.append(f'{name:<28} {stage["total"]:>10.3f}s {stage["count"]:>8} x {stage["mean"] * 1000:>9.2f}ms'
+                         f' (max {stage["max"] * 1000:.2f}ms)')
+        for name, value in sorted(snapshot['counters'].items()):
+            lines.append(f'{name:<28} {value:>14,.0f} ({snapshot["rates"].get(name, 0.0):.2f}/s)')
+        return '\n'.join(lines)
+
+
+# The default of the agents and the pools, timing is off.
+NULL_STATS = Stats(enabled=False)
+
+
+def logger_sink(logger: Optional[logging.Logger] = None, level: int = logging.DEBUG) -> Callable[[StageEvent], None]:
+    logger = logger if logger else logging.getLogger('twfrpumper.stats')
+
+    def sink(event: StageEvent):
+        if logger.isEnabledFor(level):
+            logger.log(level, f'{event.name}: {event.seconds * 1000:.2f}ms')
+
+    return sink
@@ -0,0 +1,71 @@
+from typing import NamedTuple, Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+class Trend(NamedTuple):
+    # One value per series (column), NaN when a series has less than two points.
+    slope: np.ndarray
+    intercept: np.ndarray
+    points: np.ndarray
+
+
+def _fit(x: np.ndarray, y: np.ndarray, axis: int) -> Trend:
+    # The closed form of the least-squares line, over the points which aren't NaN.
+    mask = ~np.isnan(y)
+    y = np.where(mask, y, 0.0)
+    x = np.where(mask, x, 0.0)
+    n = mask.sum(axis=axis)
+    sx = x.sum(axis=axis)
+    sy = y.sum(axis=axis)
+    sxx = (x * x).sum(axis=axis)
+    sxy = (x * y).sum(axis=axis)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denominator = n * sxx - sx * sx
+        slope = np.where(denominator != 0, (n * sxy - sx * sy) / denominator, np.nan)
+        intercept = np.where(n > 0, (sy - slope * sx) / n, np.nan)
+    return Trend(slope, intercept, n)
+
+
+def linear_trend(matrix: np.ndarray, x: Optional[np.ndarray] = None) -> Trend:
+    """
+    Fits a line to every column of matrix (points x series) at once, the same as np.polyfit(x, column, 1) for each
+    column without NaN. The NaN points are left out instead of spoiling the whole column. x defaults to the row
+    positions.
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    if matrix.ndim == 1:
+        matrix = matrix[:, np.newaxis]
+    if x is None:
+        x = np.arange(matrix.shape[0], dtype=np.float64)
+    return _fit(np.asarray(x, dtype=np.float64)[:, np.newaxis], matrix, axis=0)
+
+
+def rolling_linear_trend(matrix: np.ndarray, window: int, min_periods: Optional[int] = None) -> Trend:
+    """
+    Fits a line to the last window rows of every column, for every row. The result has the shape of matrix; the
+    intercepts are the values of the lines at the first row of their windows. The rows without min_periods points
+    (default: window) in their window, including the first window - 1 rows, are NaN.
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    if matrix.ndim == 1:
+        matrix = matrix[:, np.newaxis]
+    rows, columns = matrix.shape
+    min_periods = window if min_periods is None else max(min_periods, 2)
+
+    slope = np.full((rows, columns), np.nan)
+    intercept = np.full((rows, columns), np.nan)
+    points = np.zeros((rows, columns), dtype=np.int64)
+    if rows < window:
+        return Trend(slope, intercept, points)
+
+    # (windows, columns, window), a view without copying matrix
+    windows = sliding_window_view(matrix, window, axis=0)
+    trend = _fit(np.arange(window, dtype=np.float64), windows, axis=2)
+    enough = trend.points >= min_periods
+    slope[window - 1:] = np.where(enough, trend.slope, np.nan)
+    intercept[window - 1:] = np.where(enough, trend.intercept, np.nan)
+    points[window - 1:] = trend.points
+    return Trend(slope, intercept, points)